@@ -7,7 +7,12 @@ pip install -r requirements.txt
 # Collect static files
 python manage.py collectstatic --noinput
 
+# Prebuild the OpenAPI schema served at /swagger.json
+python manage.py build_openapi_schema
+
 # Run migrations (if DATABASE_URL is set)
 if [ ! -z "$DATABASE_URL" ]; then
     python manage.py migrate
+    # Keep the next months' Transaction partitions ahead of time (PostgreSQL only)
+    python manage.py create_transaction_partitions
 fi
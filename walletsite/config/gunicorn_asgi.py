@@ -0,0 +1,25 @@
+"""
+Gunicorn profile for serving config.asgi with uvicorn workers.
+
+    gunicorn -c config/gunicorn_asgi.py config.asgi:application
+
+Each worker runs an event loop, so the async endpoints under /api/async/
+can overlap many I/O-bound requests per process. Persistent database
+connections are turned off: under ASGI each request's sync work runs in its
+own thread, and connections held open per thread would otherwise pile up.
+With the PostgreSQL pool (DB_POOL=true) that is already the case, and
+the threads share the pool's connections instead.
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+worker_class = 'uvicorn.workers.UvicornWorker'
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
+max_requests = 1000
+max_requests_jitter = 100
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+accesslog = '-'
+errorlog = '-'
+raw_env = ['DB_CONN_MAX_AGE=0']
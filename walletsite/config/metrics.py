@@ -0,0 +1,226 @@
+"""
+Per-view request metrics, kept in process and served in Prometheus format.
+
+RequestMetricsMiddleware times every request and, through a database
+execute_wrapper, counts the SQL statements it runs and the time spent in
+them. The request's counters live in a ContextVar, and the wrapper is
+installed once on every connection of the thread that handles the request
+(request_started is sent there, under WSGI and under ASGI, where sync views
+run in a sync_to_async thread with its own connections), or as soon as a
+connection is opened anywhere else. Outside a request it only passes the
+query through. Observations go into fixed-bucket histograms keyed by view name and
+method; ``metrics_view`` renders them in the Prometheus text format. Each
+process keeps its own numbers, so scrape every worker (or sum them) when
+running more than one.
+
+With SERVER_TIMING_HEADER enabled, responses also carry a Server-Timing
+header (``app`` and ``db`` durations plus the query count), which browser dev
+tools display per request.
+
+Other modules add their own series with ``registry.add_collector``; the
+PostgreSQL connection pool (config/postgresql_pool) reports through it.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+UNRESOLVED_VIEW = '<unresolved>'
+
+
+class Histogram:
+    """Cumulative-bucket histogram; observe() is a bisect plus two adds under a lock."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative, running = [], 0
+        for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+            running += bucket_count
+            cumulative.append((bound, running))
+        return cumulative, total, count
+
+
+class Registry:
+    METRICS = (
+        ('wallet_http_request_duration_seconds', 'Request latency by view.', LATENCY_BUCKETS),
+        ('wallet_http_db_queries', 'SQL statements executed per request by view.', QUERY_COUNT_BUCKETS),
+        ('wallet_http_db_duration_seconds', 'Time spent in SQL per request by view.', LATENCY_BUCKETS),
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+        self._responses = {}
+        self._collectors = []
+
+    def add_collector(self, collect):
+        """Append the lines returned by collect() (no arguments) to every render."""
+        with self._lock:
+            self._collectors.append(collect)
+
+    def observe(self, view, method, status_code, duration, queries, db_duration):
+        key = (view, method)
+        series = self._series.get(key)
+        if series is None:
+            with self._lock:
+                series = self._series.setdefault(
+                    key, tuple(Histogram(buckets) for _, _, buckets in self.METRICS),
+                )
+        for histogram, value in zip(series, (duration, queries, db_duration)):
+            histogram.observe(value)
+        response_key = (view, method, str(status_code))
+        with self._lock:
+            self._responses[response_key] = self._responses.get(response_key, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+            self._responses.clear()
+
+    def render(self):
+        with self._lock:
+            series = sorted(self._series.items())
+            responses = sorted(self._responses.items())
+            collectors = list(self._collectors)
+        lines = []
+        for position, (name, help_text, _) in enumerate(self.METRICS):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for (view, method), histograms in series:
+                labels = f'view="{_escape(view)}",method="{method}"'
+                cumulative, total, count = histograms[position].snapshot()
+                for bound, bucket_count in cumulative:
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {bucket_count}')
+                lines.append(f'{name}_sum{{{labels}}} {total}')
+                lines.append(f'{name}_count{{{labels}}} {count}')
+        lines.append('# HELP wallet_http_responses_total Responses by view, method and status code.')
+        lines.append('# TYPE wallet_http_responses_total counter')
+        for (view, method, status_code), count in responses:
+            lines.append(
+                f'wallet_http_responses_total{{view="{_escape(view)}",method="{method}",status="{status_code}"}} {count}'
+            )
+        for collect in collectors:
+            lines.extend(collect())
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = Registry()
+
+
+class _QueryTimer:
+    """Statements run by one request and the time spent in them."""
+
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0.0
+
+
+_request_timer = ContextVar('request_query_timer', default=None)
+
+
+def _time_query(execute, sql, params, many, context):
+    timer = _request_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timer.duration += time.perf_counter() - started
+        timer.queries += 1
+
+
+def install_query_timer(connection):
+    """Put the request query timer on connection, once."""
+    if _time_query not in connection.execute_wrappers:
+        # First in the list: execute_wrapper() blocks pop from the end.
+        connection.execute_wrappers.insert(0, _time_query)
+
+
+def _install_on_thread_connections(**kwargs):
+    for connection in connections.all():
+        install_query_timer(connection)
+
+
+def _install_on_new_connection(sender, connection, **kwargs):
+    install_query_timer(connection)
+
+
+request_started.connect(_install_on_thread_connections, dispatch_uid='wallet_metrics_query_timer')
+connection_created.connect(_install_on_new_connection, dispatch_uid='wallet_metrics_query_timer')
+
+
+class RequestMetricsMiddleware:
+    """Record latency, query count and DB time for every request, by view."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer, started = _QueryTimer(), time.perf_counter()
+        token = _request_timer.set(timer)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_timer.reset(token)
+        return self._finish(request, response, timer, started)
+
+    async def __acall__(self, request):
+        timer, started = _QueryTimer(), time.perf_counter()
+        # sync_to_async copies the context, so sync views count into the same timer.
+        token = _request_timer.set(timer)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_timer.reset(token)
+        return self._finish(request, response, timer, started)
+
+    def _finish(self, request, response, timer, started):
+        duration = time.perf_counter() - started
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name or match.route) if match is not None else UNRESOLVED_VIEW
+        registry.observe(view, request.method, response.status_code, duration, timer.queries, timer.duration)
+        if settings.SERVER_TIMING_HEADER:
+            response['Server-Timing'] = (
+                f'app;dur={duration * 1000:.2f}, '
+                f'db;dur={timer.duration * 1000:.2f};desc="{timer.queries} queries"'
+            )
+        return response
+
+
+def metrics_view(request):
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
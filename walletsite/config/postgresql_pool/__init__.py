@@ -0,0 +1,9 @@
+"""
+PostgreSQL backend that borrows connections from a per-process pool.
+
+Select it with ENGINE 'config.postgresql_pool' (settings.py does when
+DATABASE_URL is set and DB_POOL is on) and configure the pool with
+OPTIONS['pool'] (see pool.ConnectionPool). Django closes the connection at
+the end of every request (CONN_MAX_AGE=0); here that hands it back to the
+pool, so the next request on any thread reuses it without a new handshake.
+"""
@@ -0,0 +1,90 @@
+from django.db.backends.base.base import NO_DB_ALIAS
+from django.db.backends.postgresql import base, creation
+
+from .pool import PoolTimeout, close_pools, get_pool
+
+# libpq transaction states, the same numbers in psycopg2 and psycopg 3.
+TRANSACTION_STATUS_IDLE = 0
+TRANSACTION_STATUS_INTRANS = 2
+TRANSACTION_STATUS_INERROR = 3
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    # Pooled sessions would keep the test database (or a clone's template)
+    # busy, and PostgreSQL refuses to drop or copy a database in use.
+    def _clone_test_db(self, suffix, verbosity, keepdb=False):
+        close_pools([self.connection.alias])
+        super()._clone_test_db(suffix, verbosity, keepdb)
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        close_pools([self.connection.alias])
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pool = None
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pool', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        if self.alias == NO_DB_ALIAS:
+            # Short-lived connections to the 'postgres' database (creating
+            # and dropping the test database) bypass the pool.
+            return super().get_new_connection(conn_params)
+        options = dict(self.settings_dict['OPTIONS'].get('pool') or {})
+        pre_ping = options.pop('pre_ping', True)
+        self._pool = get_pool(
+            self.alias,
+            repr(sorted(conn_params.items())),
+            connect=lambda: super(DatabaseWrapper, self).get_new_connection(conn_params),
+            close=lambda connection: connection.close(),
+            ping=self._ping if pre_ping else None,
+            reset=self._reset,
+            **options,
+        )
+        try:
+            return self._pool.getconn()
+        except PoolTimeout as exc:
+            # Surfaces as django.db.OperationalError through wrap_database_errors.
+            raise self.Database.OperationalError(str(exc)) from exc
+
+    def _close(self):
+        if self._pool is None or self.connection is None:
+            return super()._close()
+        pool, self._pool = self._pool, None
+        with self.wrap_database_errors:
+            pool.putconn(self.connection)
+
+    def _ping(self, connection):
+        if connection.closed:
+            return False
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if not connection.autocommit:
+                connection.rollback()
+        except self.Database.Error:
+            return False
+        return True
+
+    def _reset(self, connection):
+        """Leave no transaction open on a returned connection; False when it is unusable."""
+        if connection.closed:
+            return False
+        status = connection.info.transaction_status
+        if status == TRANSACTION_STATUS_IDLE:
+            return True
+        if status not in (TRANSACTION_STATUS_INTRANS, TRANSACTION_STATUS_INERROR):
+            return False
+        try:
+            connection.rollback()
+        except self.Database.Error:
+            return False
+        return True
@@ -0,0 +1,263 @@
+"""
+A thread-safe pool of DB-API connections, shared by every thread (and every
+sync_to_async worker) of a process.
+
+Connections are opened on demand up to ``max_size``; once that many are in
+use, ``getconn`` waits up to ``timeout`` seconds for one to come back and
+then raises PoolTimeout. Idle connections are reused most recently returned
+first, so a quiet period leaves the extra ones unused until they have been
+idle for ``max_idle`` seconds and are closed (the pool never drops below
+``min_size`` that way). Connections older than ``max_lifetime`` are closed
+instead of reused. With a ``ping`` callable, every checkout of an idle
+connection is checked with it first and a dead one is replaced.
+
+The pool knows nothing about the driver: the caller passes ``connect``,
+``ping``, ``reset`` (run on return; False discards the connection) and
+``close``. Pool state and counters are exported at /metrics.
+"""
+import threading
+import time
+from collections import deque
+
+from config.metrics import Histogram, registry
+
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class _Idle:
+    __slots__ = ('connection', 'created', 'returned')
+
+    def __init__(self, connection, created, returned):
+        self.connection = connection
+        self.created = created
+        self.returned = returned
+
+
+class ConnectionPool:
+    COUNTERS = {
+        'opened': 'Connections opened by the pool.',
+        'closed': 'Connections closed by the pool.',
+        'timeouts': 'Checkouts that gave up waiting for a free connection.',
+        'ping_failures': 'Idle connections that failed the pre-ping and were replaced.',
+        'discarded': 'Connections closed instead of reused: failed ping or reset, or past max_lifetime.',
+    }
+
+    def __init__(
+        self, name, connect, close, ping=None, reset=None,
+        min_size=0, max_size=10, timeout=10.0, max_idle=300.0, max_lifetime=3600.0,
+    ):
+        if max_size < 1 or not 0 <= min_size <= max_size:
+            raise ValueError('The pool needs 0 <= min_size <= max_size and max_size >= 1.')
+        self.name = name
+        self.signature = None
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self._connect, self._close, self._ping, self._reset = connect, close, ping, reset
+        self._condition = threading.Condition()
+        self._idle = deque()
+        self._created = {}
+        self._size = 0
+        self._waiting = 0
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        self.wait_seconds = Histogram(WAIT_BUCKETS)
+
+    def getconn(self):
+        """Borrow a connection; give it back with putconn()."""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        while True:
+            entry, opening = None, False
+            with self._condition:
+                stale = self._prune_locked(time.monotonic())
+                while True:
+                    if self._idle:
+                        entry = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        opening = True
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.counters['timeouts'] += 1
+                        break
+                    self._waiting += 1
+                    try:
+                        self._condition.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+            self._close_all(stale)
+
+            if opening:
+                connection = self._open()
+                break
+            if entry is None:
+                raise PoolTimeout(
+                    f'No connection in pool {self.name!r} became free within {self.timeout}s '
+                    f'({self.max_size} in use).'
+                )
+            if time.monotonic() - entry.created > self.max_lifetime:
+                self._discard(entry.connection)
+                continue
+            if self._ping is not None and not self._ping(entry.connection):
+                with self._condition:
+                    self.counters['ping_failures'] += 1
+                self._discard(entry.connection)
+                continue
+            connection = entry.connection
+            break
+        self.wait_seconds.observe(time.monotonic() - started)
+        return connection
+
+    def _open(self):
+        # The slot was reserved by the caller; give it back if connecting fails.
+        try:
+            connection = self._connect()
+        except BaseException:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._created[connection] = time.monotonic()
+            self.counters['opened'] += 1
+        return connection
+
+    def putconn(self, connection, discard=False):
+        """Return a borrowed connection; it is closed instead when it can't be reused."""
+        with self._condition:
+            created = self._created.get(connection)
+        if created is None:
+            raise ValueError(f'The connection does not belong to pool {self.name!r}.')
+        now = time.monotonic()
+        if (
+            discard or now - created > self.max_lifetime
+            or (self._reset is not None and not self._reset(connection))
+        ):
+            self._discard(connection)
+            return
+        with self._condition:
+            self._idle.append(_Idle(connection, created, now))
+            stale = self._prune_locked(now)
+            self._condition.notify()
+        self._close_all(stale)
+
+    def _prune_locked(self, now):
+        # The left end holds the connections returned longest ago.
+        stale = []
+        while len(self._idle) > self.min_size and now - self._idle[0].returned > self.max_idle:
+            stale.append(self._idle.popleft().connection)
+        return stale
+
+    def _discard(self, connection):
+        with self._condition:
+            self.counters['discarded'] += 1
+        self._close_all([connection])
+
+    def _close_all(self, connections):
+        for connection in connections:
+            try:
+                self._close(connection)
+            except Exception:
+                pass
+            with self._condition:
+                self._created.pop(connection, None)
+                self._size -= 1
+                self.counters['closed'] += 1
+                self._condition.notify()
+
+    def close(self):
+        """Close every idle connection; borrowed ones are closed when returned."""
+        with self._condition:
+            idle = [entry.connection for entry in self._idle]
+            self._idle.clear()
+            self.min_size = 0
+            self.max_idle = -1
+        self._close_all(idle)
+
+    def stats(self):
+        with self._condition:
+            idle = len(self._idle)
+            return {
+                'size': self._size,
+                'idle': idle,
+                'in_use': self._size - idle,
+                'waiting': self._waiting,
+                'max_size': self.max_size,
+                **self.counters,
+            }
+
+
+def get_pool(name, signature, **options):
+    """
+    The process-wide pool called `name`, created with `options` on first use.
+    A different `signature` (the connection parameters) replaces the old pool,
+    as when the test runner switches a database alias to the test database.
+    """
+    pool = _pools.get(name)
+    if pool is not None and pool.signature == signature:
+        return pool
+    with _pools_lock:
+        replaced = _pools.get(name)
+        if replaced is not None and replaced.signature == signature:
+            return replaced
+        pool = _pools[name] = ConnectionPool(name, **options)
+        pool.signature = signature
+    if replaced is not None:
+        replaced.close()
+    return pool
+
+
+def close_pools(names=None):
+    """Close and forget the named pools (all of them by default)."""
+    with _pools_lock:
+        closing = [_pools.pop(name) for name in list(_pools) if names is None or name in names]
+    for pool in closing:
+        pool.close()
+
+
+def _render_metrics():
+    with _pools_lock:
+        pools = list(_pools.values())
+    if not pools:
+        return []
+    lines = [
+        '# HELP wallet_db_pool_connections Open pooled database connections by state.',
+        '# TYPE wallet_db_pool_connections gauge',
+    ]
+    stats = [(pool, pool.stats()) for pool in pools]
+    for pool, values in stats:
+        for state in ('idle', 'in_use'):
+            lines.append(f'wallet_db_pool_connections{{pool="{pool.name}",state="{state}"}} {values[state]}')
+    for name, help_text, key in (
+        ('wallet_db_pool_max_connections', 'Configured pool size limit.', 'max_size'),
+        ('wallet_db_pool_waiting', 'Threads waiting for a pooled connection.', 'waiting'),
+    ):
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+        lines += [f'{name}{{pool="{pool.name}"}} {values[key]}' for pool, values in stats]
+    for counter, help_text in ConnectionPool.COUNTERS.items():
+        name = f'wallet_db_pool_{counter}_total'
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        lines += [f'{name}{{pool="{pool.name}"}} {values[counter]}' for pool, values in stats]
+    name = 'wallet_db_pool_wait_seconds'
+    lines += [f'# HELP {name} Time to check a connection out of the pool.', f'# TYPE {name} histogram']
+    for pool, _ in stats:
+        cumulative, total, count = pool.wait_seconds.snapshot()
+        for bound, bucket_count in cumulative:
+            lines.append(f'{name}_bucket{{pool="{pool.name}",le="{bound}"}} {bucket_count}')
+        lines.append(f'{name}_sum{{pool="{pool.name}"}} {total}')
+        lines.append(f'{name}_count{{pool="{pool.name}"}} {count}')
+    return lines
+
+
+registry.add_collector(_render_metrics)
@@ -0,0 +1,109 @@
+"""
+Response bodies that are rendered and compressed once, then served as-is.
+
+A PrecompressedBody keeps identity, gzip and (when the optional ``brotli``
+package is installed) brotli encodings of a fixed body, each with its own
+strong ETag, and answers conditional GETs with 304. Views built with
+``precompressed_view`` are also picked up by PrecompressedPageMiddleware,
+which serves them straight from a path -> body dict before URL resolution.
+"""
+import gzip
+import hashlib
+import time
+
+from django.http import HttpResponse
+from django.urls import URLPattern, get_resolver
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+
+def _accepted_encodings(header):
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        params = params.replace(' ', '')
+        if coding and params not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(coding.lower())
+    return accepted
+
+
+class PrecompressedBody:
+    def __init__(self, body, content_type, last_modified=None, headers=None, cache_control='public, max-age=300'):
+        self.content_type = content_type
+        self.last_modified = int(last_modified if last_modified is not None else time.time())
+        self.headers = dict(headers or {})
+        self.cache_control = cache_control
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.body = body
+        # Preference order when a client accepts more than one encoding.
+        self.variants = {}
+        if brotli is not None:
+            self.variants['br'] = (brotli.compress(body), f'"{digest}-br"')
+        self.variants['gzip'] = (gzip.compress(body, mtime=0), f'"{digest}-gz"')
+        self.variants['identity'] = (body, f'"{digest}"')
+
+    @property
+    def etag(self):
+        return self.variants['identity'][1]
+
+    def choose_encoding(self, request):
+        accepted = _accepted_encodings(request.headers.get('Accept-Encoding', ''))
+        for encoding in self.variants:
+            if encoding in accepted:
+                return encoding
+        return 'identity'
+
+    def respond(self, request):
+        encoding = self.choose_encoding(request)
+        content, etag = self.variants[encoding]
+        response = get_conditional_response(request, etag=etag, last_modified=self.last_modified)
+        if response is None:
+            response = HttpResponse(content, content_type=self.content_type)
+            if encoding != 'identity':
+                response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(self.last_modified)
+        response['Cache-Control'] = self.cache_control
+        for header, value in self.headers.items():
+            response[header] = value
+        patch_vary_headers(response, ['Accept-Encoding'])
+        return response
+
+
+def precompressed_view(page):
+    """Return a view that serves `page`; the middleware can then serve it without routing."""
+    def view(request, *args, **kwargs):
+        return page.respond(request)
+    view.precompressed_page = page
+    return view
+
+
+class PrecompressedPageMiddleware:
+    """
+    Conditional-GET fast path for the root URLconf's precompressed views.
+
+    GET and HEAD requests to a plain route whose view came from
+    ``precompressed_view`` are answered with a single dict lookup; anything
+    else falls through to the normal URL resolution.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.pages = {}
+        for pattern in get_resolver().url_patterns:
+            page = getattr(getattr(pattern, 'callback', None), 'precompressed_page', None)
+            route = getattr(pattern.pattern, '_route', None)
+            if isinstance(pattern, URLPattern) and page is not None and route is not None and '<' not in route:
+                self.pages['/' + route] = page
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD'):
+            page = self.pages.get(request.path_info)
+            if page is not None:
+                return page.respond(request)
+        return self.get_response(request)
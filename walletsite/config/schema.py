@@ -0,0 +1,118 @@
+"""
+Build-once OpenAPI schema.
+
+drf_yasg walks every view and serializer each time it generates a schema, so
+instead of doing that per request the JSON document is produced once per
+deploy by ``manage.py build_openapi_schema`` (or, failing that, on the first
+request of each process) and served from memory as a PrecompressedBody. The
+stored artifact is only reused while the URLconf it was built from is
+unchanged.
+"""
+import hashlib
+import json
+import threading
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.urls import URLPattern, URLResolver, get_resolver, include, path
+from drf_yasg import openapi
+from drf_yasg.codecs import OpenAPICodecJson
+from drf_yasg.generators import OpenAPISchemaGenerator
+
+from .precompressed import PrecompressedBody
+
+API_INFO = openapi.Info(
+    title="Django Wallet API",
+    default_version='v1',
+    description="Complete REST API for wallet management system with user management, balance tracking, and transaction history",
+    terms_of_service="https://www.google.com/policies/terms/",
+    contact=openapi.Contact(email="admin@example.com"),
+    license=openapi.License(name="MIT License"),
+)
+
+API_PATTERNS = [
+    path('api/', include('wallet.urls')),
+]
+
+
+class BuiltSchema:
+    def __init__(self, body, built_at, fingerprint):
+        self.body = body
+        self.built_at = built_at
+        self.fingerprint = fingerprint
+        self.page = PrecompressedBody(body, 'application/json; charset=utf-8', last_modified=built_at.timestamp())
+
+
+def _walk_patterns(patterns, prefix=''):
+    for pattern in patterns:
+        route = prefix + str(pattern.pattern)
+        if isinstance(pattern, URLResolver):
+            yield from _walk_patterns(pattern.url_patterns, route)
+        elif isinstance(pattern, URLPattern):
+            callback = pattern.callback
+            yield f'{route} {callback.__module__}.{getattr(callback, "__qualname__", callback.__class__.__name__)}'
+
+
+def urlconf_fingerprint(urlconf=None):
+    """Hash of every route and the view behind it; changes whenever the URLconf does."""
+    lines = sorted(_walk_patterns(get_resolver(urlconf).url_patterns))
+    return hashlib.sha256('\n'.join(lines).encode('utf-8')).hexdigest()
+
+
+def generate_schema_body():
+    generator = OpenAPISchemaGenerator(API_INFO, patterns=API_PATTERNS)
+    schema = generator.get_schema(request=None, public=True)
+    return OpenAPICodecJson(validators=[]).encode(schema)
+
+
+def write_artifact(target=None):
+    target = target or settings.OPENAPI_SCHEMA_PATH
+    built = BuiltSchema(generate_schema_body(), datetime.now(dt_timezone.utc), urlconf_fingerprint())
+    with open(target, 'w', encoding='utf-8') as handle:
+        json.dump({
+            'fingerprint': built.fingerprint,
+            'built_at': built.built_at.isoformat(),
+            'schema': built.body.decode('utf-8'),
+        }, handle)
+    return built
+
+
+def _load_artifact(fingerprint):
+    try:
+        with open(settings.OPENAPI_SCHEMA_PATH, encoding='utf-8') as handle:
+            artifact = json.load(handle)
+    except (OSError, ValueError):
+        return None
+    if artifact.get('fingerprint') != fingerprint:
+        return None
+    return BuiltSchema(
+        artifact['schema'].encode('utf-8'),
+        datetime.fromisoformat(artifact['built_at']),
+        fingerprint,
+    )
+
+
+_lock = threading.Lock()
+_schema = None
+
+
+def get_schema():
+    global _schema
+    if _schema is None:
+        with _lock:
+            if _schema is None:
+                fingerprint = urlconf_fingerprint()
+                _schema = _load_artifact(fingerprint) or BuiltSchema(
+                    generate_schema_body(), datetime.now(dt_timezone.utc), fingerprint,
+                )
+    return _schema
+
+
+def reset_schema():
+    global _schema
+    with _lock:
+        _schema = None
+
+
+def schema_json_view(request, *args, **kwargs):
+    return get_schema().page.respond(request)
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 import os
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -59,7 +60,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'config.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'config.precompressed.PrecompressedPageMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -101,21 +104,66 @@ if DATABASE_URL:
     # Use PostgreSQL with DATABASE_URL (Render default)
     import dj_database_url
     db_ssl_require = os.getenv('DB_SSL_REQUIRE', 'true').lower() in ('1', 'true', 'yes')
-    DATABASES = {
-        'default': dj_database_url.parse(
-            DATABASE_URL,
-            conn_max_age=600,
+    # DB_POOL=true shares connections between threads through a per-process
+    # pool (config/postgresql_pool). Django then hands the connection back at
+    # the end of each request, so CONN_MAX_AGE must be 0. Off by default until
+    # PooledPostgreSQLTests pass against the production PostgreSQL version.
+    db_pool = os.getenv('DB_POOL', 'false').lower() in ('1', 'true', 'yes')
+
+    def _postgres_database(url):
+        database = dj_database_url.parse(
+            url,
+            conn_max_age=0 if db_pool else int(os.getenv('DB_CONN_MAX_AGE', '600')),
             ssl_require=db_ssl_require,
         )
-    }
+        if db_pool:
+            database['ENGINE'] = 'config.postgresql_pool'
+            database.setdefault('OPTIONS', {})['pool'] = {
+                # Kept open through quiet periods; more are opened on demand.
+                'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+                # Per process; keep workers * max_size under the server's max_connections.
+                'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+                # Seconds a request waits for a free connection before failing.
+                'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+                # Seconds an extra idle connection is kept, and the most any is reused for.
+                'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', '300')),
+                'max_lifetime': float(os.getenv('DB_POOL_MAX_LIFETIME', '3600')),
+                # Check idle connections with SELECT 1 before handing them out.
+                'pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes'),
+            }
+        return database
+
+    DATABASES = {'default': _postgres_database(DATABASE_URL)}
+    # Streaming replicas of the primary, comma-separated; they become the
+    # aliases 'replica', 'replica2', ... (see wallet/routing.py).
+    _replica_urls = [url for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url]
+    for _index, _url in enumerate(_replica_urls, start=1):
+        DATABASES['replica' if _index == 1 else f'replica{_index}'] = {
+            **_postgres_database(_url),
+            'TEST': {'MIRROR': 'default'},
+        }
+    WALLET_READ_REPLICAS = [alias for alias in DATABASES if alias != 'default']
 else:
     # Fallback to SQLite for local development
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
-        }
+        },
+        # A separate database in the place of a replica. Nothing reads from it
+        # unless WALLET_READ_REPLICAS names it, as the router tests do.
+        'replica': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.replica.sqlite3',
+        },
     }
+    WALLET_READ_REPLICAS = []
+
+# Reads of the list endpoints go to WALLET_READ_REPLICAS; everything else,
+# and a user's reads within WALLET_REPLICA_STICKY_SECONDS of their last write,
+# goes to the primary.
+DATABASE_ROUTERS = ['wallet.routing.ReplicaRouter']
+WALLET_REPLICA_STICKY_SECONDS = float(os.getenv('WALLET_REPLICA_STICKY_SECONDS', '5'))
 
 
 # Password validation
@@ -170,6 +218,51 @@ SECURE_HSTS_PRELOAD = not DEBUG
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Wallet settings
+# Upper bound for the `page_size` query parameter on paginated list endpoints.
+WALLET_MAX_PAGE_SIZE = int(os.getenv('WALLET_MAX_PAGE_SIZE', '500'))
+# 'inline' writes Transaction rows inside the wallet update; 'outbox' writes a
+# LedgerOutbox row instead and leaves the move to `manage.py drain_ledger_outbox`.
+WALLET_LEDGER_MODE = os.getenv('WALLET_LEDGER_MODE', 'inline')
+# How long (seconds) a response is replayed for a repeated Idempotency-Key.
+WALLET_IDEMPOTENCY_TTL = int(os.getenv('WALLET_IDEMPOTENCY_TTL', str(24 * 60 * 60)))
+# Per-user read cache for balances and the newest transaction page
+# (wallet/cache.py). Writes invalidate it through per-user versions stored in
+# the cache itself, so every worker must see the same cache: 'file' (the
+# default) is shared through WALLET_CACHE_LOCATION; 'locmem' is per process
+# and only allowed with a single worker (WEB_CONCURRENCY).
+WALLET_CACHE_BACKEND = os.getenv('WALLET_CACHE_BACKEND', 'file')
+if WALLET_CACHE_BACKEND == 'locmem' and int(os.getenv('WEB_CONCURRENCY', '1')) > 1:
+    raise ImproperlyConfigured(
+        'WALLET_CACHE_BACKEND=locmem keeps cache invalidations inside one process; '
+        'use WALLET_CACHE_BACKEND=file when WEB_CONCURRENCY > 1.'
+    )
+WALLET_CACHE_TTL = int(os.getenv('WALLET_CACHE_TTL', '300'))
+# Build the user and transaction list responses from values_list() rows and
+# encode them with orjson (wallet/fastjson.py) instead of the serializers.
+WALLET_FAST_SERIALIZATION = os.getenv('WALLET_FAST_SERIALIZATION', 'true').lower() in ('1', 'true', 'yes')
+# Where `manage.py archive_transactions` writes old months as .jsonl.gz files;
+# the history endpoint reads them back with ?include_archived=true.
+WALLET_ARCHIVE_DIR = os.getenv('WALLET_ARCHIVE_DIR', str(BASE_DIR / 'archive'))
+
+# Points the file-based wallet cache at a temporary directory during tests.
+TEST_RUNNER = 'config.test_runner.WalletTestRunner'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'wallet': {
+        'BACKEND': {
+            'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+            'file': 'django.core.cache.backends.filebased.FileBasedCache',
+        }[WALLET_CACHE_BACKEND],
+        'LOCATION': os.getenv('WALLET_CACHE_LOCATION', str(BASE_DIR / '.cache' / 'wallet')),
+        'TIMEOUT': WALLET_CACHE_TTL,
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('WALLET_CACHE_MAX_ENTRIES', '100000'))},
+    },
+}
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
@@ -197,3 +290,9 @@ SWAGGER_SETTINGS = {
     },
     'USE_SESSION_AUTH': False,
 }
+
+# Add a Server-Timing header (app/db durations, query count) to every response.
+SERVER_TIMING_HEADER = os.getenv('SERVER_TIMING_HEADER', 'false').lower() in ('1', 'true', 'yes')
+
+# Prebuilt OpenAPI document written by `manage.py build_openapi_schema`
+OPENAPI_SCHEMA_PATH = os.getenv('OPENAPI_SCHEMA_PATH', str(BASE_DIR / 'openapi.json'))
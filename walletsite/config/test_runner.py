@@ -0,0 +1,28 @@
+"""
+Test runner that keeps the suite's wallet cache out of the project tree.
+
+The default file-based wallet cache lives under BASE_DIR/.cache/wallet. For
+the duration of the run, it is pointed at a temporary directory, which is
+removed afterwards.
+"""
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class WalletTestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._cache_dir = tempfile.TemporaryDirectory(prefix='wallet-cache-')
+        self._cache_settings = override_settings(CACHES={
+            **settings.CACHES,
+            'wallet': {**settings.CACHES['wallet'], 'LOCATION': self._cache_dir.name},
+        })
+        self._cache_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._cache_settings.disable()
+        self._cache_dir.cleanup()
+        super().teardown_test_environment(**kwargs)
@@ -18,10 +18,15 @@ from django.contrib import admin
 from django.urls import path, include
 from django.http import JsonResponse, HttpResponse
 from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
 from rest_framework import permissions
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
+from django.core.serializers.json import DjangoJSONEncoder
+import json
+
+from .metrics import metrics_view
+from .precompressed import PrecompressedBody, precompressed_view
+from .schema import API_INFO, API_PATTERNS, schema_json_view
 
 def root_view(request):
     return JsonResponse({
@@ -33,53 +38,60 @@ def root_view(request):
             'swagger': '/swagger/',
             'users': '/api/users/',
             'wallet_update': '/api/wallet/update/',
-            'transactions': '/api/transactions/<user_id>/'
+            'transactions': '/api/transactions/<user_id>/',
+            'metrics': '/metrics'
         }
     })
 
 def health_check(request):
     return JsonResponse({'status': 'ok', 'message': 'Health check passed'})
 
-def assignment_info(request):
-    """Special endpoint for assignment submission with CORS headers"""
-    data = {
-        'project_name': 'Django Wallet API',
-        'description': 'A complete REST API for wallet management system',
-        'status': 'active',
-        'endpoints': {
-            'test': 'https://ammr-django-wallet.onrender.com/api/test/',
-            'users': 'https://ammr-django-wallet.onrender.com/api/users/',
-            'wallet_update': 'https://ammr-django-wallet.onrender.com/api/wallet/update/',
-            'transactions': 'https://ammr-django-wallet.onrender.com/api/transactions/{user_id}/',
-            'documentation': 'https://ammr-django-wallet.onrender.com/docs/',
-            'swagger': 'https://ammr-django-wallet.onrender.com/swagger/'
-        },
-        'features': [
-            'User Management',
-            'Wallet Balance Tracking', 
-            'Transaction History',
-            'Credit/Debit Operations',
-            'RESTful API Design',
-            'JSON Response Format',
-            'Error Handling',
-            'CORS Enabled'
-        ],
-        'technology_stack': [
-            'Django 4.2.23',
-            'Django REST Framework',
-            'PostgreSQL',
-            'Swagger Documentation',
-            'CORS Headers'
-        ]
-    }
-    response = JsonResponse(data)
-    response['Access-Control-Allow-Origin'] = '*'
-    response['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
-    response['Access-Control-Allow-Headers'] = 'Content-Type'
-    return response
+# Assignment submission payload; rendered and compressed once at import.
+ASSIGNMENT_INFO = {
+    'project_name': 'Django Wallet API',
+    'description': 'A complete REST API for wallet management system',
+    'status': 'active',
+    'endpoints': {
+        'test': 'https://ammr-django-wallet.onrender.com/api/test/',
+        'users': 'https://ammr-django-wallet.onrender.com/api/users/',
+        'wallet_update': 'https://ammr-django-wallet.onrender.com/api/wallet/update/',
+        'transactions': 'https://ammr-django-wallet.onrender.com/api/transactions/{user_id}/',
+        'documentation': 'https://ammr-django-wallet.onrender.com/docs/',
+        'swagger': 'https://ammr-django-wallet.onrender.com/swagger/'
+    },
+    'features': [
+        'User Management',
+        'Wallet Balance Tracking', 
+        'Transaction History',
+        'Credit/Debit Operations',
+        'RESTful API Design',
+        'JSON Response Format',
+        'Error Handling',
+        'CORS Enabled'
+    ],
+    'technology_stack': [
+        'Django 4.2.23',
+        'Django REST Framework',
+        'PostgreSQL',
+        'Swagger Documentation',
+        'CORS Headers'
+    ]
+}
 
-def api_docs(request):
-    html = """
+_CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type',
+}
+
+# Special endpoint for assignment submission with CORS headers
+assignment_info = precompressed_view(PrecompressedBody(
+    json.dumps(ASSIGNMENT_INFO, cls=DjangoJSONEncoder).encode('utf-8'),
+    'application/json',
+    headers=_CORS_HEADERS,
+))
+
+API_DOCS_HTML = """
     <!DOCTYPE html>
     <html>
     <head>
@@ -170,29 +182,21 @@ curl https://ammr-django-wallet.onrender.com/api/transactions/1/
     </body>
     </html>
     """
-    from django.http import HttpResponse
-    response = HttpResponse(html)
-    response['Access-Control-Allow-Origin'] = '*'
-    response['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
-    response['Access-Control-Allow-Headers'] = 'Content-Type'
-    return response
+
+api_docs = precompressed_view(PrecompressedBody(
+    API_DOCS_HTML.encode('utf-8'),
+    'text/html; charset=utf-8',
+    headers=_CORS_HEADERS,
+))
 
 # Simplified Swagger configuration
 schema_view = get_schema_view(
-    openapi.Info(
-        title="Django Wallet API",
-        default_version='v1',
-        description="Complete REST API for wallet management system with user management, balance tracking, and transaction history",
-        terms_of_service="https://www.google.com/policies/terms/",
-        contact=openapi.Contact(email="admin@example.com"),
-        license=openapi.License(name="MIT License"),
-    ),
+    API_INFO,
     public=True,
     permission_classes=(permissions.AllowAny,),
-    patterns=[
-        path('api/', include('wallet.urls')),
-    ],
+    patterns=API_PATTERNS,
 )
+redoc_ui_view = schema_view.with_ui('redoc', cache_timeout=0)
 
 # Custom Swagger view with CORS headers
 @csrf_exempt
@@ -482,21 +486,26 @@ def swagger_view(request, *args, **kwargs):
 @csrf_exempt
 def redoc_view(request, *args, **kwargs):
     """Custom ReDoc view with CORS headers"""
-    response = schema_view.with_ui('redoc', cache_timeout=0)(request, *args, **kwargs)
-    if hasattr(response, 'content'):
-        response['Access-Control-Allow-Origin'] = '*'
-        response['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
-        response['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
+    if request.GET.get('format') == 'openapi':
+        # ReDoc fetches its spec from ?format=openapi; answer it from the prebuilt schema.
+        response = schema_json_view(request)
+    else:
+        response = redoc_ui_view(request, *args, **kwargs)
+        response.render()
+    response['Access-Control-Allow-Origin'] = '*'
+    response['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
+    response['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
     return response
 
 urlpatterns = [
     path('', root_view, name='root'),
     path('health/', health_check, name='health'),
+    path('metrics', metrics_view, name='metrics'),
     path('assignment/', assignment_info, name='assignment-info'),
     path('docs/', api_docs, name='api-docs'),
     path('admin/', admin.site.urls),
     path('api/', include('wallet.urls')),
     path('swagger/', swagger_view, name='schema-swagger-ui'),
-    path('swagger.json', schema_view.without_ui(cache_timeout=0), name='schema-json'),
+    path('swagger.json', schema_json_view, name='schema-json'),
     path('redoc/', redoc_view, name='schema-redoc'),
 ]
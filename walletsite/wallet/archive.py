@@ -0,0 +1,213 @@
+"""
+Cold storage for old months of the transaction ledger.
+
+``archive_month`` writes every Transaction of one calendar month (UTC) to
+WALLET_ARCHIVE_DIR/transactions-YYYY-MM.jsonl.gz, in the export_transactions
+JSONL format, and then removes the month from the database: by dropping its
+partition where the table is partitioned (see partitions.py), otherwise with
+a DELETE. Each user's rows are a separate gzip member, newest first, and the
+manifest written next to the file records where every member starts, so
+``iter_user_rows`` reads one user's history without decompressing anyone
+else's. The file as a whole is still an ordinary .jsonl.gz.
+
+Only months fully covered by balance checkpoints can be archived: reconcile
+sums transactions after the latest checkpoint, so removed rows must already
+be behind it. Daily rollups are kept and go on covering archived days.
+"""
+import gzip
+import json
+import os
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+from itertools import groupby
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections, router, transaction as db_transaction
+from django.db.models import Min, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils.dateparse import parse_datetime
+
+from . import partitions
+from .cache import invalidate_on_commit
+from .export import DEFAULT_CHUNK_SIZE, EXPORT_COLUMNS, iter_jsonl
+from .ledger import _latest_checkpoint
+from .models import Transaction
+
+FILE_PREFIX = 'transactions-'
+
+
+class ArchiveError(Exception):
+    pass
+
+
+@dataclass
+class ArchivedMonth:
+    month: date
+    path: Path
+    rows: int
+    users: int
+
+
+def archive_dir():
+    return Path(settings.WALLET_ARCHIVE_DIR)
+
+
+def _paths(month):
+    stem = archive_dir() / f'{FILE_PREFIX}{month:%Y-%m}'
+    return stem.with_suffix('.jsonl.gz'), stem.with_suffix('.manifest.json')
+
+
+def archived_months():
+    """Months with a complete archive (their manifest is written last), newest first."""
+    directory = archive_dir()
+    if not directory.is_dir():
+        return []
+    months = []
+    for path in directory.glob(f'{FILE_PREFIX}*.manifest.json'):
+        try:
+            months.append(datetime.strptime(path.name[len(FILE_PREFIX):-len('.manifest.json')], '%Y-%m').date())
+        except ValueError:
+            continue
+    return sorted(months, reverse=True)
+
+
+def archived_until():
+    """First day after the newest archived month, or None without archives."""
+    months = archived_months()
+    return partitions.add_months(months[0], 1) if months else None
+
+
+def _write_atomically(path, write):
+    partial = path.with_name(path.name + '.partial')
+    with open(partial, 'wb') as handle:
+        write(handle)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(partial, path)
+
+
+def archive_month(month, using=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Move the transactions of `month` (a date, any day of it) into the archive.
+    Returns an ArchivedMonth, or None when the database has no rows for it.
+    Re-running for a month whose removal failed rewrites its files.
+    """
+    using = using or router.db_for_write(Transaction)
+    month = partitions.month_of(month)
+    start, end = partitions.month_bounds(month)
+    rows = Transaction.objects.using(using).filter(created_at__gte=start, created_at__lt=end)
+    if not rows.exists():
+        return None
+    uncovered = rows.filter(id__gt=Coalesce(Subquery(_latest_checkpoint().values('last_transaction_id')[:1]), Value(0)))
+    if uncovered.exists():
+        raise ArchiveError(f'{month:%Y-%m} has transactions after the latest balance checkpoint; run checkpoint_balances first.')
+
+    data_path, manifest_path = _paths(month)
+    data_path.parent.mkdir(parents=True, exist_ok=True)
+    members = {}
+
+    def write_data(handle):
+        ordered = (
+            rows.order_by('user_id', '-created_at', '-id')
+            .values_list(*EXPORT_COLUMNS)
+            .iterator(chunk_size=chunk_size)
+        )
+        for user_id, user_rows in groupby(ordered, key=lambda row: row[1]):
+            offset = handle.tell()
+            count = 0
+            with gzip.GzipFile(fileobj=handle, mode='wb', mtime=0) as member:
+                for line in iter_jsonl(user_rows):
+                    member.write(line.encode('utf-8'))
+                    count += 1
+            members[str(user_id)] = {'offset': offset, 'length': handle.tell() - offset, 'rows': count}
+
+    _write_atomically(data_path, write_data)
+    total = sum(member['rows'] for member in members.values())
+    manifest = {'month': f'{month:%Y-%m}', 'rows': total, 'users': members}
+    _write_atomically(manifest_path, lambda handle: handle.write(json.dumps(manifest).encode('utf-8')))
+
+    with db_transaction.atomic(using=using):
+        if month in partitions.partition_months(using):
+            connection = connections[using]
+            with connection.cursor() as cursor:
+                cursor.execute(f'LOCK TABLE {connection.ops.quote_name(partitions.partition_name(month))} IN ACCESS EXCLUSIVE MODE')
+            removed = rows.count()
+            if removed == total:
+                partitions.drop_partition(month, using)
+        else:
+            removed, _ = rows.delete()
+        if removed != total:
+            # Rows arrived after the file was written; leave the month in place.
+            raise ArchiveError(f'{month:%Y-%m} changed while it was archived ({removed} rows, {total} written); run again.')
+        invalidate_on_commit([int(user_id) for user_id in members], using=using)
+    return ArchivedMonth(month=month, path=data_path, rows=total, users=len(members))
+
+
+def archive_before(cutoff, using=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Archive every month before the month of `cutoff`, oldest first."""
+    using = using or router.db_for_write(Transaction)
+    end, _ = partitions.month_bounds(partitions.month_of(cutoff))
+    oldest = Transaction.objects.using(using).filter(created_at__lt=end).aggregate(oldest=Min('created_at'))['oldest']
+    archived = []
+    if oldest is None:
+        return archived
+    month = partitions.month_of(oldest)
+    while partitions.month_bounds(month)[0] < end:
+        result = archive_month(month, using, chunk_size)
+        if result is not None:
+            archived.append(result)
+        month = partitions.add_months(month, 1)
+    return archived
+
+
+@lru_cache(maxsize=64)
+def _load_manifest(path, mtime_ns):
+    with open(path, 'rb') as handle:
+        return json.load(handle)
+
+
+def _manifest(month):
+    data_path, manifest_path = _paths(month)
+    try:
+        return data_path, _load_manifest(manifest_path, manifest_path.stat().st_mtime_ns)
+    except FileNotFoundError:
+        return data_path, None
+
+
+def _read_member(data_path, member):
+    with open(data_path, 'rb') as handle:
+        handle.seek(member['offset'])
+        raw = gzip.decompress(handle.read(member['length']))
+    for line in raw.decode('utf-8').splitlines():
+        row = json.loads(line)
+        yield Transaction(
+            id=row['id'],
+            user_id=row['user'],
+            amount=Decimal(row['amount']),
+            transaction_type=row['transaction_type'],
+            description=row['description'],
+            created_at=parse_datetime(row['created_at']),
+            # Files archived before balance_after existed have no such key.
+            balance_after=Decimal(row['balance_after']) if row.get('balance_after') is not None else None,
+        )
+
+
+def iter_user_rows(user_id, before=None):
+    """
+    Yield the archived transactions of user_id as unsaved Transaction
+    instances, newest first. With before=(created_at, id) only rows older
+    than that position are yielded, as the history cursor expects.
+    """
+    for month in archived_months():
+        if before is not None and partitions.month_bounds(month)[0] > before[0]:
+            continue
+        data_path, manifest = _manifest(month)
+        member = manifest['users'].get(str(user_id)) if manifest else None
+        if member is None:
+            continue
+        for entry in _read_member(data_path, member):
+            if before is None or (entry.created_at, entry.pk) < before:
+                yield entry
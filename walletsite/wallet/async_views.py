@@ -0,0 +1,73 @@
+"""
+ASGI-native versions of the wallet endpoints.
+
+The read endpoints evaluate their queries with Django's async ORM, so under
+an ASGI server one worker can keep many of them in flight while waiting on
+the database. Responses match their DRF counterparts. The write path keeps
+the synchronous wallet_update (with its transaction, idempotency handling
+and response modes) and runs it through sync_to_async, which gives every
+request its own thread-sensitive executor under Django's ASGI handler.
+"""
+from asgiref.sync import sync_to_async
+from django.http import HttpResponseNotAllowed, JsonResponse
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+
+from . import views
+from .filters import filter_transactions
+from .models import Transaction
+from .pagination import IdCursorPagination, TransactionCursorPagination
+from .routing import read_from_replica
+from .serializers import TransactionSerializer, UserSerializer
+
+
+async def _paginated_response(request, queryset, paginator, serialize):
+    try:
+        queryset = paginator.page_queryset(queryset, request)
+    except APIException as exc:
+        return JsonResponse({'detail': exc.detail}, status=exc.status_code)
+    rows = paginator.finish_page([row async for row in queryset])
+    return JsonResponse(paginator.get_paginated_response(serialize(rows)).data)
+
+
+async def user_list(request):
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    api_request = Request(request)
+    try:
+        fields = views.parse_user_fields(api_request.query_params.get('fields'))
+    except APIException as exc:
+        return JsonResponse(exc.detail, status=exc.status_code)
+    with read_from_replica():
+        return await _paginated_response(
+            api_request,
+            views.user_list_queryset(fields),
+            IdCursorPagination(),
+            lambda rows: UserSerializer(rows, many=True, fields=fields).data,
+        )
+
+
+async def user_transactions(request, user_id):
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    api_request = Request(request)
+    try:
+        queryset = filter_transactions(Transaction.objects.filter(user_id=user_id), api_request.query_params)
+    except APIException as exc:
+        return JsonResponse(exc.detail, status=exc.status_code)
+    with read_from_replica(user_id):
+        return await _paginated_response(
+            api_request,
+            queryset,
+            TransactionCursorPagination(),
+            lambda rows: TransactionSerializer(rows, many=True).data,
+        )
+
+
+async def wallet_update(request):
+    return await sync_to_async(views.wallet_update)(request)
+
+
+# Same CSRF policy as the DRF view it wraps; set directly because Django 4.2's
+# csrf_exempt decorator does not preserve coroutine functions.
+wallet_update.csrf_exempt = True
@@ -0,0 +1,377 @@
+"""
+Load-test harness for the wallet API, used by ``manage.py run_benchmark``.
+
+Requests go through the full Django stack in-process (django.test.Client),
+so no server is needed and the SQL issued for every request can be counted
+on the worker thread's own connection. The database is whatever settings
+point at: SQLite by default, PostgreSQL when DATABASE_URL is set.
+"""
+import math
+import platform
+import random
+import subprocess
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import close_old_connections, connection, connections
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.renderers import JSONRenderer
+
+from . import fastjson, rollups
+from .cache import CACHE_ALIAS
+from .models import Transaction, Wallet
+from .pagination import IdCursorPagination
+from .serializers import TransactionSerializer, UserSerializer
+
+USERNAME_PREFIX = 'loadtest-'
+SCENARIOS = ('wallet_update', 'user_transactions', 'user_list')
+
+
+@dataclass
+class ScenarioResult:
+    scenario: str
+    requests: int
+    concurrency: int
+    errors: int
+    duration_seconds: float
+    throughput_rps: float
+    latency_ms: dict
+    queries_per_request: float
+    status_codes: dict = field(default_factory=dict)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def ensure_dataset(users, transactions, batch_size=10000, log=None):
+    """
+    Top the load-test dataset up to `users` users (each with a wallet) and
+    `transactions` credit rows spread evenly over them. Re-running with the
+    same sizes adds nothing. Returns the list of load-test user ids.
+    """
+    User = get_user_model()
+    queryset = User.objects.filter(username__startswith=USERNAME_PREFIX)
+    existing = queryset.count()
+    for start in range(existing, users, batch_size):
+        User.objects.bulk_create([
+            User(username=f'{USERNAME_PREFIX}{index:08d}', password='!')
+            for index in range(start, min(start + batch_size, users))
+        ])
+    user_ids = list(queryset.order_by('id').values_list('id', flat=True)[:users])
+    Wallet.objects.bulk_create([Wallet(user_id=user_id) for user_id in user_ids], ignore_conflicts=True)
+    if not user_ids:
+        return user_ids
+
+    dataset = Transaction.objects.filter(user__username__startswith=USERNAME_PREFIX)
+    existing = dataset.count()
+    now = datetime.now(dt_timezone.utc)
+    amount = Decimal('1.00')
+    for start in range(existing, transactions, batch_size):
+        stop = min(start + batch_size, transactions)
+        Transaction.objects.bulk_create([
+            Transaction(
+                user_id=user_ids[index % len(user_ids)],
+                amount=amount,
+                transaction_type=Transaction.CREDIT,
+                description='load test',
+                created_at=now - timedelta(seconds=transactions - index),
+            )
+            for index in range(start, stop)
+        ])
+        if log:
+            log(f'seeded {stop}/{transactions} transactions')
+    if transactions > existing:
+        # Keep wallet balances equal to their ledger (every row is a credit),
+        # as reconcile_balances expects.
+        totals = (
+            Transaction.objects.filter(user_id=OuterRef('user_id'))
+            .order_by().values('user_id').annotate(total=Sum('amount')).values('total')
+        )
+        Wallet.objects.filter(user__username__startswith=USERNAME_PREFIX).update(
+            balance=Coalesce(Subquery(totals), Value(Decimal('0.00'))),
+        )
+        rollups.rebuild_all()
+    return user_ids
+
+
+def _request_factory(scenario, user_ids, rng):
+    paginator = IdCursorPagination()
+    lowest, highest = min(user_ids), max(user_ids)
+
+    def wallet_update(client):
+        return client.post(
+            '/api/wallet/update/',
+            {'user_id': rng.choice(user_ids), 'amount': '1.00', 'transaction_type': 'credit'},
+            content_type='application/json',
+            secure=True,
+        )
+
+    def user_transactions(client):
+        return client.get(f'/api/transactions/{rng.choice(user_ids)}/', secure=True)
+
+    def user_list(client):
+        cursor = paginator.encode_cursor(rng.randint(lowest - 1, highest))
+        return client.get('/api/users/', {'cursor': cursor}, secure=True)
+
+    return {
+        'wallet_update': wallet_update,
+        'user_transactions': user_transactions,
+        'user_list': user_list,
+    }[scenario]
+
+
+def run_scenario(scenario, user_ids, requests, concurrency, seed=0):
+    """
+    Send `requests` requests for `scenario` from `concurrency` threads (or
+    inline on the calling thread when concurrency is 1) and summarise them.
+    """
+    caches[CACHE_ALIAS].clear()
+    per_worker = [requests // concurrency + (1 if slot < requests % concurrency else 0) for slot in range(concurrency)]
+    samples = [[] for _ in range(concurrency)]
+    start_barrier = threading.Barrier(concurrency) if concurrency > 1 else None
+
+    def worker(slot):
+        rng = random.Random(f'{seed}:{scenario}:{slot}')
+        send = _request_factory(scenario, user_ids, rng)
+        client = Client()
+        if start_barrier:
+            start_barrier.wait()
+        for _ in range(per_worker[slot]):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = send(client)
+                elapsed = time.perf_counter() - started
+            samples[slot].append((elapsed, response.status_code, len(queries.captured_queries)))
+            # The test client skips Django's end-of-request connection
+            # handling; do it here so CONN_MAX_AGE and pooling apply as
+            # they do under a server.
+            close_old_connections()
+
+    started = time.perf_counter()
+    with override_settings(ALLOWED_HOSTS=['testserver']):
+        if concurrency == 1:
+            worker(0)
+        else:
+            def threaded(slot):
+                try:
+                    worker(slot)
+                finally:
+                    connections.close_all()
+
+            threads = [threading.Thread(target=threaded, args=(slot,)) for slot in range(concurrency)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+    duration = time.perf_counter() - started
+
+    flat = [sample for worker_samples in samples for sample in worker_samples]
+    latencies = sorted(elapsed * 1000 for elapsed, _, _ in flat)
+    status_codes = {}
+    for _, status_code, _ in flat:
+        status_codes[str(status_code)] = status_codes.get(str(status_code), 0) + 1
+    return ScenarioResult(
+        scenario=scenario,
+        requests=len(flat),
+        concurrency=concurrency,
+        errors=sum(1 for _, status_code, _ in flat if status_code >= 400),
+        duration_seconds=round(duration, 4),
+        throughput_rps=round(len(flat) / duration, 2) if duration else 0.0,
+        latency_ms={
+            'p50': round(percentile(latencies, 50), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'p99': round(percentile(latencies, 99), 3),
+            'mean': round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+            'max': round(latencies[-1], 3) if latencies else 0.0,
+        },
+        queries_per_request=round(sum(count for _, _, count in flat) / len(flat), 2) if flat else 0.0,
+        status_codes=status_codes,
+    )
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True, cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _database_version():
+    if connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version
+    if connection.vendor == 'postgresql':
+        return str(connection.pg_version)
+    return None
+
+
+def environment():
+    """Where the numbers came from, recorded next to them in the JSON report."""
+    connection.ensure_connection()
+    return {
+        'git_revision': _git_revision(),
+        'database_vendor': connection.vendor,
+        'database_version': _database_version(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'ledger_mode': settings.WALLET_LEDGER_MODE,
+        'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+        'database_pool': connection.settings_dict['OPTIONS'].get('pool'),
+        'started_at': datetime.now(dt_timezone.utc).isoformat(),
+    }
+
+
+def compare(report, baseline):
+    """Per-scenario ratios of this report to a baseline report (>1 means higher)."""
+    previous = {result['scenario']: result for result in baseline.get('results', [])}
+    changes = {}
+    for result in report['results']:
+        before = previous.get(result['scenario'])
+        if before is None:
+            continue
+        changes[result['scenario']] = {
+            'throughput_rps': _ratio(result['throughput_rps'], before['throughput_rps']),
+            'p95_ms': _ratio(result['latency_ms']['p95'], before['latency_ms']['p95']),
+            'p99_ms': _ratio(result['latency_ms']['p99'], before['latency_ms']['p99']),
+            'queries_per_request': _ratio(result['queries_per_request'], before['queries_per_request']),
+        }
+    return changes
+
+
+def _ratio(current, previous):
+    return round(current / previous, 3) if previous else None
+
+
+def run(scenarios, users, transactions, requests, concurrency, seed=0, log=None):
+    """Seed the dataset, run each scenario and return the JSON-ready report."""
+    if users < 1:
+        raise ValueError('The benchmark needs at least one user.')
+    user_ids = ensure_dataset(users, transactions, log=log)
+    results = []
+    for scenario in scenarios:
+        result = run_scenario(scenario, user_ids, requests, concurrency, seed=seed)
+        if log:
+            log(
+                f'{scenario:<18} rps={result.throughput_rps:9.1f} '
+                f'p50={result.latency_ms["p50"]:.2f}ms p95={result.latency_ms["p95"]:.2f}ms '
+                f'p99={result.latency_ms["p99"]:.2f}ms queries/req={result.queries_per_request} '
+                f'errors={result.errors}'
+            )
+        results.append(asdict(result))
+    return {
+        'environment': environment(),
+        'parameters': {
+            'scenarios': list(scenarios),
+            'users': users,
+            'transactions': transactions,
+            'requests': requests,
+            'concurrency': concurrency,
+            'seed': seed,
+        },
+        'results': results,
+    }
+
+
+def _best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def _compare_paths(name, repeat, fetch_models, fetch_rows, serialize, serialize_fast):
+    """Time both paths with and without the fetch; fail if their bytes differ."""
+    slow_renderer, fast_renderer = JSONRenderer(), fastjson.FastJSONRenderer()
+
+    def slow(models):
+        return slow_renderer.render({'next': None, 'results': serialize(models)})
+
+    def fast(rows):
+        return fast_renderer.render({'next': None, 'results': serialize_fast(rows)})
+
+    models, rows = fetch_models(), fetch_rows()
+    serialize_slow_s, slow_body = _best_of(repeat, lambda: slow(models))
+    serialize_fast_s, fast_body = _best_of(repeat, lambda: fast(rows))
+    if slow_body != fast_body:
+        raise AssertionError(f'{name}: fast path output differs from the serializers')
+    total_slow_s, _ = _best_of(repeat, lambda: slow(fetch_models()))
+    total_fast_s, _ = _best_of(repeat, lambda: fast(fetch_rows()))
+    return {
+        'rows': len(rows),
+        'bytes': len(fast_body),
+        'serialize_ms': {'serializer': round(serialize_slow_s * 1000, 3), 'fast': round(serialize_fast_s * 1000, 3)},
+        'serialize_speedup': _ratio(serialize_slow_s, serialize_fast_s),
+        'total_ms': {'serializer': round(total_slow_s * 1000, 3), 'fast': round(total_fast_s * 1000, 3)},
+        'total_speedup': _ratio(total_slow_s, total_fast_s),
+    }
+
+
+def serialization_benchmark(rows=10000, repeat=5):
+    """
+    Compare the serializer path with the fastjson path for a page of `rows`
+    transactions and one of `rows` users: building and rendering the page
+    alone, and together with the query. Creates scratch rows and deletes
+    them afterwards.
+    """
+    User = get_user_model()
+    prefix = f'bench-serialization-{uuid.uuid4().hex[:12]}'
+    owner = User.objects.create(username=prefix)
+    try:
+        now = datetime.now(dt_timezone.utc)
+        Transaction.objects.bulk_create([
+            Transaction(
+                user=owner,
+                amount=Decimal(index % 100000) / 100,
+                transaction_type=Transaction.CREDIT if index % 3 else Transaction.DEBIT,
+                description=f'bench row {index}',
+                created_at=now - timedelta(seconds=index),
+            )
+            for index in range(rows)
+        ], batch_size=5000)
+        missing = rows - User.objects.count()
+        if missing > 0:
+            User.objects.bulk_create([
+                User(username=f'{prefix}-{index}', password='!', email=f'{index}@example.com') for index in range(missing)
+            ], batch_size=5000)
+
+        transactions = Transaction.objects.filter(user=owner).order_by('-created_at', '-id')[:rows]
+        users = User.objects.order_by('id')[:rows]
+        user_fields = list(UserSerializer.Meta.fields)
+        return {
+            'transactions': _compare_paths(
+                'transactions', repeat,
+                lambda: list(transactions),
+                lambda: list(transactions.values_list(*fastjson.TRANSACTION_COLUMNS, named=True)),
+                lambda models: TransactionSerializer(models, many=True).data,
+                fastjson.transaction_rows,
+            ),
+            'users': _compare_paths(
+                'users', repeat,
+                lambda: list(users),
+                lambda: list(users.values_list(*fastjson.user_columns(user_fields), named=True)),
+                lambda models: UserSerializer(models, many=True).data,
+                lambda page: fastjson.user_rows(page, user_fields),
+            ),
+        }
+    finally:
+        User.objects.filter(username__startswith=prefix).delete()
@@ -0,0 +1,100 @@
+"""
+Per-user read cache for wallet balances and the newest page of transactions.
+
+Entries are keyed by user and by a per-wallet version that lives in the
+cache itself. Readers fetch the current version first and read/write
+entries under it; every write path bumps the version in
+``transaction.on_commit``, which makes all older entries unreachable at
+once. A reader that raced with a write can only ever store its result under
+the version that write retires, so nothing stale is served after the write
+has returned.
+
+The same commit hook marks the users as recently written for
+WALLET_REPLICA_STICKY_SECONDS; ``wrote_recently`` tells the read-replica
+routing (routing.py) to keep their reads on the primary meanwhile.
+
+Entries live in the ``wallet`` cache alias, which settings configure as the
+file-based backend (the default) or local memory. Local memory is per
+process, so a write handled by one worker would not retire the entries of
+another; settings refuse it when WEB_CONCURRENCY is above 1.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction as db_transaction
+
+CACHE_ALIAS = 'wallet'
+VERSION_KEY = 'wallet:{user_id}:version'
+ENTRY_KEY = 'wallet:{user_id}:{version}:{name}'
+WROTE_KEY = 'wallet:{user_id}:wrote'
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _new_version():
+    # Random rather than a counter: incr is a read-modify-write on the
+    # file-based backend, so two workers bumping at once could both write
+    # the same next value, and a result cached by a reader in between would
+    # survive the second write. A version key that was evicted can never
+    # come back and collide with old entries either.
+    return uuid.uuid4().hex
+
+
+def get_version(user_id):
+    cache = _cache()
+    key = VERSION_KEY.format(user_id=user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_versions(user_ids):
+    cache = _cache()
+    user_ids = set(user_ids)
+    cache.set_many({VERSION_KEY.format(user_id=user_id): _new_version() for user_id in user_ids}, timeout=None)
+    if settings.WALLET_READ_REPLICAS and settings.WALLET_REPLICA_STICKY_SECONDS > 0:
+        cache.set_many(
+            {WROTE_KEY.format(user_id=user_id): True for user_id in user_ids},
+            timeout=settings.WALLET_REPLICA_STICKY_SECONDS,
+        )
+
+
+def wrote_recently(user_id):
+    """Whether a write for user_id committed within the last WALLET_REPLICA_STICKY_SECONDS."""
+    return _cache().get(WROTE_KEY.format(user_id=user_id)) is not None
+
+
+def invalidate_on_commit(user_ids, using=None):
+    """
+    Retire cached reads for user_ids once the current transaction commits,
+    and keep their replica-routed reads on the primary for a while.
+
+    The callback is robust: by the time it runs the write has committed, so
+    a cache failure is logged by Django rather than turned into an
+    error response that a client would retry.
+    """
+    user_ids = list(user_ids)
+    db_transaction.on_commit(lambda: bump_versions(user_ids), using=using, robust=True)
+
+
+def get_or_compute(user_id, name, compute):
+    """
+    Return the cached value for (user_id, name), computing and storing it on a miss.
+
+    The version is read before compute() runs, so a result that raced with a
+    write is filed under the version that write is about to retire. None
+    results are returned but not cached.
+    """
+    cache = _cache()
+    key = ENTRY_KEY.format(user_id=user_id, version=get_version(user_id), name=name)
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        if value is not None:
+            cache.set(key, value, timeout=settings.WALLET_CACHE_TTL)
+    return value
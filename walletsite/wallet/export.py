@@ -0,0 +1,119 @@
+import csv
+import json
+from datetime import datetime, time
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Transaction
+
+EXPORT_FIELDS = ['id', 'user', 'amount', 'transaction_type', 'description', 'created_at', 'balance_after']
+EXPORT_COLUMNS = ('id', 'user_id', 'amount', 'transaction_type', 'description', 'created_at', 'balance_after')
+EXPORT_FORMATS = ('csv', 'jsonl')
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+DEFAULT_CHUNK_SIZE = 2000
+
+
+class ExportError(ValueError):
+    pass
+
+
+def parse_bound(value, name):
+    """Parse an ISO date or datetime; bare dates mean midnight in the current time zone."""
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ExportError(f'{name} must be an ISO date or datetime.')
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def parse_user_ids(values):
+    user_ids = []
+    for value in values:
+        for part in str(value).split(','):
+            part = part.strip()
+            if not part:
+                continue
+            try:
+                user_ids.append(int(part))
+            except ValueError:
+                raise ExportError('user_id must be an integer.')
+    return user_ids
+
+
+def export_rows(user_ids=None, start=None, end=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Stream transaction rows in id order as tuples matching EXPORT_FIELDS.
+
+    start is inclusive and end exclusive. Rows come through a server-side
+    cursor where the backend has one, so memory stays flat for any range.
+    """
+    queryset = Transaction.objects.all()
+    if user_ids:
+        queryset = queryset.filter(user_id__in=user_ids)
+    if start is not None:
+        queryset = queryset.filter(created_at__gte=start)
+    if end is not None:
+        queryset = queryset.filter(created_at__lt=end)
+    return (
+        queryset.order_by('id')
+        .values_list(*EXPORT_COLUMNS)
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def _format_datetime(value):
+    # Same rendering as DRF's DateTimeField, so exports match the history API.
+    value = timezone.localtime(value).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def _format_balance(value):
+    return None if value is None else str(value)
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for pk, user_id, amount, transaction_type, description, created_at, balance_after in rows:
+        yield writer.writerow([
+            pk, user_id, str(amount), transaction_type, description, _format_datetime(created_at),
+            _format_balance(balance_after) or '',
+        ])
+
+
+def iter_jsonl(rows):
+    for pk, user_id, amount, transaction_type, description, created_at, balance_after in rows:
+        yield json.dumps({
+            'id': pk,
+            'user': user_id,
+            'amount': str(amount),
+            'transaction_type': transaction_type,
+            'description': description,
+            'created_at': _format_datetime(created_at),
+            'balance_after': _format_balance(balance_after),
+        }) + '\n'
+
+
+def iter_export(rows, export_format):
+    if export_format == 'csv':
+        return iter_csv(rows)
+    if export_format == 'jsonl':
+        return iter_jsonl(rows)
+    raise ExportError(f'format must be one of: {", ".join(EXPORT_FORMATS)}.')
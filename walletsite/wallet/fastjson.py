@@ -0,0 +1,112 @@
+"""
+Serializer-free rendering for the list endpoints.
+
+With WALLET_FAST_SERIALIZATION on, the transaction and user lists fetch
+their rows with values_list() and turn them into the dicts
+TransactionSerializer and UserSerializer would produce, formatting Decimals
+and datetimes exactly as the DRF fields do. FastJSONRenderer then encodes
+them with orjson instead of the json module, which also formats the
+datetimes, in C. The bytes on the wire are the same as the serializer
+path's; tests compare the two.
+"""
+from datetime import timezone as dt_timezone
+from decimal import Context, Decimal
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import Transaction
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+TRANSACTION_COLUMNS = ('id', 'user_id', 'amount', 'transaction_type', 'description', 'created_at', 'balance_after')
+_AMOUNT = Transaction._meta.get_field('amount')
+_AMOUNT_QUANTUM = Decimal(1).scaleb(-_AMOUNT.decimal_places)
+_AMOUNT_CONTEXT = Context(prec=_AMOUNT.max_digits)
+
+
+def enabled():
+    return settings.WALLET_FAST_SERIALIZATION
+
+
+def _local_datetime():
+    # DRF's DateTimeField renders in the current time zone. The renderers
+    # format datetimes the way it does, so only the conversion is left here.
+    zone = timezone.get_current_timezone()
+    utc = zone is dt_timezone.utc or getattr(zone, 'key', None) in ('UTC', 'Etc/UTC')
+
+    def convert(value):
+        if utc and value.tzinfo is dt_timezone.utc:
+            # What the database backends return; skips a zoneinfo conversion.
+            return value
+        return value.astimezone(zone)
+
+    return convert
+
+
+def transaction_rows(rows):
+    """
+    TransactionSerializer output for rows: values_list(*TRANSACTION_COLUMNS,
+    named=True) tuples or Transaction instances. created_at stays a datetime
+    and is formatted by the renderer, which gives the same string.
+    """
+    local_datetime = _local_datetime()
+    quantum, context = _AMOUNT_QUANTUM, _AMOUNT_CONTEXT
+    return [
+        {
+            'id': row.id,
+            'user': row.user_id,
+            'amount': format(row.amount.quantize(quantum, context=context), 'f'),
+            'transaction_type': row.transaction_type,
+            'description': row.description,
+            'created_at': local_datetime(row.created_at),
+            'balance_after': (
+                None if row.balance_after is None
+                else format(row.balance_after.quantize(quantum, context=context), 'f')
+            ),
+        }
+        for row in rows
+    ]
+
+
+def user_columns(fields):
+    """Columns to fetch for a user page: the rendered fields plus the id the cursor needs."""
+    return tuple(dict.fromkeys(('id', *fields)))
+
+
+def user_rows(rows, fields):
+    """UserSerializer(fields=fields) output for values_list(*user_columns(fields), named=True) tuples."""
+    return [{name: getattr(row, name) for name in fields} for row in rows]
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson, byte for byte the same for the
+    str/int/None/datetime/dict/list payloads of the list endpoints (floats
+    may be written differently, and none are sent). Indented output,
+    ASCII-only settings, or a payload orjson can't encode fall back to
+    JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or self.ensure_ascii or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            rendered = orjson.dumps(
+                data,
+                default=JSONEncoder().default,
+                # OPT_UTC_Z writes datetimes exactly like DRF's encoder.
+                option=orjson.OPT_UTC_Z | orjson.OPT_PASSTHROUGH_DATACLASS,
+            )
+        except (orjson.JSONEncodeError, TypeError):
+            return super().render(data, accepted_media_type, renderer_context)
+        # JSONRenderer escapes these two so the output is also valid JavaScript.
+        return rendered.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
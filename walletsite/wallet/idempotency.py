@@ -0,0 +1,101 @@
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, router, transaction as db_transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = IdempotencyKey._meta.get_field('key').max_length
+
+
+def get_ttl() -> timedelta:
+    return timedelta(seconds=settings.WALLET_IDEMPOTENCY_TTL)
+
+
+def fingerprint_request(request) -> str:
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f'{request.method} {request.get_full_path()}\n{body}'.encode('utf-8')).hexdigest()
+
+
+def _replay(record, fingerprint):
+    if record.fingerprint != fingerprint:
+        return Response(
+            {'detail': f'{IDEMPOTENCY_HEADER} was already used for a different request.'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    response = Response(record.response_body, status=record.status_code)
+    response[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def _lookup(key, using):
+    """Return the live record for key, dropping it if it has outlived the TTL."""
+    record = IdempotencyKey.objects.using(using).filter(key=key).first()
+    if record is not None and record.created_at < timezone.now() - get_ttl():
+        IdempotencyKey.objects.using(using).filter(pk=record.pk, created_at=record.created_at).delete()
+        return None
+    return record
+
+
+def idempotent(request, handler):
+    """
+    Run handler() at most once per Idempotency-Key.
+
+    Replays are answered from the stored record before any wallet row is
+    touched. A first request reserves its key inside the same transaction
+    as the wallet write, so the key and the balance change commit or roll
+    back together; a concurrent request with the same key waits on the
+    unique index rather than on the wallet row, then replays the winner.
+    """
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if not key:
+        return handler()
+    if len(key) > MAX_KEY_LENGTH:
+        return Response(
+            {'detail': f'{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters.'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    using = router.db_for_write(IdempotencyKey)
+    fingerprint = fingerprint_request(request)
+    record = _lookup(key, using)
+    if record is not None:
+        return _replay(record, fingerprint)
+
+    with db_transaction.atomic(using=using):
+        try:
+            with db_transaction.atomic(using=using):
+                record = IdempotencyKey.objects.using(using).create(key=key, fingerprint=fingerprint)
+        except IntegrityError:
+            pass
+        else:
+            response = handler()
+            record.status_code = response.status_code
+            record.response_body = response.data
+            record.save(using=using, update_fields=['status_code', 'response_body'])
+            return response
+
+    return _replay(IdempotencyKey.objects.using(using).get(key=key), fingerprint)
+
+
+def purge_expired(batch_size=1000, using=None) -> int:
+    """Delete expired keys in batches; returns the number of rows removed."""
+    using = using or router.db_for_write(IdempotencyKey)
+    cutoff = timezone.now() - get_ttl()
+    deleted = 0
+    while True:
+        pks = list(
+            IdempotencyKey.objects.using(using)
+            .filter(created_at__lt=cutoff)
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not pks:
+            return deleted
+        deleted += IdempotencyKey.objects.using(using).filter(pk__in=pks).delete()[0]
@@ -0,0 +1,259 @@
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.db import router, transaction as db_transaction
+from django.db.models import Case, DecimalField, F, Max, Min, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import shards
+from .cache import invalidate_on_commit
+from .models import BalanceCheckpoint, LedgerOutbox, Transaction, Wallet, WalletShard
+
+ZERO = Decimal('0.00')
+
+
+@dataclass
+class LedgerBalance:
+    user_id: int
+    wallet_balance: Decimal
+    checkpoint_balance: Decimal
+    checkpoint_transaction_id: int
+    delta: Decimal = ZERO
+    last_transaction_id: int = 0
+    pending: Decimal = ZERO
+
+    @property
+    def ledger_balance(self) -> Decimal:
+        """Balance according to Transaction rows alone; what a checkpoint records."""
+        return self.checkpoint_balance + self.delta
+
+    @property
+    def balance(self) -> Decimal:
+        """Ledger balance including rows still queued in the outbox."""
+        return self.ledger_balance + self.pending
+
+    @property
+    def has_new_transactions(self) -> bool:
+        return self.last_transaction_id > self.checkpoint_transaction_id
+
+    @property
+    def matches(self) -> bool:
+        return self.balance == self.wallet_balance
+
+
+def _amount(value) -> Decimal:
+    # SQLite sums decimals as floats; back to cents before comparing balances.
+    return Decimal(value).quantize(ZERO)
+
+
+def _signed_amount():
+    return Case(
+        When(transaction_type=Transaction.CREDIT, then=F('amount')),
+        default=-F('amount'),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+
+
+def _latest_checkpoint():
+    return BalanceCheckpoint.objects.filter(user_id=OuterRef('user_id')).order_by('-last_transaction_id')
+
+
+def iter_user_id_chunks(chunk_size, using=None):
+    """Yield ascending lists of wallet user_ids, chunk_size at a time, by keyset."""
+    queryset = Wallet.objects.using(using).order_by('user_id').values_list('user_id', flat=True)
+    last = None
+    while True:
+        chunk = list((queryset if last is None else queryset.filter(user_id__gt=last))[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last = chunk[-1]
+
+
+def locked_ledger_balances(user_ids, using):
+    """
+    Lock the wallets of user_ids and compute each one's ledger balance.
+
+    Only transactions after the user's latest checkpoint are summed, plus any
+    rows still queued in LedgerOutbox. Every wallet write and the outbox
+    drainer take the wallet row lock before inserting ledger rows (credits to
+    a sharded wallet take their shard's lock instead, so shards are locked
+    too), so once we hold the locks no lower transaction id can still be in
+    flight for these users. Wallet balances include shard balances. Must be
+    called inside a transaction on `using`.
+    """
+    latest = _latest_checkpoint()
+    wallets = (
+        Wallet.objects.using(using)
+        .select_for_update()
+        .filter(user_id__in=user_ids)
+        .order_by('user_id')
+        .annotate(
+            checkpoint_balance=Subquery(latest.values('balance')[:1]),
+            checkpoint_transaction_id=Subquery(latest.values('last_transaction_id')[:1]),
+        )
+    )
+    wallets = list(wallets)
+    shard_totals = shards.lock_shards([wallet.pk for wallet in wallets if wallet.shard_count], using)
+    balances = {
+        wallet.user_id: LedgerBalance(
+            user_id=wallet.user_id,
+            wallet_balance=wallet.balance + shard_totals.get(wallet.pk, ZERO),
+            checkpoint_balance=wallet.checkpoint_balance if wallet.checkpoint_balance is not None else ZERO,
+            checkpoint_transaction_id=wallet.checkpoint_transaction_id or 0,
+        )
+        for wallet in wallets
+    }
+
+    signed_amount = _signed_amount()
+    deltas = (
+        Transaction.objects.using(using)
+        .filter(user_id__in=user_ids)
+        .filter(id__gt=Coalesce(Subquery(latest.values('last_transaction_id')[:1]), Value(0)))
+        .order_by()
+        .values('user_id')
+        .annotate(delta=Sum(signed_amount), last_id=Max('id'))
+    )
+    for row in deltas:
+        entry = balances.get(row['user_id'])
+        if entry is not None:
+            entry.delta = _amount(row['delta'])
+            entry.last_transaction_id = row['last_id']
+
+    pending = (
+        LedgerOutbox.objects.using(using)
+        .filter(user_id__in=user_ids)
+        .order_by()
+        .values('user_id')
+        .annotate(pending=Sum(signed_amount))
+    )
+    for row in pending:
+        entry = balances.get(row['user_id'])
+        if entry is not None:
+            entry.pending = _amount(row['pending'])
+    return list(balances.values())
+
+
+def checkpoint_balances(chunk_size=500, using=None):
+    """Write a new checkpoint for every user with transactions since their last one."""
+    using = using or router.db_for_write(BalanceCheckpoint)
+    written = 0
+    for user_ids in iter_user_id_chunks(chunk_size, using):
+        with db_transaction.atomic(using=using):
+            checkpoints = [
+                BalanceCheckpoint(
+                    user_id=entry.user_id,
+                    balance=entry.ledger_balance,
+                    last_transaction_id=entry.last_transaction_id,
+                )
+                for entry in locked_ledger_balances(user_ids, using)
+                if entry.has_new_transactions
+            ]
+            BalanceCheckpoint.objects.using(using).bulk_create(checkpoints)
+        written += len(checkpoints)
+    return written
+
+
+def reconcile_balances(chunk_size=500, repair=False, using=None):
+    """
+    Compare every Wallet.balance with its ledger balance, chunk by chunk.
+
+    Yields each mismatching LedgerBalance. With repair=True the wallet is set
+    to the ledger balance (and its shards, if any, to zero) inside the same
+    locked transaction.
+    """
+    using = using or router.db_for_write(Wallet)
+    for user_ids in iter_user_id_chunks(chunk_size, using):
+        with db_transaction.atomic(using=using):
+            mismatches = [entry for entry in locked_ledger_balances(user_ids, using) if not entry.matches]
+            if repair:
+                now = timezone.now()
+                for entry in mismatches:
+                    Wallet.objects.using(using).filter(user_id=entry.user_id).update(
+                        balance=entry.balance, updated_at=now,
+                    )
+                WalletShard.objects.using(using).filter(
+                    wallet__user_id__in=[entry.user_id for entry in mismatches],
+                ).update(balance=ZERO)
+                invalidate_on_commit([entry.user_id for entry in mismatches], using=using)
+        yield from mismatches
+
+
+def balance_at(user_id, moment, using=None):
+    """
+    Balance of user_id's wallet as of `moment`: the balance_after of the
+    newest transaction at or before it, one lookup on the (user, -created_at,
+    -id) index. If that row has no balance_after (a sharded credit not yet
+    backfilled), the amounts since the newest row that has one are added to
+    it. Returns None when the table has no transaction that old.
+    """
+    using = using or router.db_for_read(Transaction)
+    rows = Transaction.objects.using(using).filter(user_id=user_id, created_at__lte=moment).order_by('-created_at', '-id')
+    newest = rows.values_list('balance_after', 'pk').first()
+    if newest is None:
+        return None
+    if newest[0] is not None:
+        return newest[0]
+    known = rows.filter(balance_after__isnull=False).values_list('created_at', 'pk', 'balance_after').first()
+    balance = ZERO
+    if known is not None:
+        created_at, pk, balance = known
+        rows = rows.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk))
+    since = rows.order_by().aggregate(delta=Sum(_signed_amount()))['delta']
+    return balance + _amount(since or 0)
+
+
+def backfill_balance_after(chunk_size=500, batch_size=1000, using=None):
+    """
+    Fill in balance_after on the Transaction rows that lack it, chunk_size
+    users at a time.
+
+    The wallets of a chunk are locked as for a checkpoint, so no row can
+    appear while their ledger is walked. Each user's rows are then read
+    newest first, batch_size at a time by keyset, starting from the ledger
+    balance (checkpoint plus later rows) and subtracting each amount on the
+    way down, as far as the oldest row without a balance_after. Rows that
+    already have one are left alone. Returns the number of rows filled in.
+    """
+    using = using or router.db_for_write(Transaction)
+    filled = 0
+    for user_ids in iter_user_id_chunks(chunk_size, using):
+        with db_transaction.atomic(using=using):
+            oldest_missing = dict(
+                Transaction.objects.using(using)
+                .filter(user_id__in=user_ids, balance_after__isnull=True)
+                .order_by()
+                .values('user_id')
+                .annotate(oldest=Min('id'))
+                .values_list('user_id', 'oldest')
+            )
+            if not oldest_missing:
+                continue
+            for entry in locked_ledger_balances(sorted(oldest_missing), using):
+                filled += _backfill_user(entry, oldest_missing[entry.user_id], batch_size, using)
+    return filled
+
+
+def _backfill_user(entry, oldest_missing, batch_size, using):
+    rows = (
+        Transaction.objects.using(using)
+        .filter(user_id=entry.user_id, id__gte=oldest_missing)
+        .order_by('-id')
+        .values_list('id', 'amount', 'transaction_type', 'balance_after')
+    )
+    balance = entry.ledger_balance
+    filled = 0
+    last = None
+    while True:
+        batch = list((rows if last is None else rows.filter(id__lt=last))[:batch_size])
+        if not batch:
+            return filled
+        missing = []
+        for pk, amount, transaction_type, balance_after in batch:
+            if balance_after is None:
+                missing.append(Transaction(pk=pk, balance_after=balance))
+            balance -= amount if transaction_type == Transaction.CREDIT else -amount
+        Transaction.objects.using(using).bulk_update(missing, ['balance_after'])
+        filled += len(missing)
+        last = batch[-1][0]
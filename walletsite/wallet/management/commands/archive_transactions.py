@@ -0,0 +1,31 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from wallet.archive import ArchiveError, archive_before, archive_dir
+from wallet.export import DEFAULT_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = (
+        'Move every month of transactions before --before into compressed JSONL files under WALLET_ARCHIVE_DIR, '
+        'dropping their partitions (or deleting the rows where the table is not partitioned). '
+        'Months must be covered by a balance checkpoint first.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', required=True, help='First month to keep, as YYYY-MM.')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            cutoff = datetime.strptime(options['before'], '%Y-%m').date()
+        except ValueError:
+            raise CommandError('--before must be a month as YYYY-MM.')
+        try:
+            archived = archive_before(cutoff, chunk_size=options['chunk_size'])
+        except ArchiveError as exc:
+            raise CommandError(str(exc))
+        for month in archived:
+            self.stdout.write(f'{month.month:%Y-%m}: {month.rows} transactions of {month.users} users -> {month.path}')
+        self.stdout.write(self.style.SUCCESS(f'Archived {len(archived)} months to {archive_dir()}'))
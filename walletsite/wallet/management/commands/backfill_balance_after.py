@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from wallet.ledger import backfill_balance_after
+
+
+class Command(BaseCommand):
+    help = 'Fill in balance_after on transactions written without one, replaying each user\'s ledger newest first.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Users locked and processed per transaction.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows read and updated per query.')
+
+    def handle(self, *args, **options):
+        filled = backfill_balance_after(chunk_size=options['chunk_size'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Filled in balance_after on {filled} transactions'))
@@ -0,0 +1,31 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from wallet.benchmark import serialization_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the serializer and fast (values_list + orjson) rendering paths of the transaction and user '
+        'lists on pages of --rows rows, checking that both produce the same bytes. Creates and deletes scratch rows.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement; the fastest counts.')
+        parser.add_argument('--output', help='Also write the results as JSON to this file.')
+
+    def handle(self, *args, **options):
+        results = serialization_benchmark(options['rows'], options['repeat'])
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<13} rows={result["rows"]} '
+                f'serialize {result["serialize_ms"]["serializer"]:.1f}ms -> {result["serialize_ms"]["fast"]:.1f}ms '
+                f'({result["serialize_speedup"]}x)  '
+                f'with query {result["total_ms"]["serializer"]:.1f}ms -> {result["total_ms"]["fast"]:.1f}ms '
+                f'({result["total_speedup"]}x)'
+            )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as handle:
+                json.dump(results, handle, indent=2)
@@ -0,0 +1,89 @@
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, connections, router, transaction as db_transaction
+
+from wallet.models import Transaction, Wallet
+from wallet.services import WalletOperation, apply_operation
+from wallet.shards import set_shard_count
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure credit throughput to a single wallet under concurrent writers for each shard count. '
+        'Creates and deletes a scratch user; point it at a scratch database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--shards', default='0,2,4,8,16',
+            help='Comma-separated shard counts to measure; 0 is the unsharded baseline.',
+        )
+        parser.add_argument('--writers', type=int, default=16, help='Concurrent writer threads.')
+        parser.add_argument('--seconds', type=float, default=5.0, help='Duration of each run.')
+
+    def handle(self, *args, **options):
+        try:
+            shard_counts = [int(value) for value in options['shards'].split(',')]
+        except ValueError:
+            raise CommandError('--shards must be a comma-separated list of integers.')
+        if connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING(
+                'SQLite serializes all writers on one database lock, so sharding cannot '
+                'help here; run against PostgreSQL (DATABASE_URL) for meaningful numbers.'
+            ))
+
+        user = get_user_model().objects.create(username=f'bench-shards-{uuid.uuid4().hex[:12]}')
+        Wallet.objects.create(user=user)
+        using = router.db_for_write(Wallet)
+        try:
+            baseline = None
+            for shard_count in shard_counts:
+                with db_transaction.atomic(using=using):
+                    set_shard_count(user.pk, shard_count, using)
+                credits, errors = self.run(user.pk, options['writers'], options['seconds'])
+                rate = credits / options['seconds']
+                baseline = baseline or rate
+                self.stdout.write(
+                    f'shards={shard_count:<4} writers={options["writers"]} credits/s={rate:9.1f} '
+                    f'speedup={rate / baseline if baseline else 0:5.2f}x errors={errors}'
+                )
+            with db_transaction.atomic(using=using):
+                wallet = set_shard_count(user.pk, 0, using)
+            expected = sum(Transaction.objects.filter(user=user).values_list('amount', flat=True))
+            if wallet.balance != expected:
+                raise CommandError(f'Balance {wallet.balance} does not match the ledger total {expected}.')
+        finally:
+            user.delete()
+
+    def run(self, user_id, writers, seconds):
+        op = WalletOperation(user_id, Decimal('0.01'), Transaction.CREDIT, 'bench')
+        counts = [0] * writers
+        errors = [0] * writers
+        start = threading.Barrier(writers + 1)
+        deadline = []
+
+        def writer(slot):
+            try:
+                start.wait()
+                while time.monotonic() < deadline[0]:
+                    try:
+                        apply_operation(op)
+                        counts[slot] += 1
+                    except DatabaseError:
+                        errors[slot] += 1
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=writer, args=(slot,)) for slot in range(writers)]
+        for thread in threads:
+            thread.start()
+        deadline.append(time.monotonic() + seconds)
+        start.wait()
+        for thread in threads:
+            thread.join()
+        return sum(counts), sum(errors)
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from config.schema import write_artifact
+
+
+class Command(BaseCommand):
+    help = 'Generate the OpenAPI schema once and write it to OPENAPI_SCHEMA_PATH for the schema views to serve.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Where to write the artifact; defaults to OPENAPI_SCHEMA_PATH.')
+
+    def handle(self, *args, **options):
+        target = options['output'] or settings.OPENAPI_SCHEMA_PATH
+        built = write_artifact(target)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {len(built.body)} byte OpenAPI schema to {target}'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from wallet.ledger import checkpoint_balances
+
+
+class Command(BaseCommand):
+    help = 'Record a balance checkpoint for every user with ledger activity since their last checkpoint.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        written = checkpoint_balances(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} balance checkpoints'))
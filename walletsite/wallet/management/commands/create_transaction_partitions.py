@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from wallet.partitions import ensure_partitions, is_partitioned
+
+
+class Command(BaseCommand):
+    help = (
+        'Create the monthly Transaction partitions for this month and the next few (PostgreSQL). '
+        'Run it from cron; rows of months without a partition land in the default partition until then.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=3)
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            self.stdout.write('The transaction table is not partitioned on this database; nothing to do.')
+            return
+        created = ensure_partitions(options['months_ahead'])
+        for name in created:
+            self.stdout.write(f'Created {name}')
+        self.stdout.write(self.style.SUCCESS(f'{len(created)} partitions created'))
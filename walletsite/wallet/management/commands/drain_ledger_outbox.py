@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from wallet.outbox import drain_batch, outbox_lag
+
+
+class Command(BaseCommand):
+    help = 'Move queued LedgerOutbox rows into Transaction in batches and report the remaining lag.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--follow', action='store_true',
+            help='Keep running, polling every --interval seconds once the outbox is empty.',
+        )
+        parser.add_argument('--interval', type=float, default=1.0)
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            moved = drain_batch(batch_size=options['batch_size'])
+            total += moved
+            if moved:
+                continue
+            lag = outbox_lag()
+            self.stdout.write(
+                f"moved={total} pending={lag['pending']} oldest_age={lag['oldest_age_seconds']:.1f}s"
+            )
+            if not options['follow']:
+                return
+            total = 0
+            time.sleep(options['interval'])
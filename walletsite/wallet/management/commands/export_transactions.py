@@ -0,0 +1,37 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from wallet.export import (
+    DEFAULT_CHUNK_SIZE, EXPORT_FORMATS, ExportError, export_rows, iter_export, parse_bound, parse_user_ids,
+)
+
+
+class Command(BaseCommand):
+    help = 'Stream transactions to CSV or JSONL using a server-side cursor.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+        parser.add_argument('--user', action='append', default=[], help='User id (repeatable or comma-separated).')
+        parser.add_argument('--start', help='Inclusive lower bound on created_at (ISO date or datetime).')
+        parser.add_argument('--end', help='Exclusive upper bound on created_at (ISO date or datetime).')
+        parser.add_argument('--output', help='File to write to; defaults to stdout.')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            rows = export_rows(
+                parse_user_ids(options['user']),
+                parse_bound(options['start'], 'start'),
+                parse_bound(options['end'], 'end'),
+                chunk_size=options['chunk_size'],
+            )
+            stream = iter_export(rows, options['format'])
+        except ExportError as exc:
+            raise CommandError(str(exc))
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as handle:
+                handle.writelines(stream)
+        else:
+            sys.stdout.writelines(stream)
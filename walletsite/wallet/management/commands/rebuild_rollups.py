@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from wallet.rollups import rebuild_all
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute DailyTransactionRollup from Transaction, a chunk of users at a time under their wallet locks. '
+        'Run once after the rollup migration to cover existing history.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        written = rebuild_all(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} daily rollup rows'))
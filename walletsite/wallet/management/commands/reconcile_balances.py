@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from wallet.ledger import reconcile_balances
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare wallet balances with the ledger, reading only transactions after each '
+        "user's latest checkpoint. With --repair, mismatching wallets are reset to the ledger balance."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--repair', action='store_true', help='Overwrite mismatching wallet balances.')
+
+    def handle(self, *args, **options):
+        mismatches = 0
+        for entry in reconcile_balances(chunk_size=options['chunk_size'], repair=options['repair']):
+            mismatches += 1
+            self.stdout.write(
+                f'user={entry.user_id} wallet={entry.wallet_balance} ledger={entry.balance}'
+                + (' (repaired)' if options['repair'] else '')
+            )
+
+        if mismatches and not options['repair']:
+            self.stdout.write(self.style.WARNING(f'{mismatches} wallets differ from the ledger'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Reconciled; {mismatches} wallets repaired'))
@@ -0,0 +1,63 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from wallet.benchmark import SCENARIOS, compare, run
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test wallet_update, the transactions list and the users list in-process and report '
+        'p50/p95/p99 latency, throughput and queries per request. Seeds loadtest-* users and their '
+        'transactions on first use; point it at a scratch database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenario', action='append', choices=SCENARIOS,
+            help='Scenario to run (repeatable); defaults to all of them.',
+        )
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--transactions', type=int, default=100000)
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per scenario.')
+        parser.add_argument('--concurrency', type=int, default=8, help='Client threads per scenario.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON report to this file.')
+        parser.add_argument('--baseline', help='Earlier JSON report to compare against.')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError('--concurrency and --requests must be at least 1.')
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as handle:
+                baseline = json.load(handle)
+
+        try:
+            report = run(
+                options['scenario'] or SCENARIOS,
+                users=options['users'],
+                transactions=options['transactions'],
+                requests=options['requests'],
+                concurrency=options['concurrency'],
+                seed=options['seed'],
+                log=self.stdout.write,
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        if baseline is not None:
+            report['compared_to'] = {
+                'git_revision': baseline.get('environment', {}).get('git_revision'),
+                'ratios': compare(report, baseline),
+            }
+            for scenario, ratios in report['compared_to']['ratios'].items():
+                self.stdout.write(
+                    f'{scenario:<18} vs baseline: rps x{ratios["throughput_rps"]} '
+                    f'p95 x{ratios["p95_ms"]} p99 x{ratios["p99_ms"]} queries/req x{ratios["queries_per_request"]}'
+                )
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as handle:
+                json.dump(report, handle, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Wrote {options["output"]}'))
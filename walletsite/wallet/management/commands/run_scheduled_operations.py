@@ -0,0 +1,68 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+
+from wallet.models import ScheduledOperation
+from wallet.scheduling import run_due
+
+
+class Command(BaseCommand):
+    help = (
+        'Apply due scheduled operations in batches. Several copies (or --workers threads) can run at once; '
+        'each due occurrence is claimed by exactly one of them.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--workers', type=int, default=1, help='Worker threads in this process.')
+        parser.add_argument(
+            '--follow', action='store_true',
+            help='Keep running, polling every --interval seconds once nothing is due.',
+        )
+        parser.add_argument('--interval', type=float, default=1.0)
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        if workers < 1 or options['batch_size'] < 1:
+            raise CommandError('--workers and --batch-size must be at least 1.')
+        connection = connections[router.db_for_write(ScheduledOperation)]
+        if workers > 1 and not connection.features.has_select_for_update_skip_locked:
+            raise CommandError(
+                f'--workers > 1 needs SELECT ... FOR UPDATE SKIP LOCKED, which {connection.vendor} lacks.'
+            )
+        while True:
+            started = time.perf_counter()
+            applied, failed = self.run(workers, options['batch_size'])
+            elapsed = time.perf_counter() - started
+            if applied or failed or not options['follow']:
+                self.stdout.write(
+                    f'applied={applied} failed={failed} workers={workers} seconds={elapsed:.2f} '
+                    f'rate={(applied + failed) / elapsed if elapsed else 0:.1f}/s'
+                )
+            if not options['follow']:
+                return
+            time.sleep(options['interval'])
+
+    def run(self, workers, batch_size):
+        if workers == 1:
+            return run_due(batch_size)
+        totals, errors = [], []
+
+        def work():
+            try:
+                totals.append(run_due(batch_size))
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=work) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+        return sum(applied for applied, _ in totals), sum(failed for _, failed in totals)
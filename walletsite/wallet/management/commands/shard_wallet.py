@@ -0,0 +1,34 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import router, transaction as db_transaction
+
+from wallet.cache import invalidate_on_commit
+from wallet.models import Wallet
+from wallet.shards import set_shard_count
+
+
+class Command(BaseCommand):
+    help = (
+        "Spread a hot wallet's credits over N balance shards, or fold the shards back with 0. "
+        'The balance is unchanged either way.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('user_id', type=int)
+        parser.add_argument('shards', type=int, help='Number of shards; 0 turns sharding off.')
+
+    def handle(self, *args, **options):
+        user_id, shard_count = options['user_id'], options['shards']
+        if not 0 <= shard_count <= 1024:
+            raise CommandError('shards must be between 0 and 1024.')
+        if not get_user_model().objects.filter(pk=user_id).exists():
+            raise CommandError(f'User {user_id} not found.')
+
+        using = router.db_for_write(Wallet)
+        with db_transaction.atomic(using=using):
+            Wallet.objects.using(using).get_or_create(user_id=user_id)
+            wallet = set_shard_count(user_id, shard_count, using)
+            invalidate_on_commit([user_id], using=using)
+        self.stdout.write(self.style.SUCCESS(
+            f'user={user_id} shards={wallet.shard_count} balance={wallet.balance}'
+        ))
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.23 on 2026-10-17 21:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0005_ledgeroutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wallet',
+            name='shard_count',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='WalletShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveSmallIntegerField()),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='wallet.wallet')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='walletshard',
+            constraint=models.UniqueConstraint(fields=('wallet', 'index'), name='wallet_shard_wallet_index_uniq'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.23 on 2026-10-17 21:56
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('wallet', '0006_walletshard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyTransactionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('shard', models.PositiveSmallIntegerField(default=0)),
+                ('credit_total', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('credit_count', models.PositiveIntegerField(default=0)),
+                ('debit_total', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('debit_count', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dailytransactionrollup',
+            constraint=models.UniqueConstraint(fields=('user', 'day', 'shard'), name='wallet_rollup_user_day_shard_uniq'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.23 on 2026-10-17 21:58
+
+from django.db import migrations, models
+
+TRIGRAM_INDEX = 'wallet_txn_description_trgm_idx'
+
+
+def create_trigram_index(apps, schema_editor):
+    # Matches the UPPER(...::text) LIKE that icontains compiles to on PostgreSQL.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {TRIGRAM_INDEX} ON wallet_transaction '
+        'USING gin (UPPER(description::text) gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {TRIGRAM_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0007_dailytransactionrollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(condition=models.Q(('transaction_type', 'credit')), fields=['user', '-created_at', '-id'], name='wallet_txn_user_credit_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(condition=models.Q(('transaction_type', 'debit')), fields=['user', '-created_at', '-id'], name='wallet_txn_user_debit_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'amount'], name='wallet_txn_user_amount_idx'),
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,138 @@
+# Generated by Django 4.2.23 on 2026-10-17 22:02
+
+from datetime import date, datetime, timezone
+
+from django.db import migrations
+
+TABLE = 'wallet_transaction'
+UNPARTITIONED = 'wallet_transaction_unpartitioned'
+MONTHS_AHEAD = 3
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _bound(month):
+    return f"'{month.isoformat()} 00:00:00+00'"
+
+
+def _table_layout(cursor, table):
+    """Secondary index definitions, CHECK/FOREIGN KEY constraints and max(id) of table."""
+    cursor.execute(
+        'SELECT pg_indexes.indexdef FROM pg_indexes '
+        'JOIN pg_class ON pg_class.relname = pg_indexes.indexname '
+        'JOIN pg_index ON pg_index.indexrelid = pg_class.oid '
+        'WHERE pg_indexes.schemaname = current_schema() AND pg_indexes.tablename = %s '
+        'AND NOT pg_index.indisprimary',
+        [table],
+    )
+    indexes = [row[0] for row in cursor.fetchall()]
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = to_regclass(%s) AND contype IN ('c', 'f')",
+        [table],
+    )
+    constraints = cursor.fetchall()
+    cursor.execute(f'SELECT min(created_at), max(id) FROM {table}')
+    oldest, last_id = cursor.fetchone()
+    return indexes, constraints, oldest, last_id
+
+
+def _is_partitioned(cursor):
+    cursor.execute('SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)', [TABLE])
+    return cursor.fetchone() is not None
+
+
+def _rebuild(schema_editor, partitioned):
+    """
+    Copy wallet_transaction into a new table, partitioned or plain, and
+    put its sequence, primary key, indexes and constraints back under their
+    old names. Takes an ACCESS EXCLUSIVE lock on the table first and holds
+    it until the migration commits, so every read and write of the ledger
+    waits for the copy and the index builds, and no row can slip in between
+    reading max(id) and creating the new sequence.
+    """
+    execute = schema_editor.execute
+    execute(f'LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE')
+    with schema_editor.connection.cursor() as cursor:
+        indexes, constraints, oldest, last_id = _table_layout(cursor, TABLE)
+
+    execute(f'ALTER TABLE {TABLE} RENAME TO {UNPARTITIONED}')
+    if partitioned:
+        today = datetime.now(timezone.utc).date().replace(day=1)
+        first = oldest.astimezone(timezone.utc).date().replace(day=1) if oldest else today
+        first = min(first, today)
+        execute(f'CREATE TABLE {TABLE} (LIKE {UNPARTITIONED} INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)')
+        month = first
+        while month <= _add_months(today, MONTHS_AHEAD):
+            following = _add_months(month, 1)
+            execute(
+                f'CREATE TABLE {TABLE}_y{month.year:04d}m{month.month:02d} PARTITION OF {TABLE} '
+                f'FOR VALUES FROM ({_bound(month)}) TO ({_bound(following)})'
+            )
+            month = following
+        execute(f'CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT')
+    else:
+        execute(f'CREATE TABLE {TABLE} (LIKE {UNPARTITIONED} INCLUDING DEFAULTS)')
+    execute(f'INSERT INTO {TABLE} SELECT * FROM {UNPARTITIONED}')
+    # The copied id default (a serial or the one set below) still points at
+    # the old sequence, which is dropped with the old table.
+    execute(f'ALTER TABLE {TABLE} ALTER COLUMN id DROP DEFAULT')
+    # Dropping the old table (and its partitions) frees its index, constraint
+    # and sequence names.
+    execute(f'DROP TABLE {UNPARTITIONED}')
+
+    execute(f'CREATE SEQUENCE {TABLE}_id_seq START WITH {(last_id or 0) + 1}')
+    execute(f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{TABLE}_id_seq')")
+    execute(f'ALTER SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id')
+    execute(f'ALTER TABLE {TABLE} ADD PRIMARY KEY {"(id, created_at)" if partitioned else "(id)"}')
+    for definition in indexes:
+        # Definitions read from a partitioned parent say ON ONLY, which would
+        # leave the new partitions without the index.
+        execute(definition.replace(' ON ONLY ', ' ON ', 1))
+    for name, definition in constraints:
+        execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}')
+
+
+def partition_transactions(apps, schema_editor):
+    """
+    Rebuild wallet_transaction as a table RANGE-partitioned by month on
+    created_at. PostgreSQL needs the partition key in the primary key, so it
+    becomes (id, created_at); ids still come from one sequence, which
+    continues after the old max(id). Indexes and constraints are recreated
+    under their old names on the partitioned parent, which propagates them
+    to every partition.
+
+    Needs downtime: the ledger is locked against reads and writes for the
+    whole migration (see _rebuild), which takes as long as copying the table
+    and rebuilding its indexes, and needs room for a second copy of both.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        if _is_partitioned(cursor):
+            return
+    _rebuild(schema_editor, partitioned=True)
+
+
+def unpartition_transactions(apps, schema_editor):
+    """Turn the partitioned table back into a plain one with an (id) primary key."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        if not _is_partitioned(cursor):
+            return
+    _rebuild(schema_editor, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0008_transaction_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_transactions, unpartition_transactions),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.23 on 2026-10-17 22:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0009_partition_transactions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ledgeroutbox',
+            name='transfer_id',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='transfer_id',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(condition=models.Q(('transfer_id__isnull', False)), fields=['transfer_id'], name='wallet_txn_transfer_idx'),
+        ),
+    ]
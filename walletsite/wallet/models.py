@@ -8,6 +8,9 @@ User = get_user_model()
 class Wallet(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='wallet')
     balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # 0 = unsharded. Otherwise credits land in one of shard_count WalletShard
+    # rows and the balance is this row's balance plus theirs (see shards.py).
+    shard_count = models.PositiveSmallIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -15,6 +18,21 @@ class Wallet(models.Model):
         return f"Wallet(user={self.user_id}, balance={self.balance})"
 
 
+class WalletShard(models.Model):
+    """Part of a sharded wallet's balance; credits pick one shard at random."""
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name='shards')
+    index = models.PositiveSmallIntegerField()
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['wallet', 'index'], name='wallet_shard_wallet_index_uniq'),
+        ]
+
+    def __str__(self) -> str:
+        return f"WalletShard(wallet={self.wallet_id}, index={self.index}, balance={self.balance})"
+
+
 class Transaction(models.Model):
     CREDIT = 'credit'
     DEBIT = 'debit'
@@ -28,11 +46,168 @@ class Transaction(models.Model):
     transaction_type = models.CharField(max_length=10, choices=TRANSACTION_TYPES)
     description = models.CharField(max_length=255, blank=True)
     created_at = models.DateTimeField(default=timezone.now)
+    # Shared by the debit and the credit written for one transfer.
+    transfer_id = models.UUIDField(null=True, blank=True, editable=False)
+    # The wallet balance right after this row, written under the wallet lock.
+    # Null for credits to a sharded wallet, and for rows written before the
+    # column existed, until backfill_balance_after fills them in.
+    balance_after = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, editable=False)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='wallet_txn_user_created_id_idx'),
+            models.Index(fields=['user', 'id'], name='wallet_txn_user_id_idx'),
+            # ?transaction_type= pages: one partial index per type keeps the
+            # history order without storing the type in every entry.
+            models.Index(
+                fields=['user', '-created_at', '-id'], name='wallet_txn_user_credit_idx',
+                condition=models.Q(transaction_type='credit'),
+            ),
+            models.Index(
+                fields=['user', '-created_at', '-id'], name='wallet_txn_user_debit_idx',
+                condition=models.Q(transaction_type='debit'),
+            ),
+            # ?min_amount= / ?max_amount= ranges.
+            models.Index(fields=['user', 'amount'], name='wallet_txn_user_amount_idx'),
+            # Finds the other half of a transfer; most rows have no transfer_id.
+            models.Index(
+                fields=['transfer_id'], name='wallet_txn_transfer_idx',
+                condition=models.Q(transfer_id__isnull=False),
+            ),
+            # On PostgreSQL, migration 0008 also adds wallet_txn_description_trgm_idx,
+            # a pg_trgm GIN index serving ?description= (not expressible here
+            # without tying the model to PostgreSQL).
+        ]
 
     def __str__(self) -> str:
         return f"Transaction(user={self.user_id}, type={self.transaction_type}, amount={self.amount})"
 
+
+class LedgerOutbox(models.Model):
+    """
+    A ledger row waiting to be moved into Transaction by drain_ledger_outbox.
+
+    Written instead of Transaction when WALLET_LEDGER_MODE is 'outbox'. The
+    table carries no secondary indexes, so the insert done under the wallet
+    row lock stays as cheap as possible.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', db_index=False)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    transaction_type = models.CharField(max_length=10, choices=Transaction.TRANSACTION_TYPES)
+    description = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    transfer_id = models.UUIDField(null=True, blank=True, editable=False)
+    balance_after = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, editable=False)
+
+    def __str__(self) -> str:
+        return f"LedgerOutbox(user={self.user_id}, type={self.transaction_type}, amount={self.amount})"
+
+
+class BalanceCheckpoint(models.Model):
+    """Ledger balance of a user up to and including transaction last_transaction_id."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='balance_checkpoints')
+    balance = models.DecimalField(max_digits=12, decimal_places=2)
+    last_transaction_id = models.BigIntegerField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'last_transaction_id'], name='wallet_checkpoint_user_txn_uniq'),
+        ]
+
+    def __str__(self) -> str:
+        return f"BalanceCheckpoint(user={self.user_id}, balance={self.balance}, upto={self.last_transaction_id})"
+
+
+class DailyTransactionRollup(models.Model):
+    """
+    Per-user, per-day credit and debit totals of Transaction rows, kept
+    current by the write paths (see rollups.py). Credits to a sharded wallet
+    spread over `shard` rows like the balance does; readers sum over it.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_rollups')
+    day = models.DateField()
+    shard = models.PositiveSmallIntegerField(default=0)
+    credit_total = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    credit_count = models.PositiveIntegerField(default=0)
+    debit_total = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    debit_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day', 'shard'], name='wallet_rollup_user_day_shard_uniq'),
+        ]
+
+    def __str__(self) -> str:
+        return f"DailyTransactionRollup(user={self.user_id}, day={self.day}, shard={self.shard})"
+
+
+class IdempotencyKey(models.Model):
+    """The first response given for an Idempotency-Key, replayed to retries until it expires."""
+    key = models.CharField(max_length=255, unique=True)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response_body = models.JSONField(null=True)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self) -> str:
+        return f"IdempotencyKey(key={self.key}, status={self.status_code})"
+
+
+class ScheduledOperation(models.Model):
+    """
+    A credit or debit to apply at run_at, once or on a recurrence.
+
+    run_scheduled_operations claims due rows and applies them; see
+    scheduling.py. Recurring rows go back to pending with the next run_at
+    until ends_at passes.
+    """
+    ONCE = 'once'
+    DAILY = 'daily'
+    WEEKLY = 'weekly'
+    MONTHLY = 'monthly'
+    RECURRENCES = [
+        (ONCE, 'Once'),
+        (DAILY, 'Daily'),
+        (WEEKLY, 'Weekly'),
+        (MONTHLY, 'Monthly'),
+    ]
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [
+        (PENDING, 'Pending'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='scheduled_operations')
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    transaction_type = models.CharField(max_length=10, choices=Transaction.TRANSACTION_TYPES)
+    description = models.CharField(max_length=255, blank=True)
+    recurrence = models.CharField(max_length=10, choices=RECURRENCES, default=ONCE)
+    # Occurrence n is due at first_run_at plus n periods, so late runs never shift the schedule.
+    first_run_at = models.DateTimeField()
+    run_at = models.DateTimeField()
+    ends_at = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    occurrences = models.PositiveIntegerField(default=0)
+    failures = models.PositiveIntegerField(default=0)
+    last_run_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # The worker's claim query; finished rows drop out of the index.
+            models.Index(
+                fields=['run_at', 'id'], name='wallet_sched_due_idx',
+                condition=models.Q(status='pending'),
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"ScheduledOperation(user={self.user_id}, {self.recurrence} {self.transaction_type} {self.amount}, next={self.run_at})"
+
 # Create your models here.
@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.db import connections, router, transaction as db_transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from . import rollups
+from .cache import invalidate_on_commit
+from .models import LedgerOutbox, Transaction, Wallet
+
+LEDGER_MODES = ('inline', 'outbox')
+
+
+def ledger_entry_model():
+    """The model wallet writes record their ledger rows in, per WALLET_LEDGER_MODE."""
+    mode = settings.WALLET_LEDGER_MODE
+    if mode not in LEDGER_MODES:
+        raise ValueError(f'WALLET_LEDGER_MODE must be one of {LEDGER_MODES}, not {mode!r}')
+    return LedgerOutbox if mode == 'outbox' else Transaction
+
+
+def drain_batch(batch_size=1000, using=None):
+    """
+    Move up to batch_size outbox rows into Transaction in one transaction.
+
+    Rows are claimed with SKIP LOCKED where supported so several drainers can
+    run side by side. The wallets of the claimed rows are locked (ascending
+    user_id, like every other multi-wallet writer) before the Transaction rows
+    are inserted, which keeps the "ledger rows only appear under the wallet
+    lock" rule that checkpointing relies on. Insert and delete commit
+    together, so a crash leaves each row either still queued or fully moved.
+    """
+    using = using or router.db_for_write(LedgerOutbox)
+    connection = connections[using]
+    with db_transaction.atomic(using=using):
+        queryset = LedgerOutbox.objects.using(using).order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        entries = list(queryset[:batch_size])
+        if not entries:
+            return 0
+
+        user_ids = sorted({entry.user_id for entry in entries})
+        list(
+            Wallet.objects.using(using).select_for_update()
+            .filter(user_id__in=user_ids).order_by('user_id').values_list('id', flat=True)
+        )
+        ledger = Transaction.objects.using(using).bulk_create([
+            Transaction(
+                user_id=entry.user_id,
+                amount=entry.amount,
+                transaction_type=entry.transaction_type,
+                description=entry.description,
+                created_at=entry.created_at,
+                transfer_id=entry.transfer_id,
+                balance_after=entry.balance_after,
+            )
+            for entry in entries
+        ])
+        rollups.record(ledger, using)
+        LedgerOutbox.objects.using(using).filter(pk__in=[entry.pk for entry in entries]).delete()
+        invalidate_on_commit(user_ids, using=using)
+    return len(entries)
+
+
+def outbox_lag(using=None):
+    """Number of queued rows and the age in seconds of the oldest one."""
+    using = using or router.db_for_read(LedgerOutbox)
+    stats = LedgerOutbox.objects.using(using).aggregate(pending=Count('id'), oldest=Min('created_at'))
+    oldest = stats['oldest']
+    return {
+        'pending': stats['pending'],
+        'oldest_age_seconds': (timezone.now() - oldest).total_seconds() if oldest else 0.0,
+    }
@@ -0,0 +1,167 @@
+import base64
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Forward-only keyset pagination with an opaque cursor.
+
+    Each page seeks past the last row of the previous one instead of using an
+    OFFSET, so deep pages cost the same as the first one. Subclasses define
+    the ordering, how to seek past a position and how positions are encoded.
+    """
+    page_size = 50
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+    ordering = ()
+
+    @property
+    def max_page_size(self):
+        return settings.WALLET_MAX_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.finish_page(list(self.page_queryset(queryset, request)))
+
+    def page_queryset(self, queryset, request):
+        """
+        Return the unevaluated query for the requested page (one extra row to
+        detect a next page). Pass the fetched rows to finish_page(); split in
+        two so async callers can evaluate the query with the async ORM.
+        """
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.current_page_size = self.get_page_size(request)
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = self.seek(queryset, position)
+        return queryset.order_by(*self.ordering)[:self.current_page_size + 1]
+
+    def finish_page(self, rows):
+        page_size = self.current_page_size
+        self.has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        self.next_position = self.position_of(rows[-1]) if self.has_next else None
+        return rows
+
+    def restore_page(self, request, next_position):
+        """
+        Prepare get_paginated_response() for a page whose rows were fetched
+        earlier (e.g. from a cache), given the next_position it ended with.
+        """
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.has_next = next_position is not None
+        self.next_position = next_position
+
+    def seek(self, queryset, position):
+        raise NotImplementedError
+
+    def position_of(self, row):
+        raise NotImplementedError
+
+    def position_to_string(self, position):
+        raise NotImplementedError
+
+    def position_from_string(self, value):
+        """Parse a decoded cursor; raise ValueError if it is malformed."""
+        raise NotImplementedError
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, self.encode_cursor(self.next_position)
+        )
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def encode_cursor(self, position):
+        raw = self.position_to_string(position).encode('ascii')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('ascii')
+            return self.position_from_string(raw)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class TransactionCursorPagination(KeysetPagination):
+    """
+    Newest-first pages over (created_at, id), served by the
+    (user, -created_at, -id) index on Transaction.
+    """
+    ordering = ('-created_at', '-id')
+
+    def seek(self, queryset, position):
+        created_at, pk = position
+        return queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+    def position_of(self, row):
+        return row.created_at, row.id
+
+    def position_to_string(self, position):
+        created_at, pk = position
+        return f'{created_at.isoformat()}|{pk}'
+
+    def position_from_string(self, value):
+        created_at, pk = value.rsplit('|', 1)
+        created_at = parse_datetime(created_at)
+        if created_at is None:
+            raise ValueError(value)
+        return created_at, int(pk)
+
+
+class IdCursorPagination(KeysetPagination):
+    """Pages in ascending primary key order."""
+    ordering = ('id',)
+
+    def seek(self, queryset, position):
+        return queryset.filter(id__gt=position)
+
+    def position_of(self, row):
+        return row.id
+
+    def position_to_string(self, position):
+        return str(position)
+
+    def position_from_string(self, value):
+        return int(value)
@@ -0,0 +1,140 @@
+"""
+Monthly RANGE partitions of the transaction table on created_at (PostgreSQL).
+
+Migration 0009 turns wallet_transaction into a partitioned table with one
+partition per calendar month (UTC) of existing data, a few months ahead and
+a DEFAULT partition that catches anything outside them. The rebuild locks
+the ledger against reads and writes until it commits, so it needs a
+maintenance window on a large table. ``ensure_partitions``
+keeps future months created; run it from cron well before each month starts.
+Rows that reached the default partition in the meantime are moved into the
+new partition when it is created. Other backends keep a plain table and the
+functions here do nothing on them.
+"""
+import re
+from datetime import date, datetime, time, timezone as dt_timezone
+
+from django.db import connections, router, transaction as db_transaction
+
+from .models import Transaction
+
+TABLE = Transaction._meta.db_table
+DEFAULT_PARTITION = f'{TABLE}_default'
+_PARTITION_NAME = re.compile(rf'^{TABLE}_y(\d{{4}})m(\d{{2}})$')
+
+
+def month_of(value):
+    """First day of the UTC month of a date or aware datetime."""
+    if isinstance(value, datetime):
+        value = value.astimezone(dt_timezone.utc).date()
+    return value.replace(day=1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_bounds(month):
+    """[start, end) of a month as aware UTC datetimes."""
+    start = datetime.combine(month, time.min, tzinfo=dt_timezone.utc)
+    return start, datetime.combine(add_months(month, 1), time.min, tzinfo=dt_timezone.utc)
+
+
+def partition_name(month):
+    return f'{TABLE}_y{month.year:04d}m{month.month:02d}'
+
+
+def _literal(value):
+    # Partition bounds must be literals on PostgreSQL < 12; these come from dates.
+    return f"'{value.strftime('%Y-%m-%d %H:%M:%S')}+00'"
+
+
+def is_partitioned(using=None):
+    connection = connections[using or router.db_for_write(Transaction)]
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)', [TABLE])
+        return cursor.fetchone() is not None
+
+
+def partition_months(using=None):
+    """Months that have a partition of their own, oldest first."""
+    if not is_partitioned(using):
+        return []
+    connection = connections[using or router.db_for_write(Transaction)]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname FROM pg_inherits '
+            'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+            'WHERE pg_inherits.inhparent = to_regclass(%s)',
+            [TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    months = []
+    for name in names:
+        match = _PARTITION_NAME.match(name)
+        if match:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def create_partition(month, using=None):
+    """
+    Create the partition of `month` unless it exists; return whether it was
+    created. The parent is locked against inserts while rows of that month
+    are moved out of the default partition, so none can slip in between.
+    """
+    using = using or router.db_for_write(Transaction)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    name = partition_name(month)
+    start, end = month_bounds(month)
+    with db_transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute('SELECT to_regclass(%s), to_regclass(%s)', [name, DEFAULT_PARTITION])
+        existing, default = cursor.fetchone()
+        if existing is not None:
+            return False
+        cursor.execute(f'LOCK TABLE {qn(TABLE)} IN SHARE ROW EXCLUSIVE MODE')
+        cursor.execute(f'CREATE TABLE {qn(name)} (LIKE {qn(TABLE)} INCLUDING DEFAULTS)')
+        if default is not None:
+            cursor.execute(
+                f'WITH moved AS (DELETE FROM {qn(DEFAULT_PARTITION)} '
+                f'WHERE created_at >= %s AND created_at < %s RETURNING *) '
+                f'INSERT INTO {qn(name)} SELECT * FROM moved',
+                [start, end],
+            )
+        cursor.execute(
+            f'ALTER TABLE {qn(TABLE)} ATTACH PARTITION {qn(name)} '
+            f'FOR VALUES FROM ({_literal(start)}) TO ({_literal(end)})'
+        )
+    return True
+
+
+def ensure_partitions(months_ahead=3, using=None, today=None):
+    """Create the partitions of this month and the next months_ahead; return the new names."""
+    if not is_partitioned(using):
+        return []
+    current = month_of(today or datetime.now(dt_timezone.utc))
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if create_partition(month, using):
+            created.append(partition_name(month))
+    return created
+
+
+def drop_partition(month, using=None):
+    """Detach and drop the partition of `month`; return whether there was one."""
+    using = using or router.db_for_write(Transaction)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    name = partition_name(month)
+    with db_transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute('SELECT to_regclass(%s)', [name])
+        if cursor.fetchone()[0] is None:
+            return False
+        cursor.execute(f'ALTER TABLE {qn(TABLE)} DETACH PARTITION {qn(name)}')
+        cursor.execute(f'DROP TABLE {qn(name)}')
+    return True
@@ -0,0 +1,179 @@
+"""
+Incremental per-user daily rollups of the transaction ledger.
+
+Every path that inserts Transaction rows calls ``record()`` in the same
+database transaction, which upserts (user, day) totals with
+``INSERT ... ON CONFLICT DO UPDATE`` adding to the stored counts. Rows are
+written in sorted key order, after the wallet (or shard) lock the caller
+already holds, so concurrent writers cannot deadlock on them. Days are
+calendar days in settings.TIME_ZONE. Rollups of archived months (see
+archive.py) outlive their transactions, so rebuilds leave them alone.
+"""
+from decimal import Decimal
+
+from django.db import IntegrityError, connections, router, transaction as db_transaction
+from django.db.models import Count, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth
+from django.utils import timezone
+
+from .archive import archived_until
+from .ledger import iter_user_id_chunks
+from .models import DailyTransactionRollup, Transaction, Wallet
+from .partitions import month_bounds
+from .shards import lock_shards
+
+PERIODS = ('day', 'month')
+ZERO = Decimal('0.00')
+UPSERT_BATCH_SIZE = 500
+_COUNTERS = ('credit_total', 'credit_count', 'debit_total', 'debit_count')
+
+
+def _aggregate(entries, shard):
+    totals = {}
+    for entry in entries:
+        key = (entry.user_id, timezone.localdate(entry.created_at), shard)
+        row = totals.setdefault(key, [ZERO, 0, ZERO, 0])
+        if entry.transaction_type == Transaction.CREDIT:
+            row[0] += entry.amount
+            row[1] += 1
+        else:
+            row[2] += entry.amount
+            row[3] += 1
+    return sorted(totals.items())
+
+
+def record(entries, using, shard=0):
+    """Add Transaction rows (saved or about to be) to their daily rollups."""
+    rows = _aggregate(entries, shard)
+    if not rows:
+        return
+    connection = connections[using]
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        _record_without_upsert(rows, using)
+        return
+
+    qn = connection.ops.quote_name
+    opts = DailyTransactionRollup._meta
+    table = qn(opts.db_table)
+    key_columns = [qn(opts.get_field(name).column) for name in ('user', 'day', 'shard')]
+    counter_columns = [qn(opts.get_field(name).column) for name in _COUNTERS]
+    total_field = opts.get_field('credit_total')
+
+    def adapt(value):
+        if isinstance(value, Decimal):
+            return connection.ops.adapt_decimalfield_value(value, total_field.max_digits, total_field.decimal_places)
+        return value
+
+    updates = ', '.join(f'{column} = {table}.{column} + EXCLUDED.{column}' for column in counter_columns)
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            batch = rows[start:start + UPSERT_BATCH_SIZE]
+            placeholders = ', '.join(['(%s, %s, %s, %s, %s, %s, %s)'] * len(batch))
+            params = []
+            for (user_id, day, row_shard), counters in batch:
+                params.extend([user_id, connection.ops.adapt_datefield_value(day), row_shard])
+                params.extend(adapt(value) for value in counters)
+            cursor.execute(
+                f'INSERT INTO {table} ({", ".join(key_columns + counter_columns)}) '
+                f'VALUES {placeholders} '
+                f'ON CONFLICT ({", ".join(key_columns)}) DO UPDATE SET {updates}',
+                params,
+            )
+
+
+def _record_without_upsert(rows, using):
+    manager = DailyTransactionRollup.objects.using(using)
+    for (user_id, day, shard), counters in rows:
+        increments = {name: F(name) + value for name, value in zip(_COUNTERS, counters)}
+        key = {'user_id': user_id, 'day': day, 'shard': shard}
+        if manager.filter(**key).update(**increments):
+            continue
+        try:
+            with db_transaction.atomic(using=using):
+                manager.create(**key, **dict(zip(_COUNTERS, counters)))
+        except IntegrityError:
+            # Another writer created the row first; add to it instead.
+            manager.filter(**key).update(**increments)
+
+
+def rebuild(user_ids, using):
+    """
+    Recompute the rollups of user_ids from Transaction. The caller must hold
+    the wallet (and shard) locks of these users inside a transaction.
+    """
+    existing = DailyTransactionRollup.objects.using(using).filter(user_id__in=user_ids)
+    transactions = Transaction.objects.using(using).filter(user_id__in=user_ids)
+    horizon = archived_until()
+    if horizon is not None:
+        # Archived transactions are gone from the table; keep their days.
+        existing = existing.filter(day__gte=horizon)
+        transactions = transactions.filter(created_at__gte=month_bounds(horizon)[0])
+    existing.delete()
+    amount = DecimalField(max_digits=16, decimal_places=2)
+    credit = Q(transaction_type=Transaction.CREDIT)
+    rows = (
+        transactions
+        .annotate(day=TruncDate('created_at'))
+        .order_by()
+        .values('user_id', 'day')
+        .annotate(
+            credit_total=Coalesce(Sum('amount', filter=credit), Value(ZERO), output_field=amount),
+            credit_count=Count('id', filter=credit),
+            debit_total=Coalesce(Sum('amount', filter=~credit), Value(ZERO), output_field=amount),
+            debit_count=Count('id', filter=~credit),
+        )
+    )
+    return len(DailyTransactionRollup.objects.using(using).bulk_create(
+        [DailyTransactionRollup(**row) for row in rows], batch_size=1000,
+    ))
+
+
+def rebuild_all(chunk_size=500, using=None):
+    """Recompute every user's rollups, one locked chunk of wallets at a time."""
+    using = using or router.db_for_write(DailyTransactionRollup)
+    written = 0
+    for user_ids in iter_user_id_chunks(chunk_size, using):
+        with db_transaction.atomic(using=using):
+            wallet_ids = list(
+                Wallet.objects.using(using).select_for_update()
+                .filter(user_id__in=user_ids).order_by('user_id').values_list('id', flat=True)
+            )
+            lock_shards(wallet_ids, using)
+            written += rebuild(user_ids, using)
+    return written
+
+
+def summarize(user_id, period='day', start=None, end=None, using=None):
+    """
+    Credit/debit totals of user_id per day or month, oldest first. start is
+    inclusive and end exclusive (dates); shards of a day are summed.
+    """
+    queryset = DailyTransactionRollup.objects.using(using).filter(user_id=user_id)
+    if start is not None:
+        queryset = queryset.filter(day__gte=start)
+    if end is not None:
+        queryset = queryset.filter(day__lt=end)
+    if period == 'month':
+        queryset = queryset.annotate(period=TruncMonth('day'))
+    else:
+        queryset = queryset.annotate(period=F('day'))
+    rows = (
+        queryset.order_by('period').values('period')
+        .annotate(**{name: Sum(name) for name in _COUNTERS})
+    )
+    return [
+        {
+            'period': row['period'].isoformat(),
+            'credit_total': _amount(row['credit_total']),
+            'credit_count': row['credit_count'],
+            'debit_total': _amount(row['debit_total']),
+            'debit_count': row['debit_count'],
+            'net': _amount(row['credit_total'] - row['debit_total']),
+        }
+        for row in rows
+    ]
+
+
+def _amount(value):
+    # SQLite hands sums back without their scale; render like the serializers do.
+    return str(Decimal(value).quantize(ZERO))
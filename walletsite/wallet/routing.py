@@ -0,0 +1,64 @@
+"""
+Read-replica routing for the list endpoints.
+
+ReplicaRouter sends reads to a replica only inside ``read_from_replica``;
+every other query, writes included, goes to the primary (``default``). The
+users and transactions lists enter the block for their reads. A replica is
+picked at random once per block, so all reads of one request see the same
+replica. The transactions list passes its user: when that user's last write
+committed less than WALLET_REPLICA_STICKY_SECONDS ago (cache.wrote_recently),
+the reads stay on the primary, so a client never reads past its own write
+on a lagging replica. Keep the window above the replicas' usual lag.
+
+WALLET_READ_REPLICAS lists the replica aliases; with none, the router does
+nothing.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .cache import wrote_recently
+
+_read_alias = ContextVar('wallet_read_alias', default=None)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        # Without this, saving an instance read from a replica would write
+        # back to the replica it came from.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the primary's data, so their rows relate freely.
+        aliases = {DEFAULT_DB_ALIAS, *settings.WALLET_READ_REPLICAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+
+def choose_replica(user_id=None):
+    """The replica alias to read from, or None to stay on the primary."""
+    replicas = settings.WALLET_READ_REPLICAS
+    if not replicas or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        # Reads inside a transaction on the primary must see its writes.
+        return None
+    if user_id is not None and wrote_recently(user_id):
+        return None
+    return random.choice(replicas)
+
+
+@contextmanager
+def read_from_replica(user_id=None):
+    """Route the reads in this block to a replica (see choose_replica); yields the alias."""
+    alias = choose_replica(user_id)
+    token = _read_alias.set(alias)
+    try:
+        yield alias or DEFAULT_DB_ALIAS
+    finally:
+        _read_alias.reset(token)
@@ -0,0 +1,144 @@
+"""
+Future-dated and recurring wallet operations.
+
+A ScheduledOperation is due once run_at has passed. ``run_due_batch`` claims
+a batch of due rows with SELECT ... FOR UPDATE SKIP LOCKED where the backend
+supports it, so any number of workers can run side by side and each row is
+taken by exactly one of them. The batch is applied with apply_operations, the
+same balance, ledger, rollup and cache handling as the bulk update endpoint,
+and the rows are advanced to their next occurrence in the same transaction.
+A crash therefore leaves every occurrence either applied and advanced or
+still due.
+
+Occurrence n of a recurring row is due at first_run_at plus n periods
+(months keep the day of month, clamped to the month's length). A worker that
+was stopped catches up one occurrence per batch. A failed occurrence (an
+insufficient balance for a debit) is recorded in failures/last_error and
+skipped; a one-off row that fails ends up FAILED.
+"""
+import calendar
+from datetime import timedelta
+
+from django.db import connections, router, transaction as db_transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import ScheduledOperation
+from .services import WalletOperation, WalletOperationError, apply_operations, parse_operation
+
+PERIODS = {
+    ScheduledOperation.DAILY: timedelta(days=1),
+    ScheduledOperation.WEEKLY: timedelta(weeks=1),
+}
+RECURRENCES = [value for value, _ in ScheduledOperation.RECURRENCES]
+
+
+def _add_months(moment, count):
+    index = moment.year * 12 + moment.month - 1 + count
+    year, month = index // 12, index % 12 + 1
+    return moment.replace(year=year, month=month, day=min(moment.day, calendar.monthrange(year, month)[1]))
+
+
+def occurrence_at(schedule, number):
+    """When occurrence `number` (0 is the first) of a recurring schedule is due."""
+    if schedule.recurrence == ScheduledOperation.MONTHLY:
+        return _add_months(schedule.first_run_at, number)
+    return schedule.first_run_at + PERIODS[schedule.recurrence] * number
+
+
+def _parse_moment(value, name):
+    moment = parse_datetime(value) if isinstance(value, str) else None
+    if moment is None:
+        raise WalletOperationError(f'{name} must be an ISO 8601 datetime.')
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def parse_schedule(data) -> ScheduledOperation:
+    """Validate a schedule payload (an operation plus timing) and return an unsaved ScheduledOperation."""
+    op = parse_operation(data)
+    recurrence = data.get('recurrence') or ScheduledOperation.ONCE
+    if recurrence not in RECURRENCES:
+        raise WalletOperationError(f'recurrence must be one of {", ".join(RECURRENCES)}.')
+    run_at = _parse_moment(data['run_at'], 'run_at') if data.get('run_at') else timezone.now()
+    ends_at = _parse_moment(data['ends_at'], 'ends_at') if data.get('ends_at') else None
+    if ends_at is not None and ends_at < run_at:
+        raise WalletOperationError('ends_at must not be before run_at.')
+    return ScheduledOperation(
+        user_id=op.user_id,
+        amount=op.amount,
+        transaction_type=op.transaction_type,
+        description=op.description,
+        recurrence=recurrence,
+        first_run_at=run_at,
+        run_at=run_at,
+        ends_at=ends_at,
+    )
+
+
+def _advance(schedule, outcome, now):
+    schedule.occurrences += 1
+    schedule.last_run_at = now
+    failed = isinstance(outcome, WalletOperationError)
+    if failed:
+        schedule.failures += 1
+        schedule.last_error = str(outcome.detail)[:255]
+    else:
+        schedule.last_error = ''
+    following = None
+    if schedule.recurrence != ScheduledOperation.ONCE:
+        following = occurrence_at(schedule, schedule.occurrences)
+        if schedule.ends_at is not None and following > schedule.ends_at:
+            following = None
+    if following is not None:
+        schedule.run_at = following
+    elif failed and schedule.recurrence == ScheduledOperation.ONCE:
+        schedule.status = ScheduledOperation.FAILED
+    else:
+        schedule.status = ScheduledOperation.DONE
+    return failed
+
+
+def run_due_batch(batch_size=100, now=None):
+    """
+    Claim up to batch_size operations due at `now` (default: the current
+    time), apply them and advance them. Returns (applied, failed); (0, 0)
+    means nothing was due or everything due is claimed by other workers.
+    """
+    using = router.db_for_write(ScheduledOperation)
+    connection = connections[using]
+    now = now or timezone.now()
+    with db_transaction.atomic(using=using):
+        queryset = (
+            ScheduledOperation.objects.using(using)
+            .filter(status=ScheduledOperation.PENDING, run_at__lte=now).order_by('run_at', 'id')
+        )
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        claimed = list(queryset[:batch_size])
+        if not claimed:
+            return 0, 0
+
+        # Wallets are locked (ascending user_id) after the claimed rows; no
+        # other writer locks schedule rows, so the order cannot invert.
+        outcomes = apply_operations([
+            WalletOperation(schedule.user_id, schedule.amount, schedule.transaction_type, schedule.description)
+            for schedule in claimed
+        ])
+        failed = sum(_advance(schedule, outcome, now) for schedule, outcome in zip(claimed, outcomes))
+        ScheduledOperation.objects.using(using).bulk_update(
+            claimed, ['run_at', 'status', 'occurrences', 'failures', 'last_run_at', 'last_error'],
+        )
+    return len(claimed) - failed, failed
+
+
+def run_due(batch_size=100):
+    """Run batches until nothing due is left unclaimed; returns (applied, failed)."""
+    applied = failed = 0
+    while True:
+        batch_applied, batch_failed = run_due_batch(batch_size)
+        if not batch_applied and not batch_failed:
+            return applied, failed
+        applied += batch_applied
+        failed += batch_failed
@@ -1,10 +1,21 @@
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
 
-from .models import Wallet, Transaction
+from .models import ScheduledOperation, Wallet, Transaction
 
 
-class UserSerializer(serializers.ModelSerializer):
+class SparseFieldsetMixin:
+    """Accept a `fields` kwarg that narrows the output to a subset of Meta.fields."""
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class UserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = get_user_model()
         fields = ['id', 'username', 'email', 'first_name', 'last_name']
@@ -29,6 +40,27 @@ class TransactionSerializer(serializers.ModelSerializer):
             'transaction_type',
             'description',
             'created_at',
+            'balance_after',
         ]
-        read_only_fields = ['id', 'created_at']
+        read_only_fields = ['id', 'created_at', 'balance_after']
 
+
+class ScheduledOperationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ScheduledOperation
+        fields = [
+            'id',
+            'user',
+            'amount',
+            'transaction_type',
+            'description',
+            'recurrence',
+            'run_at',
+            'ends_at',
+            'status',
+            'occurrences',
+            'failures',
+            'last_run_at',
+            'last_error',
+        ]
+        read_only_fields = fields
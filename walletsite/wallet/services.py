@@ -0,0 +1,377 @@
+import random
+import uuid
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.auth import get_user_model
+from django.db import connections, router, transaction as db_transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework import status
+
+from . import rollups, shards
+from .cache import invalidate_on_commit
+from .models import Wallet, Transaction
+from .outbox import ledger_entry_model
+
+
+class WalletOperationError(Exception):
+    """A wallet operation that was rejected, with the HTTP status to report it under."""
+
+    def __init__(self, detail, status_code=status.HTTP_400_BAD_REQUEST):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+
+@dataclass(frozen=True)
+class WalletOperation:
+    user_id: int
+    amount: Decimal
+    transaction_type: str
+    description: str = ''
+
+    @property
+    def delta(self) -> Decimal:
+        return self.amount if self.transaction_type == Transaction.CREDIT else -self.amount
+
+
+def parse_operation(data) -> WalletOperation:
+    """Validate a credit/debit payload and return it as a WalletOperation."""
+    user_id = data.get('user_id')
+    amount = data.get('amount')
+    transaction_type = data.get('transaction_type')
+    description = data.get('description', '') or ''
+
+    if user_id is None or amount is None or transaction_type not in [Transaction.CREDIT, Transaction.DEBIT]:
+        raise WalletOperationError('user_id, amount and valid transaction_type are required.')
+
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        raise WalletOperationError('user_id must be an integer.')
+
+    return WalletOperation(user_id, _parse_amount(amount), transaction_type, str(description))
+
+
+@dataclass(frozen=True)
+class TransferOperation:
+    from_user_id: int
+    to_user_id: int
+    amount: Decimal
+    description: str = ''
+
+
+def parse_transfer(data) -> TransferOperation:
+    """Validate a transfer payload and return it as a TransferOperation."""
+    from_user_id = data.get('from_user_id')
+    to_user_id = data.get('to_user_id')
+    amount = data.get('amount')
+    description = data.get('description', '') or ''
+
+    if from_user_id is None or to_user_id is None or amount is None:
+        raise WalletOperationError('from_user_id, to_user_id and amount are required.')
+
+    try:
+        from_user_id, to_user_id = int(from_user_id), int(to_user_id)
+    except (TypeError, ValueError):
+        raise WalletOperationError('from_user_id and to_user_id must be integers.')
+    if from_user_id == to_user_id:
+        raise WalletOperationError('from_user_id and to_user_id must be different users.')
+
+    return TransferOperation(from_user_id, to_user_id, _parse_amount(amount), str(description))
+
+
+def _parse_amount(amount) -> Decimal:
+    try:
+        amount = Decimal(str(amount))
+    except (InvalidOperation, TypeError, ValueError):
+        raise WalletOperationError('amount must be a valid decimal.')
+
+    if not amount.is_finite() or amount <= 0:
+        raise WalletOperationError('amount must be greater than zero.')
+    return amount
+
+
+def _to_balance(value) -> Decimal:
+    field = Wallet._meta.get_field('balance')
+    return field.to_python(value).quantize(Decimal(1).scaleb(-field.decimal_places))
+
+
+def _supports_update_returning(connection) -> bool:
+    # PostgreSQL always has UPDATE ... RETURNING; SQLite since 3.35, the same
+    # release that added it for INSERT. MySQL/MariaDB and Oracle do not.
+    return connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_columns_from_insert
+
+
+def _conditional_update(op, using):
+    """
+    Move the balance of op.user_id's wallet by op.delta in one statement.
+
+    Debits only match while balance >= amount, so the insufficient-balance
+    check happens inside the UPDATE rather than in Python under a row lock.
+    Sharded wallets never match; apply_operation routes them to shards.py.
+    updated_at is left to the caller, which stamps it once the row is locked.
+    Returns (wallet_id, new_balance), or None when no row matched.
+    """
+    connection = connections[using]
+    if not _supports_update_returning(connection):
+        queryset = Wallet.objects.using(using).filter(user_id=op.user_id, shard_count=0)
+        if op.transaction_type == Transaction.DEBIT:
+            queryset = queryset.filter(balance__gte=op.amount)
+        if not queryset.update(balance=F('balance') + op.delta):
+            return None
+        # The UPDATE above holds the row lock until commit, so this read is ours.
+        return Wallet.objects.using(using).filter(user_id=op.user_id).values_list('id', 'balance').get()
+
+    qn = connection.ops.quote_name
+    opts = Wallet._meta
+    balance_field = opts.get_field('balance')
+    balance = qn(balance_field.column)
+
+    def adapt_amount(value):
+        return connection.ops.adapt_decimalfield_value(
+            value, balance_field.max_digits, balance_field.decimal_places
+        )
+
+    sql = (
+        f'UPDATE {qn(opts.db_table)} SET {balance} = {balance} + %s '
+        f'WHERE {qn(opts.get_field("user").column)} = %s AND {qn(opts.get_field("shard_count").column)} = 0'
+    )
+    params = [adapt_amount(op.delta), op.user_id]
+    if op.transaction_type == Transaction.DEBIT:
+        sql += f' AND {balance} >= %s'
+        params.append(adapt_amount(op.amount))
+    sql += f' RETURNING {qn(opts.pk.column)}, {balance}'
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    return row[0], _to_balance(row[1])
+
+
+def _sharded_update(op, wallet_id, shard_count, using):
+    """
+    Apply op to a sharded wallet. Returns (wallet_id, new_balance), or None
+    when the wallet turned out to be unsharded by now.
+    """
+    if op.transaction_type == Transaction.CREDIT:
+        balance = shards.credit(wallet_id, shard_count, op.amount, using)
+        if balance is None:
+            # Re-sharded since shard_count was read. set_shard_count holds the
+            # wallet lock while it works, so under that lock the count is
+            # current and the credit lands.
+            shard_count = (
+                Wallet.objects.using(using).select_for_update()
+                .values_list('shard_count', flat=True).get(pk=wallet_id)
+            )
+            if not shard_count:
+                return None
+            balance = shards.credit(wallet_id, shard_count, op.amount, using)
+    else:
+        balance = shards.debit(wallet_id, op.amount, using)
+        if balance is None:
+            raise WalletOperationError('Insufficient balance.')
+    return wallet_id, _to_balance(balance)
+
+
+def apply_operation(op: WalletOperation):
+    """
+    Apply a single WalletOperation without loading the wallet or the user.
+
+    The common case is one conditional UPDATE (with RETURNING where the
+    backend supports it) followed by the ledger INSERT. Only when the UPDATE
+    matches nothing do we look further, to tell a missing user, a wallet that
+    has not been created yet, a sharded wallet and an insufficient balance
+    apart.
+
+    Returns (wallet_id, new_balance, ledger_entry) or raises WalletOperationError.
+    ledger_entry is a Transaction, or a LedgerOutbox row in outbox mode.
+    """
+    using = router.db_for_write(Wallet)
+    with db_transaction.atomic(using=using):
+        rollup_shard = 0
+        exact = True
+        updated = _conditional_update(op, using)
+        if updated is None:
+            wallet = Wallet.objects.using(using).filter(user_id=op.user_id).values_list('id', 'shard_count').first()
+            if wallet is not None and wallet[1]:
+                updated = _sharded_update(op, *wallet, using)
+                if updated is not None and op.transaction_type == Transaction.CREDIT:
+                    # Spread the rollup row as well, or credits would queue on it.
+                    rollup_shard = random.randrange(wallet[1])
+                    # The total was read without the other shards' locks, so
+                    # it is not the balance right after this row.
+                    exact = False
+            elif wallet is not None:
+                raise WalletOperationError('Insufficient balance.')
+        if updated is None:
+            if not get_user_model().objects.using(using).filter(pk=op.user_id).exists():
+                raise WalletOperationError('User not found.', status.HTTP_404_NOT_FOUND)
+            Wallet.objects.using(using).get_or_create(user_id=op.user_id)
+            updated = _conditional_update(op, using)
+            if updated is None:
+                raise WalletOperationError('Insufficient balance.')
+
+        wallet_id, balance = updated
+        # Stamped now that the wallet row is locked (unsharded wallets and
+        # debits), so created_at follows the order the writes commit in and
+        # the newest row before a moment holds the balance as of it. The
+        # wallet gets the same stamp; credits to a sharded wallet leave its
+        # row alone so they don't queue on it.
+        created_at = timezone.now()
+        if exact:
+            Wallet.objects.using(using).filter(pk=wallet_id).update(updated_at=created_at)
+        entry = ledger_entry_model().objects.using(using).create(
+            user_id=op.user_id,
+            amount=op.amount,
+            transaction_type=op.transaction_type,
+            description=op.description,
+            created_at=created_at,
+            balance_after=balance if exact else None,
+        )
+        if isinstance(entry, Transaction):
+            rollups.record([entry], using, shard=rollup_shard)
+        invalidate_on_commit([op.user_id], using=using)
+    return wallet_id, balance, entry
+
+
+def apply_operations(operations):
+    """
+    Apply a batch of WalletOperations in one database transaction.
+
+    Every touched wallet is locked up front in ascending user_id order, so two
+    concurrent batches can never wait on each other's rows in opposite order.
+    Operations are then applied in input order against the locked balances,
+    the new balances are written back with batched UPDATEs and the ledger rows
+    are inserted with a single bulk_create, each carrying the running balance
+    of its wallet.
+
+    Returns one entry per operation: either the resulting balance or a
+    WalletOperationError explaining why that operation was skipped.
+    """
+    results = [None] * len(operations)
+    user_ids = sorted({op.user_id for op in operations})
+    existing_users = set(
+        get_user_model().objects.filter(pk__in=user_ids).values_list('pk', flat=True)
+    )
+    for index, op in enumerate(operations):
+        if op.user_id not in existing_users:
+            results[index] = WalletOperationError('User not found.', status.HTTP_404_NOT_FOUND)
+
+    user_ids = [user_id for user_id in user_ids if user_id in existing_users]
+    if not user_ids:
+        return results
+
+    with db_transaction.atomic():
+        Wallet.objects.bulk_create(
+            [Wallet(user_id=user_id) for user_id in user_ids],
+            ignore_conflicts=True,
+        )
+        wallets = {
+            wallet.user_id: wallet
+            for wallet in Wallet.objects.select_for_update().filter(user_id__in=user_ids).order_by('user_id')
+        }
+        # Sharded wallets are checked and updated against their full balance.
+        folded = {wallet.user_id for wallet in shards.fold_shards(wallets.values(), using=None)}
+
+        now = timezone.now()
+        entry_model = ledger_entry_model()
+        ledger = []
+        touched = set()
+        for index, op in enumerate(operations):
+            if results[index] is not None:
+                continue
+            wallet = wallets[op.user_id]
+            if op.transaction_type == Transaction.DEBIT and wallet.balance < op.amount:
+                results[index] = WalletOperationError('Insufficient balance.')
+                continue
+            wallet.balance += op.delta
+            wallet.updated_at = now
+            touched.add(op.user_id)
+            ledger.append(entry_model(
+                user_id=op.user_id,
+                amount=op.amount,
+                transaction_type=op.transaction_type,
+                description=op.description,
+                created_at=now,
+                balance_after=wallet.balance,
+            ))
+            results[index] = wallet.balance
+
+        Wallet.objects.bulk_update(
+            [wallets[user_id] for user_id in sorted(touched | folded)],
+            ['balance', 'updated_at'],
+            batch_size=500,
+        )
+        entry_model.objects.bulk_create(ledger, batch_size=1000)
+        if entry_model is Transaction:
+            rollups.record(ledger, router.db_for_write(Transaction))
+        invalidate_on_commit(touched)
+
+    return results
+
+
+def apply_transfer(op: TransferOperation):
+    """
+    Move op.amount from one user's wallet to another's in one transaction.
+
+    Both wallets are locked by a single SELECT ... FOR UPDATE in ascending
+    user_id order, the order every multi-wallet writer here uses, so opposing
+    transfers, bulk updates and the outbox drainer cannot deadlock on each
+    other. The debit and the credit are written as a pair of ledger rows
+    sharing a transfer_id.
+
+    Returns (transfer_id, from_balance, to_balance, [debit_entry, credit_entry])
+    or raises WalletOperationError.
+    """
+    user_ids = sorted((op.from_user_id, op.to_user_id))
+    using = router.db_for_write(Wallet)
+    if get_user_model().objects.using(using).filter(pk__in=user_ids).count() != len(user_ids):
+        raise WalletOperationError('User not found.', status.HTTP_404_NOT_FOUND)
+
+    with db_transaction.atomic(using=using):
+        # A write first, so SQLite takes its write lock now rather than
+        # upgrading a read lock later (which it fails instead of waiting).
+        Wallet.objects.using(using).bulk_create(
+            [Wallet(user_id=user_id) for user_id in user_ids],
+            ignore_conflicts=True,
+        )
+        wallets = {
+            wallet.user_id: wallet
+            for wallet in Wallet.objects.using(using).select_for_update().filter(user_id__in=user_ids).order_by('user_id')
+        }
+        shards.fold_shards(wallets.values(), using)
+        sender, recipient = wallets[op.from_user_id], wallets[op.to_user_id]
+        if sender.balance < op.amount:
+            raise WalletOperationError('Insufficient balance.')
+
+        now = timezone.now()
+        sender.balance -= op.amount
+        recipient.balance += op.amount
+        sender.updated_at = recipient.updated_at = now
+        Wallet.objects.using(using).bulk_update([wallets[user_id] for user_id in user_ids], ['balance', 'updated_at'])
+
+        transfer_id = uuid.uuid4()
+        entry_model = ledger_entry_model()
+        entries = entry_model.objects.using(using).bulk_create([
+            entry_model(
+                user_id=user_id,
+                amount=op.amount,
+                transaction_type=transaction_type,
+                description=op.description,
+                created_at=now,
+                transfer_id=transfer_id,
+                balance_after=wallet.balance,
+            )
+            for user_id, transaction_type, wallet in (
+                (op.from_user_id, Transaction.DEBIT, sender),
+                (op.to_user_id, Transaction.CREDIT, recipient),
+            )
+        ])
+        if entry_model is Transaction:
+            rollups.record(entries, using)
+        invalidate_on_commit(user_ids, using=using)
+    return transfer_id, sender.balance, recipient.balance, entries
@@ -0,0 +1,139 @@
+"""
+Sharded balances for hot wallets.
+
+A wallet with shard_count > 0 keeps part of its balance in WalletShard rows,
+and its balance is Wallet.balance plus the sum of its shards. Credits add to
+one shard picked at random, so concurrent credits to the same wallet lock
+different rows instead of queueing on the Wallet row.
+
+Anything that needs the exact balance (debits, bulk updates, checkpoints and
+reconciliation) locks the wallet first and then all of its shards in
+ascending index order. Credits only ever lock a single shard, so the two
+cannot deadlock. Debits fold the shards back into Wallet.balance, so the
+non-negative check is made against the whole balance.
+"""
+import random
+from decimal import Decimal
+
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Wallet, WalletShard
+
+ZERO = Decimal('0.00')
+
+
+def shard_total():
+    """Subquery expression summing the shards of the outer Wallet row."""
+    totals = (
+        WalletShard.objects.filter(wallet_id=OuterRef('pk'))
+        .order_by()
+        .values('wallet_id')
+        .annotate(total=Sum('balance'))
+        .values('total')
+    )
+    return Coalesce(
+        Subquery(totals),
+        Value(ZERO),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+
+
+def wallet_with_total_balance(queryset):
+    """First wallet of queryset with .balance set to its total (shards included), or None."""
+    wallet = queryset.annotate(shard_balance=shard_total()).first()
+    if wallet is not None:
+        wallet.balance += wallet.shard_balance
+    return wallet
+
+
+def lock_shards(wallet_ids, using):
+    """Lock the shards of wallet_ids (already locked by the caller) and return their sums by wallet id."""
+    totals = {}
+    shards = (
+        WalletShard.objects.using(using)
+        .select_for_update()
+        .filter(wallet_id__in=wallet_ids)
+        .order_by('wallet_id', 'index')
+        .values_list('wallet_id', 'balance')
+    )
+    for wallet_id, balance in shards:
+        totals[wallet_id] = totals.get(wallet_id, ZERO) + balance
+    return totals
+
+
+def fold_shards(wallets, using):
+    """
+    Move the shard balances of locked wallets into Wallet.balance in memory
+    and zero the shards. Returns the wallets whose balance changed; the
+    caller must save them before committing.
+    """
+    sharded = {wallet.pk: wallet for wallet in wallets if wallet.shard_count}
+    if not sharded:
+        return []
+    folded = []
+    for wallet_id, total in lock_shards(sorted(sharded), using).items():
+        if total:
+            sharded[wallet_id].balance += total
+            folded.append(sharded[wallet_id])
+    if folded:
+        WalletShard.objects.using(using).filter(wallet_id__in=[wallet.pk for wallet in folded]).update(balance=ZERO)
+    return folded
+
+
+def credit(wallet_id, shard_count, amount, using):
+    """
+    Add amount to a random shard and return the wallet's total balance, or
+    None when that shard no longer exists: shard_count is read without a
+    lock, and the wallet may have been re-sharded since.
+    """
+    index = random.randrange(shard_count)
+    updated = WalletShard.objects.using(using).filter(wallet_id=wallet_id, index=index).update(
+        balance=F('balance') + amount,
+    )
+    if not updated:
+        return None
+    # Other shards are read without locks: the result is the total as of
+    # this credit, not a balance anyone else is guaranteed to observe.
+    return (
+        Wallet.objects.using(using).filter(pk=wallet_id)
+        .annotate(total=F('balance') + shard_total())
+        .values_list('total', flat=True).get()
+    )
+
+
+def debit(wallet_id, amount, using):
+    """
+    Take amount from a sharded wallet, or return None if its total is short.
+
+    Locks the wallet and its shards, checks the total and folds the shards
+    into Wallet.balance. Returns the new balance; the caller stamps
+    updated_at while the lock is still held.
+    """
+    wallet = Wallet.objects.using(using).select_for_update().get(pk=wallet_id)
+    folded = fold_shards([wallet], using)
+    if wallet.balance < amount:
+        if folded:
+            wallet.save(update_fields=['balance'])
+        return None
+    wallet.balance -= amount
+    wallet.save(update_fields=['balance'])
+    return wallet.balance
+
+
+def set_shard_count(user_id, shard_count, using):
+    """
+    Re-shard a wallet into shard_count shards (0 turns sharding off).
+
+    Existing shard balances are folded into Wallet.balance first, so the
+    total never changes. Must be called inside a transaction on `using`.
+    """
+    wallet = Wallet.objects.using(using).select_for_update().get(user_id=user_id)
+    fold_shards([wallet], using)
+    WalletShard.objects.using(using).filter(wallet=wallet).delete()
+    WalletShard.objects.using(using).bulk_create([
+        WalletShard(wallet=wallet, index=index) for index in range(shard_count)
+    ])
+    wallet.shard_count = shard_count
+    wallet.save(update_fields=['balance', 'shard_count', 'updated_at'])
+    return wallet
@@ -1,3 +1,1824 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, IntegrityError, OperationalError, connection, connections, router as db_router, transaction as db_transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from config import schema as openapi_schema
+from config.metrics import registry as metrics_registry
+from config.postgresql_pool.base import (
+    TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INERROR, TRANSACTION_STATUS_INTRANS,
+    DatabaseWrapper as PooledDatabaseWrapper,
+)
+from config.postgresql_pool.pool import ConnectionPool, PoolTimeout, close_pools
+
+from . import cache as wallet_cache, fastjson, partitions, services, shards
+from .filters import filter_transactions
+from .idempotency import purge_expired
+from .ledger import backfill_balance_after, balance_at, checkpoint_balances, reconcile_balances
+from .models import (
+    BalanceCheckpoint, DailyTransactionRollup, IdempotencyKey, LedgerOutbox, ScheduledOperation, Transaction, Wallet,
+)
+from .outbox import drain_batch, outbox_lag
+from .routing import read_from_replica
+from .scheduling import run_due_batch
+from .serializers import WalletSerializer
+from .services import TransferOperation, WalletOperation, WalletOperationError, apply_operation, apply_transfer
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class UserTransactionsPaginationTests(TestCase):
+    def setUp(self):
+        caches[wallet_cache.CACHE_ALIAS].clear()
+        self.user = get_user_model().objects.create(username='alice')
+        now = timezone.now()
+        # Pairs of rows share a timestamp so the id tie-breaker is exercised.
+        Transaction.objects.bulk_create([
+            Transaction(
+                user=self.user,
+                amount=Decimal('1.00'),
+                transaction_type=Transaction.CREDIT,
+                created_at=now - timedelta(minutes=i // 2),
+            )
+            for i in range(7)
+        ])
+
+    def test_pages_walk_every_row_once_newest_first(self):
+        url = f'/api/transactions/{self.user.pk}/?page_size=3'
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(row['id'] for row in response.json()['results'])
+            url = response.json()['next']
+
+        expected = list(
+            Transaction.objects.filter(user=self.user)
+            .order_by('-created_at', '-id')
+            .values_list('id', flat=True)
+        )
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(f'/api/transactions/{self.user.pk}/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class WalletBulkUpdateTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.alice = User.objects.create(username='alice')
+        self.bob = User.objects.create(username='bob')
+
+    def test_operations_succeed_or_fail_independently(self):
+        response = self.client.post('/api/wallet/bulk-update/', {
+            'operations': [
+                {'user_id': self.alice.pk, 'amount': '10.00', 'transaction_type': 'credit'},
+                {'user_id': self.bob.pk, 'amount': '5.00', 'transaction_type': 'debit'},
+                {'user_id': self.alice.pk, 'amount': '4.00', 'transaction_type': 'debit'},
+                {'user_id': 999999, 'amount': '1.00', 'transaction_type': 'credit'},
+                {'user_id': self.bob.pk, 'amount': '-1', 'transaction_type': 'credit'},
+            ],
+        }, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body['succeeded'], body['failed']), (2, 3))
+        self.assertEqual([r['status'] for r in body['results']], ['ok', 'error', 'ok', 'error', 'error'])
+        self.assertEqual(body['results'][2]['balance'], '6.00')
+        self.assertEqual(body['results'][1]['detail'], 'Insufficient balance.')
+        self.assertEqual(body['results'][3]['code'], 404)
+
+        self.assertEqual(self.alice.wallet.balance, Decimal('6.00'))
+        self.assertEqual(Transaction.objects.filter(user=self.alice).count(), 2)
+        self.assertFalse(Transaction.objects.filter(user=self.bob).exists())
+
+    def test_empty_batch_is_rejected(self):
+        response = self.client.post('/api/wallet/bulk-update/', {'operations': []}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class WalletReadCacheTests(TestCase):
+    def setUp(self):
+        caches[wallet_cache.CACHE_ALIAS].clear()
+        self.user = get_user_model().objects.create(username='alice')
+
+    def post(self, **data):
+        # on_commit callbacks only run when the test captures and executes them.
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/wallet/update/', data, content_type='application/json')
+
+    def test_balance_is_cached_until_a_write_commits(self):
+        self.assertEqual(self.client.get(f'/api/wallet/{self.user.pk}/').status_code, 404)
+        self.post(user_id=self.user.pk, amount='10.00', transaction_type='credit')
+
+        self.assertEqual(self.client.get(f'/api/wallet/{self.user.pk}/').json()['balance'], '10.00')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(f'/api/wallet/{self.user.pk}/').json()['balance'], '10.00')
+
+        self.post(user_id=self.user.pk, amount='2.50', transaction_type='debit')
+        self.assertEqual(self.client.get(f'/api/wallet/{self.user.pk}/').json()['balance'], '7.50')
+
+    def test_newest_transaction_page_is_cached_until_a_write_commits(self):
+        self.post(user_id=self.user.pk, amount='1.00', transaction_type='credit')
+        self.post(user_id=self.user.pk, amount='2.00', transaction_type='credit')
+        url = f'/api/transactions/{self.user.pk}/?page_size=1'
+
+        first = self.client.get(url).json()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).json(), first)
+        self.assertEqual(first['results'][0]['amount'], '2.00')
+        self.assertEqual(len(self.client.get(first['next']).json()['results']), 1)
+
+        self.post(user_id=self.user.pk, amount='3.00', transaction_type='credit')
+        self.assertEqual(self.client.get(url).json()['results'][0]['amount'], '3.00')
+
+    def test_result_computed_across_a_write_is_not_served_afterwards(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            # A write commits while this read is still in flight.
+            wallet_cache.bump_versions([self.user.pk])
+            return 'stale'
+
+        wallet_cache.get_or_compute(self.user.pk, 'probe', compute)
+        self.assertEqual(wallet_cache.get_or_compute(self.user.pk, 'probe', lambda: 'fresh'), 'fresh')
+        self.assertEqual(len(calls), 1)
+
+    def test_cache_failure_after_commit_does_not_fail_the_write(self):
+        with mock.patch.object(wallet_cache, 'bump_versions', side_effect=OSError('read-only file system')):
+            with self.assertLogs(level='ERROR'):
+                response = self.post(user_id=self.user.pk, amount='5.00', transaction_type='credit')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['balance'], '5.00')
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 1)
+
+    def test_racing_bumps_never_share_a_version(self):
+        # With incr, two workers bumping at once could both write version + 1.
+        # Every thread has its own cache instance, so patch the backend class.
+        backend = type(caches[wallet_cache.CACHE_ALIAS])
+        written = []
+        set_many = backend.set_many
+
+        def record(cache, values, *args, **kwargs):
+            written.extend(values.values())
+            return set_many(cache, values, *args, **kwargs)
+
+        def bump():
+            for _ in range(25):
+                wallet_cache.bump_versions([self.user.pk])
+
+        with mock.patch.object(backend, 'set_many', record):
+            threads = [threading.Thread(target=bump) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(set(written)), 100)
+        self.assertIn(wallet_cache.get_version(self.user.pk), written)
+        self.assertNotEqual(Path(settings.CACHES[wallet_cache.CACHE_ALIAS]['LOCATION']), settings.BASE_DIR / '.cache' / 'wallet')
+
+    def test_file_based_backend(self):
+        with tempfile.TemporaryDirectory() as location:
+            file_cache = {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': location,
+            }
+            with override_settings(CACHES={'default': file_cache, wallet_cache.CACHE_ALIAS: file_cache}):
+                self.post(user_id=self.user.pk, amount='4.00', transaction_type='credit')
+                self.assertEqual(self.client.get(f'/api/wallet/{self.user.pk}/').json()['balance'], '4.00')
+                with self.assertNumQueries(0):
+                    self.client.get(f'/api/wallet/{self.user.pk}/')
+                self.post(user_id=self.user.pk, amount='1.00', transaction_type='credit')
+                self.assertEqual(self.client.get(f'/api/wallet/{self.user.pk}/').json()['balance'], '5.00')
+                self.assertTrue(os.listdir(location))
+
+    def test_workers_share_the_cache_by_default(self):
+        def load_settings(**env):
+            environ = {key: value for key, value in os.environ.items() if key != 'WALLET_CACHE_BACKEND'}
+            return subprocess.run(
+                [sys.executable, '-c', 'from config import settings; print(settings.CACHES["wallet"]["BACKEND"])'],
+                cwd=settings.BASE_DIR, env={**environ, **env}, capture_output=True, text=True,
+            )
+
+        result = load_settings(WEB_CONCURRENCY='3')
+        self.assertEqual(result.stdout.strip(), 'django.core.cache.backends.filebased.FileBasedCache')
+        result = load_settings(WEB_CONCURRENCY='3', WALLET_CACHE_BACKEND='locmem')
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn('ImproperlyConfigured', result.stderr)
+        self.assertEqual(load_settings(WALLET_CACHE_BACKEND='locmem').returncode, 0)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class WalletUpdateTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='alice')
+
+    def post(self, **data):
+        return self.client.post('/api/wallet/update/', data, content_type='application/json')
+
+    def test_credit_creates_wallet_and_debit_respects_balance(self):
+        response = self.post(user_id=self.user.pk, amount='10.00', transaction_type='credit')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['balance'], '10.00')
+        self.assertEqual(response.json()['user']['username'], 'alice')
+
+        response = self.post(user_id=self.user.pk, amount='10.01', transaction_type='debit')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['detail'], 'Insufficient balance.')
+
+        response = self.post(user_id=self.user.pk, amount='2.50', transaction_type='debit')
+        self.assertEqual(response.json()['balance'], '7.50')
+        self.assertEqual(Wallet.objects.get(user=self.user).balance, Decimal('7.50'))
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 2)
+
+    def test_unknown_user(self):
+        response = self.post(user_id=999999, amount='1.00', transaction_type='credit')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Wallet.objects.exists())
+
+    def test_existing_wallet_takes_one_update_and_one_insert(self):
+        Wallet.objects.create(user=self.user, balance=Decimal('5.00'))
+        with self.assertNumQueries(7):
+            # SAVEPOINT, UPDATE ... RETURNING, updated_at stamp, ledger INSERT,
+            # rollup upsert, RELEASE, then the response read.
+            response = self.post(user_id=self.user.pk, amount='5.00', transaction_type='debit')
+        self.assertEqual(response.json()['balance'], '0.00')
+
+    def test_full_response_reports_this_operations_balance(self):
+        Wallet.objects.create(user=self.user, balance=Decimal('5.00'))
+
+        def apply_then_race(op):
+            result = apply_operation(op)
+            # Another write commits before the response is built.
+            Wallet.objects.filter(user=self.user).update(balance=Decimal('100.00'))
+            return result
+
+        with mock.patch('wallet.views.apply_operation', side_effect=apply_then_race):
+            response = self.post(user_id=self.user.pk, amount='1.00', transaction_type='credit')
+        self.assertEqual(response.json()['balance'], '6.00')
+        self.assertEqual(response.json()['user']['username'], 'alice')
+
+    def test_compact_response_skips_wallet_read(self):
+        Wallet.objects.create(user=self.user, balance=Decimal('5.00'))
+        with self.assertNumQueries(6):
+            # SAVEPOINT, UPDATE ... RETURNING, updated_at stamp, ledger INSERT,
+            # rollup upsert, RELEASE.
+            response = self.client.post(
+                '/api/wallet/update/?response=compact',
+                {'user_id': self.user.pk, 'amount': '1.00', 'transaction_type': 'credit'},
+                content_type='application/json',
+            )
+        self.assertEqual(response.json(), {
+            'balance': '6.00',
+            'transaction_id': Transaction.objects.get(user=self.user).pk,
+        })
+
+    def test_compact_response_is_cheaper_to_build(self):
+        wallet = Wallet.objects.select_related('user').get(pk=Wallet.objects.create(user=self.user).pk)
+        entry = Transaction.objects.create(user=self.user, amount=Decimal('1.00'), transaction_type='credit')
+        rounds = 300
+
+        def best_of(build):
+            timings = []
+            for _ in range(5):
+                started = time.perf_counter()
+                for _ in range(rounds):
+                    build()
+                timings.append(time.perf_counter() - started)
+            return min(timings)
+
+        full = best_of(lambda: WalletSerializer(wallet).data)
+        compact = best_of(lambda: {'balance': str(wallet.balance), 'transaction_id': entry.pk})
+        # Typically two orders of magnitude; assert a margin that survives noisy CI.
+        self.assertLess(compact * 5, full)
+
+    def test_backends_without_update_returning(self):
+        Wallet.objects.create(user=self.user, balance=Decimal('5.00'))
+        with mock.patch('wallet.services._supports_update_returning', return_value=False):
+            response = self.post(user_id=self.user.pk, amount='1.25', transaction_type='credit')
+            self.assertEqual(response.json()['balance'], '6.25')
+            response = self.post(user_id=self.user.pk, amount='7.00', transaction_type='debit')
+            self.assertEqual(response.status_code, 400)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='alice')
+        self.payload = {'user_id': self.user.pk, 'amount': '10.00', 'transaction_type': 'credit'}
+
+    def post(self, data, key):
+        return self.client.post(
+            '/api/wallet/update/', data, content_type='application/json', HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_retry_replays_first_response_without_reapplying(self):
+        first = self.post(self.payload, 'abc')
+        with self.assertNumQueries(1):
+            retry = self.post(self.payload, 'abc')
+
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Wallet.objects.get(user=self.user).balance, Decimal('10.00'))
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_rejected_operation_is_replayed_too(self):
+        debit = dict(self.payload, transaction_type='debit')
+        self.assertEqual(self.post(debit, 'k').status_code, 400)
+        self.post(self.payload, 'other')
+        self.assertEqual(self.post(debit, 'k').status_code, 400)
+        self.assertEqual(Wallet.objects.get(user=self.user).balance, Decimal('10.00'))
+
+    def test_key_reused_for_different_body(self):
+        self.post(self.payload, 'abc')
+        response = self.post(dict(self.payload, amount='11.00'), 'abc')
+        self.assertEqual(response.status_code, 422)
+
+    @override_settings(WALLET_IDEMPOTENCY_TTL=60)
+    def test_expired_keys_are_not_replayed_and_get_purged(self):
+        self.post(self.payload, 'abc')
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(minutes=5))
+        self.assertNotIn('Idempotent-Replayed', self.post(self.payload, 'abc'))
+        self.assertEqual(Transaction.objects.count(), 2)
+
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(purge_expired(), 1)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class BalanceCheckpointTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='alice')
+
+    def credit(self, amount, transaction_type='credit'):
+        self.client.post('/api/wallet/update/', {
+            'user_id': self.user.pk, 'amount': amount, 'transaction_type': transaction_type,
+        }, content_type='application/json')
+
+    def test_checkpoints_only_cover_new_transactions(self):
+        self.credit('10.00')
+        self.credit('3.00', 'debit')
+        self.assertEqual(checkpoint_balances(), 1)
+        self.assertEqual(checkpoint_balances(), 0)
+
+        self.credit('1.50')
+        self.assertEqual(checkpoint_balances(), 1)
+        latest = BalanceCheckpoint.objects.filter(user=self.user).latest('last_transaction_id')
+        self.assertEqual(latest.balance, Decimal('8.50'))
+        self.assertEqual(latest.last_transaction_id, Transaction.objects.latest('id').id)
+
+    def test_reconcile_reports_and_repairs_drift(self):
+        self.credit('10.00')
+        checkpoint_balances()
+        self.credit('5.00')
+        Wallet.objects.filter(user=self.user).update(balance=Decimal('99.00'))
+
+        mismatches = list(reconcile_balances())
+        self.assertEqual([(m.user_id, m.balance) for m in mismatches], [(self.user.pk, Decimal('15.00'))])
+        self.assertEqual(Wallet.objects.get(user=self.user).balance, Decimal('99.00'))
+
+        list(reconcile_balances(repair=True))
+        self.assertEqual(Wallet.objects.get(user=self.user).balance, Decimal('15.00'))
+        self.assertEqual(list(reconcile_balances()), [])
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class TransactionExportTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.alice = User.objects.create(username='alice')
+        self.bob = User.objects.create(username='bob')
+        for user in (self.alice, self.bob):
+            self.client.post('/api/wallet/update/', {
+                'user_id': user.pk, 'amount': '2.50', 'transaction_type': 'credit', 'description': 'a, "quoted" note',
+            }, content_type='application/json')
+
+    def test_jsonl_matches_history_api(self):
+        response = self.client.get(f'/api/transactions/export/?format=jsonl&user_id={self.alice.pk}')
+        self.assertEqual(response.status_code, 200)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        history = self.client.get(f'/api/transactions/{self.alice.pk}/').json()['results']
+        self.assertEqual([json.loads(line) for line in lines], history)
+
+    def test_csv_with_date_range(self):
+        response = self.client.get('/api/transactions/export/?start=2000-01-01')
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0], ['id', 'user', 'amount', 'transaction_type', 'description', 'created_at', 'balance_after'])
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[1][4], 'a, "quoted" note')
+
+        response = self.client.get('/api/transactions/export/?end=2000-01-01')
+        self.assertEqual(len(b''.join(response.streaming_content).decode().splitlines()), 1)
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.client.get('/api/transactions/export/?format=xml').status_code, 400)
+        self.assertEqual(self.client.get('/api/transactions/export/?start=yesterday').status_code, 400)
+
+    def test_command_writes_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'out.jsonl')
+            call_command('export_transactions', '--format', 'jsonl', '--user', str(self.bob.pk), '--output', path)
+            with open(path) as handle:
+                rows = [json.loads(line) for line in handle]
+        self.assertEqual([row['user'] for row in rows], [self.bob.pk])
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class OpenAPISchemaTests(TestCase):
+    def setUp(self):
+        openapi_schema.reset_schema()
+        self.addCleanup(openapi_schema.reset_schema)
+
+    def test_schema_is_generated_once_and_revalidated(self):
+        with mock.patch.object(openapi_schema, 'generate_schema_body', wraps=openapi_schema.generate_schema_body) as generate:
+            first = self.client.get('/swagger.json')
+            second = self.client.get('/redoc/?format=openapi')
+        self.assertEqual(generate.call_count, 1)
+        self.assertEqual(first.content, second.content)
+        self.assertIn('/wallet/update/', json.loads(first.content)['paths'])
+
+        not_modified = self.client.get('/swagger.json', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+        zipped = self.client.get('/swagger.json', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(zipped['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(zipped.content), first.content)
+        self.assertNotEqual(zipped['ETag'], first['ETag'])
+
+    def test_artifact_is_used_only_for_matching_urlconf(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            target = os.path.join(tmp, 'openapi.json')
+            with override_settings(OPENAPI_SCHEMA_PATH=target):
+                call_command('build_openapi_schema', stdout=io.StringIO())
+                with mock.patch.object(openapi_schema, 'generate_schema_body') as generate:
+                    self.assertEqual(self.client.get('/swagger.json').status_code, 200)
+                generate.assert_not_called()
+
+                openapi_schema.reset_schema()
+                with mock.patch.object(openapi_schema, 'urlconf_fingerprint', return_value='changed'):
+                    with mock.patch.object(openapi_schema, 'generate_schema_body', return_value=b'{}') as generate:
+                        self.assertEqual(self.client.get('/swagger.json').content, b'{}')
+                generate.assert_called_once()
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_redoc_page_renders(self):
+        response = self.client.get('/redoc/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Access-Control-Allow-Origin'], '*')
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class PrecompressedPageTests(TestCase):
+    def test_docs_negotiates_encoding_and_revalidates(self):
+        plain = self.client.get('/docs/')
+        self.assertEqual(plain.status_code, 200)
+        self.assertIn(b'Django Wallet API Documentation', plain.content)
+        self.assertEqual(plain['Access-Control-Allow-Origin'], '*')
+
+        zipped = self.client.get('/docs/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(zipped['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(zipped.content), plain.content)
+
+        not_modified = self.client.get('/docs/', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=zipped['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+
+    def test_assignment_payload_is_unchanged(self):
+        from config.urls import ASSIGNMENT_INFO
+
+        response = self.client.get('/assignment/', HTTP_ACCEPT_ENCODING='identity')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response.json(), ASSIGNMENT_INFO)
+
+    def test_served_without_url_resolution(self):
+        with mock.patch('django.core.handlers.base.BaseHandler.resolve_request') as resolve:
+            self.assertEqual(self.client.get('/assignment/').status_code, 200)
+        resolve.assert_not_called()
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class UserListTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        for i in range(5):
+            User.objects.create(username=f'user{i}', email=f'user{i}@example.com')
+
+    def test_pages_and_page_size_limit(self):
+        with override_settings(WALLET_MAX_PAGE_SIZE=2):
+            first = self.client.get('/api/users/?page_size=100').json()
+            self.assertEqual(len(first['results']), 2)
+            url, names = first['next'], [u['username'] for u in first['results']]
+            while url:
+                page = self.client.get(url).json()
+                names += [u['username'] for u in page['results']]
+                url = page['next']
+        self.assertEqual(names, [f'user{i}' for i in range(5)])
+
+    def test_sparse_fieldset_narrows_output_and_sql(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/users/?fields=username')
+        self.assertEqual(response.json()['results'][0], {'username': 'user0'})
+        select = queries.captured_queries[-1]['sql']
+        self.assertIn('"username"', select)
+        self.assertNotIn('"email"', select)
+        self.assertNotIn('"password"', select)
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get('/api/users/?fields=username,password')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class FastSerializationTests(TestCase):
+    def setUp(self):
+        caches[wallet_cache.CACHE_ALIAS].clear()
+        User = get_user_model()
+        self.user = User.objects.create(username='fast', email='fäst@example.com', first_name='Zoë\u2028')
+        for i in range(3):
+            User.objects.create(username=f'other{i}', email=f'other{i}@example.com')
+        now = datetime(2026, 3, 1, 12, 30, 15, 123456, tzinfo=dt_timezone.utc)
+        descriptions = ['plain', 'naïve café ☕', 'line\u2028sep\u2029', 'tab\tquote"back\\slash\x01', '']
+        for i, description in enumerate(descriptions):
+            Transaction.objects.create(
+                user=self.user, amount=Decimal('1234.5') * i, transaction_type=Transaction.CREDIT,
+                description=description, created_at=now.replace(microsecond=0) if i == 2 else now - timedelta(days=i),
+            )
+
+    def fetch_both(self, url):
+        responses = []
+        for fast in (False, True):
+            caches[wallet_cache.CACHE_ALIAS].clear()
+            with override_settings(WALLET_FAST_SERIALIZATION=fast), \
+                    mock.patch('wallet.views.fastjson.transaction_rows', wraps=fastjson.transaction_rows) as rows, \
+                    mock.patch('wallet.views.fastjson.user_rows', wraps=fastjson.user_rows) as users:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(rows.called or users.called, fast)
+            responses.append(response.content)
+        return responses
+
+    def test_transactions_match_the_serializer_byte_for_byte(self):
+        for url in (
+            f'/api/transactions/{self.user.pk}/?page_size=2',
+            f'/api/transactions/{self.user.pk}/?page_size=100&transaction_type=credit',
+        ):
+            slow, fast = self.fetch_both(url)
+            self.assertEqual(fast, slow)
+        self.assertIn(b'\\u2028', fast)
+        self.assertIn('naïve café ☕'.encode('utf-8'), fast)
+
+    def test_non_utc_time_zone_matches(self):
+        with timezone.override('America/Sao_Paulo'):
+            slow, fast = self.fetch_both(f'/api/transactions/{self.user.pk}/')
+        self.assertEqual(fast, slow)
+        self.assertIn(b'-03:00', fast)
+
+    def test_users_match_the_serializer_byte_for_byte(self):
+        for url in ('/api/users/', '/api/users/?page_size=2', '/api/users/?fields=email,username'):
+            slow, fast = self.fetch_both(url)
+            self.assertEqual(fast, slow)
+
+    def test_cursor_pages_continue_across_both_paths(self):
+        with override_settings(WALLET_FAST_SERIALIZATION=True):
+            first = self.client.get(f'/api/transactions/{self.user.pk}/?page_size=2').json()
+        with override_settings(WALLET_FAST_SERIALIZATION=False):
+            second = self.client.get(first['next']).json()
+        ids = [row['id'] for row in first['results'] + second['results']]
+        self.assertEqual(len(ids), 4)
+        self.assertEqual(len(set(ids)), 4)
+
+    def test_bench_serialization_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'bench.json')
+            call_command('bench_serialization', rows=20, repeat=1, output=output, stdout=io.StringIO())
+            with open(output, encoding='utf-8') as handle:
+                report = json.load(handle)
+        self.assertEqual(set(report), {'transactions', 'users'})
+        self.assertEqual(Transaction.objects.count(), 5)
+        self.assertFalse(get_user_model().objects.filter(username__startswith='bench-serialization-').exists())
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class AsyncEndpointTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='alice', email='alice@example.com')
+
+    async def test_async_reads_match_sync_endpoints(self):
+        for _ in range(3):
+            response = await self.async_client.post(
+                '/api/async/wallet/update/',
+                {'user_id': self.user.pk, 'amount': '2.00', 'transaction_type': 'credit'},
+                content_type='application/json',
+            )
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['balance'], '6.00')
+
+        for sync_url, async_url in [
+            ('/api/users/?fields=id,username', '/api/async/users/?fields=id,username'),
+            (f'/api/transactions/{self.user.pk}/?page_size=2', f'/api/async/transactions/{self.user.pk}/?page_size=2'),
+        ]:
+            expected = (await self.async_client.get(sync_url)).json()
+            actual = (await self.async_client.get(async_url)).json()
+            self.assertEqual(actual['results'], expected['results'])
+            self.assertEqual(actual['next'] is None, expected['next'] is None)
+
+    async def test_async_errors(self):
+        response = await self.async_client.get('/api/async/users/?fields=password')
+        self.assertEqual(response.status_code, 400)
+        response = await self.async_client.get(f'/api/async/transactions/{self.user.pk}/?cursor=bogus')
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_client.post(
+            '/api/async/wallet/update/',
+            {'user_id': self.user.pk, 'amount': '1.00', 'transaction_type': 'debit'},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, WALLET_LEDGER_MODE='outbox')
+class LedgerOutboxTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='alice')
+
+    def post(self, amount, transaction_type='credit', url='/api/wallet/update/'):
+        return self.client.post(url, {
+            'user_id': self.user.pk, 'amount': amount, 'transaction_type': transaction_type, 'description': 'pay',
+        }, content_type='application/json')
+
+    def test_writes_are_queued_then_drained(self):
+        response = self.post('10.00', url='/api/wallet/update/?response=compact')
+        self.assertEqual(response.json()['transaction_id'], None)
+        self.post('4.00', 'debit')
+        self.assertFalse(Transaction.objects.exists())
+        self.assertEqual(outbox_lag()['pending'], 2)
+
+        # Queued rows already count towards the ledger, so nothing looks drifted.
+        self.assertEqual(list(reconcile_balances()), [])
+        self.assertEqual(checkpoint_balances(), 0)
+
+        self.assertEqual(drain_batch(batch_size=1), 1)
+        self.assertEqual(drain_batch(), 1)
+        self.assertEqual(drain_batch(), 0)
+        self.assertFalse(LedgerOutbox.objects.exists())
+        self.assertEqual(
+            list(Transaction.objects.order_by('id').values_list('transaction_type', 'amount', 'description')),
+            [('credit', Decimal('10.00'), 'pay'), ('debit', Decimal('4.00'), 'pay')],
+        )
+        self.assertEqual(checkpoint_balances(), 1)
+        self.assertEqual(BalanceCheckpoint.objects.get().balance, Decimal('6.00'))
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ShardedWalletTests(TestCase):
+    def setUp(self):
+        caches[wallet_cache.CACHE_ALIAS].clear()
+        self.user = get_user_model().objects.create(username='merchant')
+        Wallet.objects.create(user=self.user)
+        call_command('shard_wallet', self.user.pk, 4, stdout=io.StringIO())
+
+    def post(self, **data):
+        return self.client.post('/api/wallet/update/', data, content_type='application/json')
+
+    def test_credits_land_in_shards_and_reads_see_the_total(self):
+        wallet = Wallet.objects.get(user=self.user)
+        for _ in range(8):
+            response = self.post(user_id=self.user.pk, amount='1.00', transaction_type='credit')
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['balance'], '8.00')
+        self.assertEqual(Wallet.objects.get(pk=wallet.pk).balance, Decimal('0.00'))
+        self.assertEqual(sum(wallet.shards.values_list('balance', flat=True)), Decimal('8.00'))
+        self.assertEqual(self.client.get(f'/api/wallet/{self.user.pk}/').json()['balance'], '8.00')
+        self.assertEqual(list(reconcile_balances()), [])
+
+    def test_debit_checks_and_folds_the_total(self):
+        self.post(user_id=self.user.pk, amount='5.00', transaction_type='credit')
+
+        response = self.post(user_id=self.user.pk, amount='5.01', transaction_type='debit')
+        self.assertEqual(response.json()['detail'], 'Insufficient balance.')
+
+        response = self.post(user_id=self.user.pk, amount='5.00', transaction_type='debit', response='compact')
+        self.assertEqual(response.json()['balance'], '0.00')
+        wallet = Wallet.objects.get(user=self.user)
+        self.assertEqual(wallet.shard_count, 4)
+        self.assertEqual(set(wallet.shards.values_list('balance', flat=True)), {Decimal('0.00')})
+
+    def test_credit_racing_a_reshard_is_not_lost(self):
+        credit = shards.credit
+        for shard_count in (2, 0):
+            resharded = []
+
+            def reshard_first(wallet_id, count, amount, using):
+                # Another request re-shards after shard_count was read.
+                if not resharded:
+                    resharded.append(shards.set_shard_count(self.user.pk, shard_count, using))
+                return credit(wallet_id, count, amount, using)
+
+            picker = mock.Mock(randrange=lambda count: count - 1)
+            with mock.patch('wallet.shards.credit', side_effect=reshard_first), mock.patch('wallet.shards.random', picker):
+                response = self.post(user_id=self.user.pk, amount='1.00', transaction_type='credit', response='compact')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(Wallet.objects.get(user=self.user).shard_count, shard_count)
+        self.assertEqual(self.client.get(f'/api/wallet/{self.user.pk}/').json()['balance'], '2.00')
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(list(reconcile_balances()), [])
+
+    def test_bulk_updates_and_unsharding_keep_the_total(self):
+        self.post(user_id=self.user.pk, amount='3.00', transaction_type='credit')
+        response = self.client.post('/api/wallet/bulk-update/', {'operations': [
+            {'user_id': self.user.pk, 'amount': '4.50', 'transaction_type': 'debit'},
+            {'user_id': self.user.pk, 'amount': '0.50', 'transaction_type': 'debit'},
+        ]}, content_type='application/json')
+        self.assertEqual([r.get('balance') for r in response.json()['results']], [None, '2.50'])
+
+        call_command('shard_wallet', self.user.pk, 0, stdout=io.StringIO())
+        wallet = Wallet.objects.get(user=self.user)
+        self.assertEqual((wallet.shard_count, wallet.balance), (0, Decimal('2.50')))
+        self.assertFalse(wallet.shards.exists())
+
+
+class BenchmarkHarnessTests(TestCase):
+    def test_run_benchmark_writes_a_json_report(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'bench.json')
+            call_command(
+                'run_benchmark', users=3, transactions=12, requests=6, concurrency=1,
+                output=output, stdout=io.StringIO(),
+            )
+            with open(output, encoding='utf-8') as handle:
+                report = json.load(handle)
+
+        self.assertEqual([r['scenario'] for r in report['results']], ['wallet_update', 'user_transactions', 'user_list'])
+        for result in report['results']:
+            self.assertEqual((result['requests'], result['errors']), (6, 0))
+            self.assertLessEqual(result['latency_ms']['p50'], result['latency_ms']['p99'])
+            self.assertGreater(result['queries_per_request'], 0)
+        self.assertEqual(report['environment']['database_vendor'], connection.vendor)
+        self.assertEqual(Transaction.objects.count(), 18)
+        self.assertEqual(list(reconcile_balances()), [])
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        caches[wallet_cache.CACHE_ALIAS].clear()
+        metrics_registry.reset()
+        get_user_model().objects.create(username='alice')
+
+    def test_metrics_endpoint_reports_latency_queries_and_db_time_per_view(self):
+        self.client.get('/api/users/')
+        self.client.get('/api/users/')
+        self.client.get('/no-such-page/')
+
+        body = self.client.get('/metrics').content.decode()
+        labels = 'view="users-list",method="GET"'
+        self.assertIn(f'wallet_http_request_duration_seconds_count{{{labels}}} 2', body)
+        self.assertIn(f'wallet_http_db_queries_bucket{{{labels},le="1"}} 2', body)
+        self.assertIn(f'wallet_http_db_queries_sum{{{labels}}} 2.0', body)
+        self.assertIn(f'wallet_http_db_duration_seconds_count{{{labels}}} 2', body)
+        self.assertIn('wallet_http_responses_total{view="<unresolved>",method="GET",status="404"} 1', body)
+        self.assertIn('# TYPE wallet_http_db_queries histogram', body)
+
+    async def test_async_views_are_measured(self):
+        await self.async_client.get('/api/async/users/')
+        body = (await self.async_client.get('/metrics')).content.decode()
+        self.assertIn('wallet_http_db_queries_sum{view="async-users-list",method="GET"} 1.0', body)
+
+    async def test_sync_views_under_asgi_are_measured(self):
+        # DRF views run in a sync_to_async thread with connections of their own.
+        user = await get_user_model().objects.aget(username='alice')
+        await Transaction.objects.acreate(user=user, amount=Decimal('1.00'), transaction_type='credit')
+        with override_settings(SERVER_TIMING_HEADER=True):
+            response = await self.async_client.get(f'/api/transactions/{user.pk}/')
+        self.assertRegex(response['Server-Timing'], r'db;dur=[0-9.]+;desc="[1-9][0-9]* queries"$')
+        body = (await self.async_client.get('/metrics')).content.decode()
+        self.assertRegex(body, r'wallet_http_db_queries_sum\{view="user-transactions",method="GET"\} [1-9]')
+
+    def test_server_timing_header_is_opt_in(self):
+        self.assertNotIn('Server-Timing', self.client.get('/api/users/'))
+        with override_settings(SERVER_TIMING_HEADER=True):
+            header = self.client.get('/api/users/')['Server-Timing']
+        self.assertRegex(header, r'^app;dur=[0-9.]+, db;dur=[0-9.]+;desc="1 queries"$')
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def make_pool(self, **options):
+        opened = []
+
+        def connect():
+            opened.append(FakeConnection())
+            return opened[-1]
+
+        options.setdefault('timeout', 1.0)
+        pool = ConnectionPool('test', connect=connect, close=FakeConnection.close, **options)
+        return pool, opened
+
+    def test_returned_connections_are_reused_most_recent_first(self):
+        pool, opened = self.make_pool(max_size=2)
+        first, second = pool.getconn(), pool.getconn()
+        pool.putconn(first)
+        pool.putconn(second)
+        self.assertIs(pool.getconn(), second)
+        self.assertEqual(len(opened), 2)
+        self.assertEqual(pool.stats()['in_use'], 1)
+
+    def test_checkout_waits_for_a_free_connection_then_times_out(self):
+        pool, _ = self.make_pool(max_size=1, timeout=0.05)
+        borrowed = pool.getconn()
+        with self.assertRaises(PoolTimeout):
+            pool.getconn()
+        threading.Timer(0.01, pool.putconn, [borrowed]).start()
+        pool.timeout = 5.0
+        self.assertIs(pool.getconn(), borrowed)
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_dead_and_unresettable_connections_are_replaced(self):
+        pool, opened = self.make_pool(
+            ping=lambda connection: not connection.closed,
+            reset=lambda connection: connection is not opened[0],
+        )
+        first = pool.getconn()
+        pool.putconn(first)
+        self.assertTrue(first.closed)
+        second = pool.getconn()
+        pool.putconn(second)
+        second.closed = True
+        third = pool.getconn()
+        self.assertEqual(opened, [first, second, third])
+        stats = pool.stats()
+        self.assertEqual((stats['size'], stats['ping_failures'], stats['discarded']), (1, 1, 2))
+
+    def test_idle_connections_beyond_min_size_expire(self):
+        pool, opened = self.make_pool(min_size=1, max_size=3, max_idle=0.0)
+        borrowed = [pool.getconn() for _ in range(3)]
+        for connection in borrowed:
+            pool.putconn(connection)
+        time.sleep(0.001)
+        pool.putconn(pool.getconn())
+        self.assertEqual(pool.stats()['size'], 1)
+        self.assertEqual(sum(connection.closed for connection in opened), 2)
+
+    def test_concurrent_borrowers_never_exceed_max_size(self):
+        pool, opened = self.make_pool(max_size=4, timeout=10.0)
+        lock, peak, active = threading.Lock(), [0], [0]
+
+        def borrow():
+            for _ in range(50):
+                connection = pool.getconn()
+                with lock:
+                    active[0] += 1
+                    peak[0] = max(peak[0], active[0])
+                time.sleep(0.0005)
+                with lock:
+                    active[0] -= 1
+                pool.putconn(connection)
+
+        threads = [threading.Thread(target=borrow) for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLessEqual(peak[0], 4)
+        self.assertEqual(len(opened), 4)
+        self.assertEqual(pool.wait_seconds.snapshot()[2], 16 * 50)
+
+    def test_backend_hands_connections_back_to_the_pool(self):
+        settings_dict = {
+            **connection.settings_dict, 'ENGINE': 'config.postgresql_pool', 'NAME': 'wallet',
+            'OPTIONS': {'pool': {'max_size': 2, 'pre_ping': False}},
+        }
+        wrapper = PooledDatabaseWrapper(settings_dict, alias='pool-test')
+        self.addCleanup(close_pools, ['pool-test'])
+        params = wrapper.get_connection_params()
+        self.assertNotIn('pool', params)
+        raw = mock.Mock(closed=0, **{'info.transaction_status': 0})
+        with mock.patch('django.db.backends.postgresql.base.DatabaseWrapper.get_new_connection', return_value=raw) as connect:
+            for _ in range(3):
+                wrapper.connection = wrapper.get_new_connection(params)
+                wrapper._close()
+        self.assertEqual(connect.call_count, 1)
+        raw.close.assert_not_called()
+        body = metrics_registry.render()
+        self.assertIn('wallet_db_pool_connections{pool="pool-test",state="idle"} 1', body)
+        self.assertIn('wallet_db_pool_opened_total{pool="pool-test"} 1', body)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'the pooled backend needs PostgreSQL')
+class PooledPostgreSQLTests(TransactionTestCase):
+    """config.postgresql_pool on the test database, through the real driver."""
+
+    def pooled(self, alias, **pool):
+        """A factory of backend wrappers sharing the pool `alias`, and that pool."""
+        options = {key: value for key, value in connection.settings_dict['OPTIONS'].items() if key != 'pool'}
+        settings_dict = {
+            **connection.settings_dict, 'ENGINE': 'config.postgresql_pool',
+            'OPTIONS': {**options, 'pool': {'timeout': 10.0, **pool}},
+        }
+        self.addCleanup(close_pools, [alias])
+        wrapper = PooledDatabaseWrapper(settings_dict, alias=alias)
+        wrapper.ensure_connection()
+        shared = wrapper._pool
+        wrapper.close()
+        return (lambda: PooledDatabaseWrapper(settings_dict, alias=alias)), shared
+
+    def backend_pid(self, wrapper):
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            return cursor.fetchone()[0]
+
+    def other_sessions(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT count(*) FROM pg_stat_activity WHERE datname = current_database() AND pid <> pg_backend_pid()',
+            )
+            return cursor.fetchone()[0]
+
+    def test_burst_shares_max_size_connections_and_returns_them_all(self):
+        threads, requests, max_size = 32, 20, 4
+        new_wrapper, pool = self.pooled('pool-burst', max_size=max_size)
+        waits, errors, lock = [], [], threading.Lock()
+
+        def burst():
+            wrapper = new_wrapper()
+            try:
+                for _ in range(requests):
+                    started = time.monotonic()
+                    wrapper.ensure_connection()
+                    waited = time.monotonic() - started
+                    with wrapper.cursor() as cursor:
+                        cursor.execute('SELECT pg_sleep(0.001)')
+                    wrapper.close()
+                    with lock:
+                        waits.append(waited)
+            except Exception as exc:
+                errors.append(exc)
+
+        workers = [threading.Thread(target=burst) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(errors, [])
+        waits.sort()
+        # Eight borrowers per connection wait for a few short queries, never for the timeout.
+        self.assertLess(waits[int(len(waits) * 0.99) - 1], 1.0)
+        stats = pool.stats()
+        self.assertEqual((stats['in_use'], stats['waiting'], stats['timeouts']), (0, 0, 0))
+        self.assertLessEqual(stats['opened'], max_size)
+        self.assertLessEqual(self.other_sessions(), max_size)
+        close_pools(['pool-burst'])
+        self.assertEqual(self.other_sessions(), 0)
+
+    def test_connection_returned_after_an_error_is_rolled_back_and_reused(self):
+        new_wrapper, pool = self.pooled('pool-error', max_size=1, pre_ping=False)
+        wrapper = new_wrapper()
+        wrapper.ensure_connection()
+        raw = wrapper.connection
+        wrapper.set_autocommit(False)
+        with self.assertRaises(DatabaseError), wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1 / 0')
+        self.assertEqual(raw.info.transaction_status, TRANSACTION_STATUS_INERROR)
+        wrapper.close()
+
+        wrapper = new_wrapper()
+        wrapper.ensure_connection()
+        self.assertIs(wrapper.connection, raw)
+        self.assertTrue(wrapper.get_autocommit())
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            self.assertEqual(cursor.fetchone(), (1,))
+        wrapper.close()
+        self.assertEqual((pool.stats()['opened'], pool.stats()['discarded']), (1, 0))
+
+    def test_connection_returned_inside_a_transaction_is_rolled_back(self):
+        new_wrapper, pool = self.pooled('pool-txn', max_size=1, pre_ping=False)
+        wrapper = new_wrapper()
+        wrapper.ensure_connection()
+        wrapper.set_autocommit(False)
+        with wrapper.cursor() as cursor:
+            cursor.execute("INSERT INTO auth_group (name) VALUES ('uncommitted')")
+        self.assertEqual(wrapper.connection.info.transaction_status, TRANSACTION_STATUS_INTRANS)
+        wrapper.close()
+        self.assertFalse(Group.objects.filter(name='uncommitted').exists())
+
+        wrapper = new_wrapper()
+        with wrapper.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM auth_group WHERE name = 'uncommitted'")
+            self.assertEqual(cursor.fetchone(), (0,))
+        self.assertEqual(wrapper.connection.info.transaction_status, TRANSACTION_STATUS_IDLE)
+        wrapper.close()
+        self.assertEqual(pool.stats()['opened'], 1)
+
+    def test_pre_ping_replaces_a_terminated_connection(self):
+        new_wrapper, pool = self.pooled('pool-ping', max_size=1, pre_ping=True)
+        wrapper = new_wrapper()
+        killed = self.backend_pid(wrapper)
+        wrapper.close()
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_terminate_backend(%s)', [killed])
+        for _ in range(100):
+            if not self.other_sessions():
+                break
+            time.sleep(0.01)
+
+        wrapper = new_wrapper()
+        self.assertNotEqual(self.backend_pid(wrapper), killed)
+        wrapper.close()
+        stats = pool.stats()
+        self.assertEqual((stats['ping_failures'], stats['discarded'], stats['opened']), (1, 1, 2))
+
+    def test_connections_past_max_lifetime_are_replaced(self):
+        new_wrapper, pool = self.pooled('pool-lifetime', max_size=1, max_lifetime=0.2)
+        wrapper = new_wrapper()
+        first = self.backend_pid(wrapper)
+        wrapper.close()
+        time.sleep(0.3)
+
+        wrapper = new_wrapper()
+        self.assertNotEqual(self.backend_pid(wrapper), first)
+        wrapper.close()
+        stats = pool.stats()
+        self.assertEqual((stats['discarded'], stats['opened'], stats['size']), (1, 2, 1))
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class TransactionSummaryTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='alice')
+
+    def post(self, amount, transaction_type):
+        return self.client.post(
+            '/api/wallet/update/',
+            {'user_id': self.user.pk, 'amount': amount, 'transaction_type': transaction_type},
+            content_type='application/json',
+        )
+
+    def test_every_write_path_keeps_the_rollups_equal_to_a_rebuild(self):
+        self.post('10.00', 'credit')
+        self.post('2.50', 'debit')
+        self.client.post('/api/wallet/bulk-update/', {'operations': [
+            {'user_id': self.user.pk, 'amount': '1.25', 'transaction_type': 'credit'},
+            {'user_id': self.user.pk, 'amount': '0.75', 'transaction_type': 'debit'},
+        ]}, content_type='application/json')
+        with override_settings(WALLET_LEDGER_MODE='outbox'):
+            self.post('4.00', 'credit')
+        drain_batch()
+
+        summary = self.client.get(f'/api/transactions/{self.user.pk}/summary/').json()
+        today = timezone.localdate().isoformat()
+        self.assertEqual(summary['results'], [{
+            'period': today,
+            'credit_total': '15.25', 'credit_count': 3,
+            'debit_total': '3.25', 'debit_count': 2,
+            'net': '12.00',
+        }])
+
+        incremental = sorted(DailyTransactionRollup.objects.values_list(
+            'day', 'credit_total', 'credit_count', 'debit_total', 'debit_count',
+        ))
+        call_command('rebuild_rollups', stdout=io.StringIO())
+        rebuilt = sorted(DailyTransactionRollup.objects.values_list(
+            'day', 'credit_total', 'credit_count', 'debit_total', 'debit_count',
+        ))
+        self.assertEqual(incremental, rebuilt)
+
+    def test_monthly_buckets_and_date_range(self):
+        Wallet.objects.create(user=self.user)
+        for day, amount in [('2024-01-05', '1.00'), ('2024-01-20', '2.00'), ('2024-02-01', '4.00')]:
+            Transaction.objects.create(
+                user=self.user, amount=Decimal(amount), transaction_type=Transaction.CREDIT,
+                created_at=timezone.make_aware(timezone.datetime.fromisoformat(day)),
+            )
+        call_command('rebuild_rollups', stdout=io.StringIO())
+        url = f'/api/transactions/{self.user.pk}/summary/'
+
+        months = self.client.get(url, {'period': 'month'}).json()['results']
+        self.assertEqual([(r['period'], r['credit_total'], r['credit_count']) for r in months],
+                         [('2024-01-01', '3.00', 2), ('2024-02-01', '4.00', 1)])
+        days = self.client.get(url, {'start': '2024-01-06', 'end': '2024-02-01'}).json()['results']
+        self.assertEqual([r['period'] for r in days], ['2024-01-20'])
+
+        self.assertEqual(self.client.get(url, {'period': 'year'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'start': 'yesterday'}).status_code, 400)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class TransactionFilterTests(TestCase):
+    def setUp(self):
+        caches[wallet_cache.CACHE_ALIAS].clear()
+        self.user = get_user_model().objects.create(username='alice')
+        base = timezone.make_aware(timezone.datetime(2024, 1, 1))
+        rows = [
+            ('credit', '10.00', 'Salary January', 0),
+            ('debit', '3.50', 'Coffee beans', 3),
+            ('debit', '25.00', 'Groceries', 10),
+            ('credit', '7.25', 'Refund: coffee grinder', 40),
+        ]
+        self.ids = {}
+        for transaction_type, amount, description, day in rows:
+            self.ids[description] = Transaction.objects.create(
+                user=self.user, transaction_type=transaction_type, amount=Decimal(amount),
+                description=description, created_at=base + timedelta(days=day),
+            ).pk
+
+    def fetch(self, **params):
+        response = self.client.get(f'/api/transactions/{self.user.pk}/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return [row['description'] for row in response.json()['results']]
+
+    def test_filters_combine(self):
+        self.assertEqual(self.fetch(transaction_type='debit'), ['Groceries', 'Coffee beans'])
+        self.assertEqual(self.fetch(min_amount='5', max_amount='10'), ['Refund: coffee grinder', 'Salary January'])
+        self.assertEqual(self.fetch(start='2024-01-02', end='2024-02-01'), ['Groceries', 'Coffee beans'])
+        self.assertEqual(self.fetch(description='COFFEE'), ['Refund: coffee grinder', 'Coffee beans'])
+        self.assertEqual(self.fetch(description='coffee', transaction_type='credit'), ['Refund: coffee grinder'])
+
+    def test_filtered_pages_bypass_the_cache_and_paginate(self):
+        self.fetch()
+        first = self.client.get(f'/api/transactions/{self.user.pk}/', {'transaction_type': 'debit', 'page_size': 1}).json()
+        self.assertEqual([row['description'] for row in first['results']], ['Groceries'])
+        second = self.client.get(first['next']).json()
+        self.assertEqual([row['description'] for row in second['results']], ['Coffee beans'])
+        self.assertIsNone(second['next'])
+
+    def test_invalid_filters_are_rejected(self):
+        for params in (
+            {'transaction_type': 'refund'}, {'min_amount': 'lots'}, {'start': 'last week'}, {'end': 'tomorrow'},
+        ):
+            for url in (f'/api/transactions/{self.user.pk}/', f'/api/async/transactions/{self.user.pk}/'):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(list(response.json()), list(params))
+
+    def plan(self, **params):
+        queryset = filter_transactions(Transaction.objects.filter(user=self.user), params)
+        return queryset.order_by('-created_at', '-id')[:51].explain()
+
+    def test_query_plans_use_the_filter_indexes(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite plan format')
+        self.assertIn('wallet_txn_user_debit_idx', self.plan(transaction_type='debit'))
+        self.assertIn('wallet_txn_user_credit_idx', self.plan(transaction_type='credit'))
+        self.assertIn('wallet_txn_user_amount_idx', self.plan(min_amount='5', max_amount='10'))
+        self.assertIn('wallet_txn_user_created_id_idx', self.plan(start='2024-01-02', end='2024-02-01'))
+        # No trigram index here: the LIKE is checked on the user's rows only.
+        self.assertIn('wallet_txn_user_', self.plan(description='coffee'))
+        self.assertNotIn('SCAN wallet_transaction', self.plan(description='coffee'))
+
+    def test_description_search_uses_the_trigram_index_on_postgresql(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest('pg_trgm index exists only on PostgreSQL')
+        queryset = Transaction.objects.filter(description__icontains='coffee')
+        with db_transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            self.assertIn('wallet_txn_description_trgm_idx', queryset.explain())
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class TransactionArchiveTests(TestCase):
+    def setUp(self):
+        caches[wallet_cache.CACHE_ALIAS].clear()
+        self.user = get_user_model().objects.create(username='alice')
+        for amount, month in (('10.00', 1), ('2.50', 1), ('4.00', 2), ('1.25', None)):
+            self.client.post('/api/wallet/update/', {
+                'user_id': self.user.pk, 'amount': amount, 'transaction_type': 'credit', 'description': amount,
+            }, content_type='application/json')
+            if month:
+                latest = Transaction.objects.latest('id')
+                latest.created_at = datetime(2024, month, 10, 12, latest.pk, tzinfo=dt_timezone.utc)
+                latest.save(update_fields=['created_at'])
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings_override = override_settings(WALLET_ARCHIVE_DIR=self.directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def history(self, **params):
+        url, rows = f'/api/transactions/{self.user.pk}/', []
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200, response.content)
+            rows.extend(response.json()['results'])
+            url, params = response.json()['next'], {}
+        return rows
+
+    def test_archived_months_leave_the_table_and_read_back_on_demand(self):
+        everything = self.history()
+        checkpoint_balances()
+        call_command('rebuild_rollups', stdout=io.StringIO())
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('archive_transactions', '--before', '2024-03', stdout=io.StringIO())
+
+        self.assertEqual(list(Transaction.objects.values_list('description', flat=True)), ['1.25'])
+        with gzip.open(os.path.join(self.directory, 'transactions-2024-01.jsonl.gz'), 'rt') as handle:
+            self.assertEqual([json.loads(line)['amount'] for line in handle], ['2.50', '10.00'])
+        self.assertEqual(self.history(), everything[:1])
+        self.assertEqual(self.history(include_archived='true', page_size=2), everything)
+        self.assertEqual(list(reconcile_balances()), [])
+        # Rebuilding rollups keeps the archived days.
+        call_command('rebuild_rollups', stdout=io.StringIO())
+        self.assertEqual(DailyTransactionRollup.objects.filter(day__lt=date(2024, 3, 1)).count(), 2)
+
+    def test_months_after_the_latest_checkpoint_are_refused(self):
+        with self.assertRaisesMessage(CommandError, 'checkpoint_balances'):
+            call_command('archive_transactions', '--before', '2024-03')
+        self.assertEqual(Transaction.objects.count(), 4)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_archived_history_cannot_be_filtered(self):
+        response = self.client.get(
+            f'/api/transactions/{self.user.pk}/', {'include_archived': 'true', 'transaction_type': 'credit'},
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_partitions(self):
+        self.assertEqual(partitions.add_months(date(2024, 11, 1), 3), date(2025, 2, 1))
+        self.assertEqual(partitions.partition_name(date(2024, 2, 1)), 'wallet_transaction_y2024m02')
+        if connection.vendor != 'postgresql':
+            self.assertEqual(partitions.ensure_partitions(), [])
+            return
+        self.assertTrue(partitions.is_partitioned())
+        current = partitions.month_of(timezone.now())
+        self.assertIn(current, partitions.partition_months())
+        later = partitions.add_months(current, 12)
+        self.assertTrue(partitions.create_partition(later))
+        self.assertFalse(partitions.create_partition(later))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'migration 0009 only rebuilds the table on PostgreSQL')
+class PartitionMigrationTests(TransactionTestCase):
+    """Migration 0009 forwards and backwards over a populated ledger."""
+    before = ('wallet', '0008_transaction_filter_indexes')
+    partitioned = ('wallet', '0009_partition_transactions')
+
+    def tearDown(self):
+        call_command('migrate', 'wallet', verbosity=0)
+
+    def migrate(self, target):
+        call_command('migrate', *target, verbosity=0)
+        return MigrationExecutor(connection).loader.project_state(target).apps
+
+    def layout(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s',
+                ['wallet_transaction'],
+            )
+            indexes = {row[0] for row in cursor.fetchall()}
+            cursor.execute(
+                "SELECT conname, contype FROM pg_constraint WHERE conrelid = 'wallet_transaction'::regclass",
+            )
+            constraints = set(cursor.fetchall())
+            cursor.execute('SELECT count(*), max(id) FROM wallet_transaction')
+            count, last_id = cursor.fetchone()
+        return indexes, constraints, count, last_id
+
+    def assertLedgerIntact(self, apps, indexes, constraints, count, last_id):
+        now_indexes, now_constraints, now_count, now_last_id = self.layout()
+        self.assertEqual(now_count, count)
+        self.assertEqual(now_last_id, last_id)
+        self.assertEqual(now_indexes, indexes)
+        self.assertEqual(now_constraints, constraints)
+        historical = apps.get_model('wallet', 'Transaction')
+        row = historical.objects.create(user_id=self.user.pk, amount=Decimal('1.00'), transaction_type='credit')
+        self.assertGreater(row.pk, last_id)
+        with connection.cursor() as cursor:
+            # The foreign key is deferred, so it is checked when the block commits.
+            with self.assertRaises(IntegrityError), db_transaction.atomic():
+                cursor.execute(
+                    "INSERT INTO wallet_transaction (user_id, amount, transaction_type, description, created_at) "
+                    "VALUES (%s, 1, 'credit', '', now())",
+                    [self.user.pk + 1000],
+                )
+            with self.assertRaises(IntegrityError), db_transaction.atomic():
+                cursor.execute(
+                    "INSERT INTO wallet_transaction (id, user_id, amount, transaction_type, description, created_at) "
+                    "SELECT id, user_id, amount, transaction_type, description, created_at FROM wallet_transaction "
+                    "WHERE id = %s",
+                    [row.pk],
+                )
+        row.delete()
+
+    def test_round_trip_keeps_rows_sequence_and_constraints(self):
+        apps = self.migrate(self.before)
+        self.assertFalse(partitions.is_partitioned())
+        self.user = get_user_model().objects.create(username='ledger')
+        historical = apps.get_model('wallet', 'Transaction')
+        now = timezone.now()
+        historical.objects.bulk_create([
+            # Old months, the current one, and one far enough ahead to land in the default partition.
+            historical(
+                user_id=self.user.pk, amount=Decimal('1.00'), transaction_type='credit',
+                created_at=now + timedelta(days=days),
+            )
+            for days in (-400, -95, -40, -1, 0, 0, 730)
+        ])
+        indexes, constraints, count, last_id = self.layout()
+
+        apps = self.migrate(self.partitioned)
+        self.assertTrue(partitions.is_partitioned())
+        self.assertIn('wallet_transaction_default', connection.introspection.table_names())
+        self.assertLedgerIntact(apps, indexes, constraints, count, last_id)
+
+        call_command('migrate', 'wallet', verbosity=0)
+        row = Transaction.objects.create(user=self.user, amount=Decimal('2.00'), transaction_type='debit')
+        self.assertGreater(row.pk, last_id)
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), count + 1)
+        IdempotencyKey.objects.create(key='round-trip', fingerprint='a')
+        with self.assertRaises(IntegrityError), db_transaction.atomic():
+            IdempotencyKey.objects.create(key='round-trip', fingerprint='b')
+        row.delete()
+
+        apps = self.migrate(self.before)
+        self.assertFalse(partitions.is_partitioned())
+        self.assertLedgerIntact(apps, indexes, constraints, count, last_id)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class WalletTransferTests(TestCase):
+    def setUp(self):
+        caches[wallet_cache.CACHE_ALIAS].clear()
+        self.alice = get_user_model().objects.create(username='alice')
+        self.bob = get_user_model().objects.create(username='bob')
+        self.client.post('/api/wallet/update/', {
+            'user_id': self.alice.pk, 'amount': '10.00', 'transaction_type': 'credit',
+        }, content_type='application/json')
+
+    def transfer(self, amount, **overrides):
+        payload = {'from_user_id': self.alice.pk, 'to_user_id': self.bob.pk, 'amount': amount, 'description': 'rent'}
+        payload.update(overrides)
+        return self.client.post('/api/wallet/transfer/', payload, content_type='application/json')
+
+    def test_transfer_writes_a_paired_debit_and_credit(self):
+        response = self.transfer('4.00')
+        self.assertEqual(response.status_code, 200, response.content)
+        body = response.json()
+        self.assertEqual((body['from_balance'], body['to_balance']), ('6.00', '4.00'))
+
+        rows = Transaction.objects.filter(transfer_id=body['transfer_id']).order_by('id')
+        self.assertEqual(
+            [(row.pk, row.user_id, row.transaction_type, row.amount, row.description) for row in rows],
+            [
+                (body['debit_transaction_id'], self.alice.pk, 'debit', Decimal('4.00'), 'rent'),
+                (body['credit_transaction_id'], self.bob.pk, 'credit', Decimal('4.00'), 'rent'),
+            ],
+        )
+        self.assertEqual(self.client.get(f'/api/wallet/{self.bob.pk}/').json()['balance'], '4.00')
+        self.assertEqual(list(reconcile_balances()), [])
+
+    def test_rejected_transfers_change_nothing(self):
+        self.assertEqual(self.transfer('10.01').json(), {'detail': 'Insufficient balance.'})
+        self.assertEqual(self.transfer('1.00', to_user_id=self.alice.pk).status_code, 400)
+        self.assertEqual(self.transfer('-1').status_code, 400)
+        self.assertEqual(self.transfer('1.00', to_user_id=999999).status_code, 404)
+        self.assertEqual(Transaction.objects.count(), 1)
+        self.assertEqual(Wallet.objects.get(user=self.alice).balance, Decimal('10.00'))
+        self.assertFalse(Wallet.objects.filter(user=self.bob).exists())
+
+    @override_settings(WALLET_LEDGER_MODE='outbox')
+    def test_outbox_mode_keeps_the_transfer_id(self):
+        body = self.transfer('2.50').json()
+        self.assertIsNone(body['debit_transaction_id'])
+        drain_batch()
+        self.assertEqual(Transaction.objects.filter(transfer_id=body['transfer_id']).count(), 2)
+
+
+class ConcurrentTransferTests(TransactionTestCase):
+    """Opposing transfers from many threads: no deadlocks, no lost updates."""
+    threads = 8
+    transfers_per_thread = 25
+
+    def setUp(self):
+        caches[wallet_cache.CACHE_ALIAS].clear()
+        self.user_ids = [get_user_model().objects.create(username=f'user{index}').pk for index in range(3)]
+        Wallet.objects.bulk_create([Wallet(user_id=user_id, balance=Decimal('100.00')) for user_id in self.user_ids])
+        Transaction.objects.bulk_create([
+            Transaction(user_id=user_id, amount=Decimal('100.00'), transaction_type='credit') for user_id in self.user_ids
+        ])
+
+    def run_transfers(self, slot, applied, failures):
+        rng = random.Random(slot)
+        try:
+            for _ in range(self.transfers_per_thread):
+                sender, recipient = rng.sample(self.user_ids, 2)
+                op = TransferOperation(sender, recipient, Decimal(rng.choice(['0.01', '1.00', '7.35', '40.00'])))
+                while True:
+                    try:
+                        applied.append((op, apply_transfer(op)[0]))
+                    except WalletOperationError:
+                        pass
+                    except OperationalError as exc:
+                        # SQLite has one writer at a time and reports a busy
+                        # database instead of waiting; PostgreSQL waits on the
+                        # row locks, so any error there (a deadlock) fails.
+                        if connection.vendor == 'sqlite' and 'locked' in str(exc):
+                            time.sleep(0.001)
+                            continue
+                        raise
+                    break
+        except Exception as exc:
+            failures.append(exc)
+        finally:
+            connections.close_all()
+
+    def test_opposing_transfers(self):
+        applied, failures = [], []
+        workers = [
+            threading.Thread(target=self.run_transfers, args=(slot, applied, failures))
+            for slot in range(self.threads)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(failures, [])
+        self.assertTrue(applied)
+
+        expected = {user_id: Decimal('100.00') for user_id in self.user_ids}
+        for op, _ in applied:
+            expected[op.from_user_id] -= op.amount
+            expected[op.to_user_id] += op.amount
+        self.assertEqual(dict(Wallet.objects.values_list('user_id', 'balance')), expected)
+        self.assertEqual(Transaction.objects.exclude(transfer_id=None).count(), 2 * len(applied))
+        self.assertEqual(len({transfer_id for _, transfer_id in applied}), len(applied))
+        self.assertEqual(list(reconcile_balances()), [])
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ScheduledOperationTests(TestCase):
+    def setUp(self):
+        caches[wallet_cache.CACHE_ALIAS].clear()
+        self.user = get_user_model().objects.create(username='alice')
+        self.start = datetime(2026, 1, 31, 9, 0, tzinfo=dt_timezone.utc)
+
+    def schedule(self, **data):
+        response = self.client.post(
+            '/api/wallet/scheduled/',
+            {'user_id': self.user.pk, 'amount': '10.00', 'transaction_type': 'credit', **data},
+            content_type='application/json',
+        )
+        return response
+
+    def balance(self):
+        return Wallet.objects.get(user=self.user).balance
+
+    def test_endpoint_validates_and_creates(self):
+        self.assertEqual(self.schedule(recurrence='hourly').status_code, 400)
+        self.assertEqual(self.schedule(run_at='tomorrow').status_code, 400)
+        self.assertEqual(self.schedule(run_at='2026-02-01T00:00:00Z', ends_at='2026-01-01T00:00:00Z').status_code, 400)
+        self.assertEqual(self.schedule(user_id=self.user.pk + 100).status_code, 404)
+        response = self.schedule(run_at='2026-01-31T09:00:00Z', recurrence='monthly', description='allowance')
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertEqual((body['status'], body['run_at'], body['recurrence']), ('pending', '2026-01-31T09:00:00Z', 'monthly'))
+        self.assertEqual(ScheduledOperation.objects.get().description, 'allowance')
+
+    def test_one_off_operations_run_once_when_due(self):
+        self.schedule(run_at='2026-01-31T09:00:00Z')
+        self.assertEqual(run_due_batch(now=self.start - timedelta(seconds=1)), (0, 0))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(run_due_batch(now=self.start), (1, 0))
+        self.assertEqual(run_due_batch(now=self.start + timedelta(days=365)), (0, 0))
+        schedule = ScheduledOperation.objects.get()
+        self.assertEqual((schedule.status, schedule.occurrences, schedule.last_run_at), ('done', 1, self.start))
+        self.assertEqual(self.balance(), Decimal('10.00'))
+        self.assertEqual(self.client.get(f'/api/wallet/{self.user.pk}/').json()['balance'], '10.00')
+        self.assertEqual(list(reconcile_balances()), [])
+
+    def test_recurrences_follow_the_calendar_and_stop_at_ends_at(self):
+        self.schedule(run_at='2026-01-31T09:00:00Z', recurrence='monthly', ends_at='2026-05-01T00:00:00Z')
+        self.schedule(run_at='2026-01-31T09:00:00Z', recurrence='weekly', amount='1.00', ends_at='2026-02-14T09:00:00Z')
+        runs = []
+        while ScheduledOperation.objects.filter(status='pending').exists():
+            now = ScheduledOperation.objects.filter(status='pending').order_by('run_at')[0].run_at
+            run_due_batch(now=now)
+            runs.append(now)
+        monthly, weekly = ScheduledOperation.objects.order_by('id')
+        self.assertEqual((monthly.occurrences, monthly.status, weekly.occurrences, weekly.status), (4, 'done', 3, 'done'))
+        self.assertEqual(
+            [run.date() for run in runs],
+            [date(2026, 1, 31), date(2026, 2, 7), date(2026, 2, 14), date(2026, 2, 28), date(2026, 3, 31), date(2026, 4, 30)],
+        )
+        self.assertEqual(self.balance(), Decimal('43.00'))
+
+    def test_failed_occurrences_are_recorded_and_skipped(self):
+        self.schedule(run_at='2026-01-31T09:00:00Z', transaction_type='debit', recurrence='daily')
+        self.schedule(run_at='2026-01-31T09:00:00Z', transaction_type='debit')
+        self.assertEqual(run_due_batch(now=self.start), (0, 2))
+        recurring, once = ScheduledOperation.objects.order_by('id')
+        self.assertEqual((recurring.status, recurring.failures, recurring.run_at), ('pending', 1, self.start + timedelta(days=1)))
+        self.assertEqual((once.status, once.last_error), ('failed', 'Insufficient balance.'))
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_command_catches_up_missed_occurrences(self):
+        ScheduledOperation.objects.create(
+            user=self.user, amount=Decimal('2.00'), transaction_type='credit', recurrence='daily',
+            first_run_at=timezone.now() - timedelta(days=2, minutes=1), run_at=timezone.now() - timedelta(days=2, minutes=1),
+        )
+        call_command('run_scheduled_operations', batch_size=1, stdout=io.StringIO())
+        self.assertEqual(self.balance(), Decimal('6.00'))
+        self.assertEqual(ScheduledOperation.objects.get().occurrences, 3)
+        if not connection.features.has_select_for_update_skip_locked:
+            with self.assertRaises(CommandError):
+                call_command('run_scheduled_operations', workers=2, stdout=io.StringIO())
+
+
+class ConcurrentSchedulerTests(TransactionTestCase):
+    """Workers racing for the same due rows: every occurrence is applied exactly once."""
+    workers = 4
+
+    def test_parallel_workers_never_double_apply(self):
+        caches[wallet_cache.CACHE_ALIAS].clear()
+        user_ids = [get_user_model().objects.create(username=f'user{index}').pk for index in range(4)]
+        due = timezone.now() - timedelta(minutes=1)
+        ScheduledOperation.objects.bulk_create([
+            ScheduledOperation(
+                user_id=user_ids[index % len(user_ids)], amount=Decimal('1.00'), transaction_type='credit',
+                first_run_at=due, run_at=due,
+            )
+            for index in range(60)
+        ])
+        totals, failures = [], []
+
+        def work():
+            try:
+                while True:
+                    try:
+                        applied, failed = run_due_batch(batch_size=5)
+                    except OperationalError as exc:
+                        # Without SKIP LOCKED (SQLite) racing claims fail on
+                        # the database lock instead; retry like a worker would.
+                        if connection.vendor == 'sqlite' and 'locked' in str(exc):
+                            time.sleep(0.005)
+                            continue
+                        raise
+                    if not applied and not failed:
+                        return
+                    totals.append(applied)
+            except Exception as exc:
+                failures.append(exc)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=work) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(failures, [])
+        self.assertEqual(sum(totals), 60)
+        self.assertEqual(Transaction.objects.count(), 60)
+        self.assertEqual(set(Wallet.objects.values_list('balance', flat=True)), {Decimal('15.00')})
+        self.assertFalse(ScheduledOperation.objects.exclude(status='done').exists())
+        self.assertEqual(list(reconcile_balances()), [])
+
+
+@skipUnless(settings.DATABASES['replica']['ENGINE'].endswith('sqlite3'), 'needs the separate SQLite replica database')
+@override_settings(SECURE_SSL_REDIRECT=False, WALLET_READ_REPLICAS=['replica'], WALLET_REPLICA_STICKY_SECONDS=5)
+class ReplicaRoutingTests(TransactionTestCase):
+    """The replica is a second database whose rows differ, so each response shows where it was read."""
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        caches[wallet_cache.CACHE_ALIAS].clear()
+        User = get_user_model()
+        self.alice, self.bob = User.objects.create(username='alice'), User.objects.create(username='bob')
+        for user in (self.alice, self.bob):
+            User.objects.using('replica').create(pk=user.pk, username=f'{user.username}-replica')
+            Transaction.objects.using('replica').create(
+                user_id=user.pk, amount=Decimal('1.00'), transaction_type=Transaction.CREDIT, description='replica',
+            )
+
+    def descriptions(self, user, path='/api/transactions/{}/'):
+        response = self.client.get(path.format(user.pk))
+        self.assertEqual(response.status_code, 200)
+        return [row['description'] for row in response.json()['results']]
+
+    def credit(self, user):
+        response = self.client.post(
+            '/api/wallet/update/',
+            {'user_id': user.pk, 'amount': '5.00', 'transaction_type': 'credit', 'description': 'primary'},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        # The write and the read of its result both used the primary.
+        self.assertEqual(response.json()['balance'], '5.00')
+
+    def test_list_endpoints_read_from_the_replica(self):
+        names = [user['username'] for user in self.client.get('/api/users/').json()['results']]
+        self.assertEqual(names, ['alice-replica', 'bob-replica'])
+        self.assertEqual(self.descriptions(self.alice), ['replica'])
+        with override_settings(WALLET_FAST_SERIALIZATION=False):
+            self.assertEqual(self.descriptions(self.bob, '/api/transactions/{}/?transaction_type=credit'), ['replica'])
+
+    def test_reads_after_a_write_stay_on_the_primary_for_the_window(self):
+        self.credit(self.alice)
+        self.assertEqual(self.descriptions(self.alice), ['primary'])
+        self.assertEqual(self.descriptions(self.alice, '/api/async/transactions/{}/'), ['primary'])
+        # Other users are not affected.
+        self.assertEqual(self.descriptions(self.bob), ['replica'])
+
+        with override_settings(WALLET_REPLICA_STICKY_SECONDS=0.05):
+            self.credit(self.bob)
+            self.assertEqual(self.descriptions(self.bob, '/api/transactions/{}/?page_size=5'), ['primary'])
+            time.sleep(0.1)
+            self.assertEqual(self.descriptions(self.bob, '/api/transactions/{}/?page_size=6'), ['replica'])
+
+    def test_everything_else_uses_the_primary(self):
+        self.assertEqual(db_router.db_for_read(Transaction), 'default')
+        with read_from_replica() as alias:
+            self.assertEqual(alias, 'replica')
+            user = get_user_model().objects.get(pk=self.alice.pk)
+            self.assertEqual((user.username, db_router.db_for_write(Transaction, instance=user)), ('alice-replica', 'default'))
+            with db_transaction.atomic(), read_from_replica() as nested:
+                self.assertEqual(nested, 'default')
+        with override_settings(WALLET_READ_REPLICAS=[]):
+            self.assertEqual(self.descriptions(self.alice), [])
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class BalanceAfterTests(TestCase):
+    def setUp(self):
+        caches[wallet_cache.CACHE_ALIAS].clear()
+        User = get_user_model()
+        self.alice = User.objects.create(username='alice')
+        self.bob = User.objects.create(username='bob')
+
+    def post(self, user, amount, transaction_type='credit'):
+        return self.client.post('/api/wallet/update/', {
+            'user_id': user.pk, 'amount': amount, 'transaction_type': transaction_type,
+        }, content_type='application/json')
+
+    def balances_after(self, user):
+        return [str(value) for value in Transaction.objects.filter(user=user).order_by('id').values_list('balance_after', flat=True)]
+
+    def test_every_write_path_records_the_balance(self):
+        self.post(self.alice, '10.00')
+        self.post(self.alice, '2.50', 'debit')
+        self.client.post('/api/wallet/bulk-update/', {'operations': [
+            {'user_id': self.alice.pk, 'amount': '1.00', 'transaction_type': 'credit'},
+            {'user_id': self.alice.pk, 'amount': '100.00', 'transaction_type': 'debit'},
+            {'user_id': self.alice.pk, 'amount': '0.50', 'transaction_type': 'debit'},
+        ]}, content_type='application/json')
+        self.client.post('/api/wallet/transfer/', {
+            'from_user_id': self.alice.pk, 'to_user_id': self.bob.pk, 'amount': '3.00',
+        }, content_type='application/json')
+        with override_settings(WALLET_LEDGER_MODE='outbox'):
+            self.post(self.bob, '1.25')
+        drain_batch()
+
+        self.assertEqual(self.balances_after(self.alice), ['10.00', '7.50', '8.50', '8.00', '5.00'])
+        self.assertEqual(self.balances_after(self.bob), ['3.00', '4.25'])
+        history = self.client.get(f'/api/transactions/{self.bob.pk}/').json()['results']
+        self.assertEqual([row['balance_after'] for row in history], ['4.25', '3.00'])
+
+    def test_wallet_and_ledger_row_share_the_stamp_taken_under_the_lock(self):
+        self.post(self.alice, '10.00')
+        self.post(self.alice, '2.50', 'debit')
+        Wallet.objects.create(user=self.bob, balance=Decimal('5.00'))
+        call_command('shard_wallet', self.bob.pk, 2, stdout=io.StringIO())
+        self.post(self.bob, '1.00', 'debit')
+        for user in (self.alice, self.bob):
+            newest = Transaction.objects.filter(user=user).latest('created_at', 'id')
+            self.assertEqual(Wallet.objects.get(user=user).updated_at, newest.created_at)
+
+        stamped = Wallet.objects.get(user=self.bob).updated_at
+        self.post(self.bob, '1.00')
+        # Sharded credits don't touch the wallet row.
+        self.assertEqual(Wallet.objects.get(user=self.bob).updated_at, stamped)
+
+    def test_sharded_credits_are_left_for_the_backfill(self):
+        self.post(self.alice, '5.00')
+        call_command('shard_wallet', self.alice.pk, 2, stdout=io.StringIO())
+        self.post(self.alice, '1.00')
+        self.post(self.alice, '2.00')
+        self.post(self.alice, '0.50', 'debit')
+        self.assertEqual(self.balances_after(self.alice), ['5.00', 'None', 'None', '7.50'])
+
+        # Rows from before the column existed, plus a checkpoint behind them.
+        self.post(self.bob, '4.00')
+        checkpoint_balances()
+        self.post(self.bob, '1.00', 'debit')
+        Transaction.objects.filter(user=self.bob).update(balance_after=None)
+
+        call_command('backfill_balance_after', batch_size=2, stdout=io.StringIO())
+        self.assertEqual(self.balances_after(self.alice), ['5.00', '6.00', '8.00', '7.50'])
+        self.assertEqual(self.balances_after(self.bob), ['4.00', '3.00'])
+        self.assertEqual(backfill_balance_after(), 0)
+
+    def test_balance_at_a_moment(self):
+        url = f'/api/transactions/{self.alice.pk}/balance/'
+        for amount, transaction_type, day in (('10.00', 'credit', 1), ('4.00', 'debit', 3), ('1.00', 'credit', 3)):
+            self.post(self.alice, amount, transaction_type)
+            Transaction.objects.filter(pk=Transaction.objects.latest('id').pk).update(
+                created_at=datetime(2024, 5, day, 12, tzinfo=dt_timezone.utc),
+            )
+
+        self.assertEqual(self.client.get(url, {'at': '2024-05-01'}).json()['balance'], '0.00')
+        self.assertEqual(self.client.get(url, {'at': '2024-05-02'}).json()['balance'], '10.00')
+        self.assertEqual(self.client.get(url, {'at': '2024-05-04'}).json()['balance'], '7.00')
+        self.assertEqual(self.client.get(url).json()['balance'], '7.00')
+        self.assertEqual(self.client.get(url, {'at': 'soon'}).status_code, 400)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(balance_at(self.alice.pk, datetime(2024, 5, 4, tzinfo=dt_timezone.utc)), Decimal('7.00'))
+        self.assertEqual(len(queries), 1)
+
+        # A row without balance_after falls back to the newest one that has it.
+        Transaction.objects.filter(user=self.alice, transaction_type='credit', amount=Decimal('1.00')).update(balance_after=None)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(balance_at(self.alice.pk, datetime(2024, 5, 4, tzinfo=dt_timezone.utc)), Decimal('7.00'))
+        self.assertEqual(len(queries), 3)
+        self.assertIsNone(balance_at(self.bob.pk, timezone.now()))
+
+
+class ConcurrentBalanceAfterTests(TransactionTestCase):
+    """Writers stamp created_at under the wallet lock, so balance_at(now) sees every committed write."""
+
+    def test_balance_at_now_matches_the_wallet_after_racing_writes(self):
+        user = get_user_model().objects.create(username='alice')
+        Wallet.objects.create(user=user)
+        held, released = threading.Event(), threading.Event()
+        conditional_update = services._conditional_update
+        failures = []
+
+        def slow_then_update(op, using):
+            if op.description == 'slow':
+                # Started first, but reaches the wallet row after the others commit.
+                held.set()
+                released.wait(5)
+            return conditional_update(op, using)
+
+        def write(amount, description=''):
+            try:
+                while True:
+                    try:
+                        apply_operation(WalletOperation(user.pk, Decimal(amount), 'credit', description))
+                        return
+                    except OperationalError as exc:
+                        if connection.vendor == 'sqlite' and 'locked' in str(exc):
+                            time.sleep(0.005)
+                            continue
+                        raise
+            except Exception as exc:
+                failures.append(exc)
+            finally:
+                connections.close_all()
+
+        with mock.patch('wallet.services._conditional_update', side_effect=slow_then_update):
+            slow = threading.Thread(target=write, args=('1.00', 'slow'))
+            slow.start()
+            self.assertTrue(held.wait(5))
+            others = [threading.Thread(target=write, args=('2.00',)) for _ in range(3)]
+            for thread in others:
+                thread.start()
+            for thread in others:
+                thread.join()
+            released.set()
+            slow.join()
+
+        self.assertEqual(failures, [])
+        balance = Wallet.objects.get(user=user).balance
+        self.assertEqual(balance, Decimal('7.00'))
+        self.assertEqual(balance_at(user.pk, timezone.now()), balance)
+        rows = Transaction.objects.filter(user=user)
+        self.assertEqual(
+            list(rows.order_by('created_at', 'id').values_list('id', flat=True)),
+            list(rows.order_by('id').values_list('id', flat=True)),
+        )
+        self.assertEqual(Wallet.objects.get(user=user).updated_at, rows.latest('created_at', 'id').created_at)
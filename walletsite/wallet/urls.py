@@ -1,6 +1,7 @@
 from django.urls import path
 from django.http import JsonResponse
-from .views import UserListAPIView, wallet_update, UserTransactionsAPIView
+from . import async_views
+from .views import UserListAPIView, wallet_detail, wallet_update, wallet_bulk_update, wallet_transfer, wallet_schedule, UserTransactionsAPIView, transactions_balance, transactions_export, transactions_summary
 
 def api_test(request):
     return JsonResponse({
@@ -8,8 +9,16 @@ def api_test(request):
         'message': 'Django Wallet API is running correctly',
         'endpoints': {
             'users': '/api/users/',
+            'wallet': '/api/wallet/<user_id>/',
             'wallet_update': '/api/wallet/update/',
+            'wallet_bulk_update': '/api/wallet/bulk-update/',
+            'wallet_transfer': '/api/wallet/transfer/',
+            'wallet_schedule': '/api/wallet/scheduled/',
             'transactions': '/api/transactions/<user_id>/',
+            'transactions_summary': '/api/transactions/<user_id>/summary/?period=day|month',
+            'transactions_balance': '/api/transactions/<user_id>/balance/?at=<ISO date or datetime>',
+            'transactions_export': '/api/transactions/export/',
+            'async': '/api/async/ (users/, wallet/update/, transactions/<user_id>/)',
             'swagger': '/swagger/',
             'docs': '/docs/'
         }
@@ -18,6 +27,16 @@ def api_test(request):
 urlpatterns = [
 	path('test/', api_test, name='api-test'),
 	path('users/', UserListAPIView.as_view(), name='users-list'),
+	path('wallet/<int:user_id>/', wallet_detail, name='wallet-detail'),
 	path('wallet/update/', wallet_update, name='wallet-update'),
+	path('wallet/bulk-update/', wallet_bulk_update, name='wallet-bulk-update'),
+	path('wallet/transfer/', wallet_transfer, name='wallet-transfer'),
+	path('wallet/scheduled/', wallet_schedule, name='wallet-schedule'),
 	path('transactions/<int:user_id>/', UserTransactionsAPIView.as_view(), name='user-transactions'),
+	path('transactions/<int:user_id>/summary/', transactions_summary, name='transactions-summary'),
+	path('transactions/<int:user_id>/balance/', transactions_balance, name='transactions-balance'),
+	path('transactions/export/', transactions_export, name='transactions-export'),
+	path('async/users/', async_views.user_list, name='async-users-list'),
+	path('async/wallet/update/', async_views.wallet_update, name='async-wallet-update'),
+	path('async/transactions/<int:user_id>/', async_views.user_transactions, name='async-user-transactions'),
 ]
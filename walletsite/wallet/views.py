@@ -1,18 +1,78 @@
-from decimal import Decimal, InvalidOperation
+from itertools import islice
+
 from django.contrib.auth import get_user_model
-from django.db import transaction as db_transaction
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.views.decorators.http import require_GET
 from rest_framework import generics, status
 from rest_framework.decorators import api_view
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
-from .models import Wallet, Transaction
-from .serializers import UserSerializer, WalletSerializer, TransactionSerializer
+from . import cache as wallet_cache, fastjson, partitions
+from .archive import archived_until, iter_user_rows
+from .export import CONTENT_TYPES, ExportError, export_rows, iter_export, parse_bound, parse_user_ids
+from .fastjson import FastJSONRenderer
+from .filters import filter_transactions, has_transaction_filters
+from .idempotency import IDEMPOTENCY_HEADER, idempotent
+from .ledger import ZERO, balance_at
+from .models import LedgerOutbox, Wallet, Transaction
+from .pagination import IdCursorPagination, TransactionCursorPagination
+from .rollups import PERIODS, summarize
+from .routing import read_from_replica
+from .scheduling import RECURRENCES, parse_schedule
+from .services import (
+    WalletOperationError, apply_operation, apply_operations, apply_transfer, parse_operation, parse_transfer,
+)
+from .shards import wallet_with_total_balance
+from .serializers import ScheduledOperationSerializer, UserSerializer, WalletSerializer, TransactionSerializer
+
+
+def parse_user_fields(raw):
+    """Fields requested through ?fields=, or None for the full representation."""
+    if not raw:
+        return None
+    fields = [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = sorted(set(fields) - set(UserSerializer.Meta.fields))
+    if unknown or not fields:
+        raise ValidationError({'fields': f'Unknown fields: {", ".join(unknown)}' if unknown else 'No fields given.'})
+    return fields
+
+
+def user_list_queryset(fields=None):
+    queryset = get_user_model().objects.all().order_by('id')
+    if fields is not None:
+        # Keyset pagination needs the id even when it is not rendered.
+        queryset = queryset.only('id', *fields)
+    return queryset
 
 
 @swagger_auto_schema(
-    operation_description="Get all users in the system",
+    operation_description="Get users in the system, one cursor page at a time",
+    manual_parameters=[
+        openapi.Parameter(
+            'cursor',
+            openapi.IN_QUERY,
+            description="Opaque cursor taken from the `next` link of the previous page",
+            type=openapi.TYPE_STRING,
+        ),
+        openapi.Parameter(
+            'page_size',
+            openapi.IN_QUERY,
+            description="Number of users per page (capped by WALLET_MAX_PAGE_SIZE)",
+            type=openapi.TYPE_INTEGER,
+        ),
+        openapi.Parameter(
+            'fields',
+            openapi.IN_QUERY,
+            description="Comma-separated subset of " + ", ".join(UserSerializer.Meta.fields),
+            type=openapi.TYPE_STRING,
+        ),
+    ],
     responses={
         200: UserSerializer(many=True),
         400: 'Bad Request',
@@ -20,13 +80,53 @@ from .serializers import UserSerializer, WalletSerializer, TransactionSerializer
     }
 )
 class UserListAPIView(generics.ListAPIView):
-    queryset = get_user_model().objects.all().order_by('id')
     serializer_class = UserSerializer
+    pagination_class = IdCursorPagination
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def get_fields(self):
+        if getattr(self, 'swagger_fake_view', False):
+            return None
+        return parse_user_fields(self.request.query_params.get('fields'))
+
+    def get_queryset(self):
+        return user_list_queryset(self.get_fields())
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.get_fields())
+        return super().get_serializer(*args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        with read_from_replica():
+            if not fastjson.enabled():
+                return super().list(request, *args, **kwargs)
+            requested = self.get_fields()
+            fields = [name for name in UserSerializer.Meta.fields if requested is None or name in requested]
+            queryset = get_user_model().objects.order_by('id').values_list(*fastjson.user_columns(fields), named=True)
+            return self.get_paginated_response(fastjson.user_rows(self.paginate_queryset(queryset), fields))
+
+
+IDEMPOTENCY_KEY_PARAMETER = openapi.Parameter(
+    IDEMPOTENCY_HEADER,
+    openapi.IN_HEADER,
+    description="Optional client-chosen key; retries with the same key replay the first response instead of applying the operation again",
+    type=openapi.TYPE_STRING,
+)
 
 
 @swagger_auto_schema(
     method='post',
     operation_description="Update wallet balance by crediting or debiting money",
+    manual_parameters=[
+        IDEMPOTENCY_KEY_PARAMETER,
+        openapi.Parameter(
+            'response',
+            openapi.IN_QUERY,
+            description="`compact` returns only {balance, transaction_id} and skips the wallet read",
+            type=openapi.TYPE_STRING,
+            enum=['full', 'compact'],
+        ),
+    ],
     request_body=openapi.Schema(
         type=openapi.TYPE_OBJECT,
         required=['user_id', 'amount', 'transaction_type'],
@@ -45,52 +145,202 @@ class UserListAPIView(generics.ListAPIView):
 )
 @api_view(['POST'])
 def wallet_update(request):
-    user_id = request.data.get('user_id')
-    amount = request.data.get('amount')
-    transaction_type = request.data.get('transaction_type')  # 'credit' or 'debit'
-    description = request.data.get('description', '')
+    return idempotent(request, lambda: _wallet_update(request))
 
-    if user_id is None or amount is None or transaction_type not in [Transaction.CREDIT, Transaction.DEBIT]:
-        return Response({'detail': 'user_id, amount and valid transaction_type are required.'}, status=status.HTTP_400_BAD_REQUEST)
 
+def _wallet_update(request):
     try:
-        amount = Decimal(str(amount))
-    except (InvalidOperation, TypeError, ValueError):
-        return Response({'detail': 'amount must be a valid decimal.'}, status=status.HTTP_400_BAD_REQUEST)
+        wallet_id, balance, entry = apply_operation(parse_operation(request.data))
+    except WalletOperationError as exc:
+        return Response({'detail': exc.detail}, status=exc.status_code)
 
-    if amount <= 0:
-        return Response({'detail': 'amount must be greater than zero.'}, status=status.HTTP_400_BAD_REQUEST)
+    if request.query_params.get('response') == 'compact':
+        # Everything needed is already in hand from the UPDATE ... RETURNING
+        # and the INSERT, so skip the wallet/user read and the serializers.
+        if isinstance(entry, LedgerOutbox):
+            # Outbox mode: the Transaction row is created later by the drainer.
+            body = {'balance': str(balance), 'transaction_id': None, 'outbox_id': entry.pk}
+        else:
+            body = {'balance': str(balance), 'transaction_id': entry.pk}
+        return Response(body, status=status.HTTP_200_OK)
 
-    user_model = get_user_model()
-    try:
-        user = user_model.objects.get(pk=user_id)
-    except user_model.DoesNotExist:
-        return Response({'detail': 'User not found.'}, status=status.HTTP_404_NOT_FOUND)
+    wallet = Wallet.objects.select_related('user').get(pk=wallet_id)
+    if wallet.shard_count:
+        # A sharded credit only knows an approximate total; report the current one.
+        wallet = wallet_with_total_balance(Wallet.objects.select_related('user').filter(pk=wallet_id))
+    else:
+        # The balance this operation produced, not whatever a later write left behind.
+        wallet.balance, wallet.updated_at = balance, entry.created_at
+    return Response(WalletSerializer(wallet).data, status=status.HTTP_200_OK)
 
-    with db_transaction.atomic():
-        wallet, _ = Wallet.objects.select_for_update().get_or_create(user=user)
 
-        if transaction_type == Transaction.DEBIT and wallet.balance < amount:
-            return Response({'detail': 'Insufficient balance.'}, status=status.HTTP_400_BAD_REQUEST)
+BULK_UPDATE_MAX_OPERATIONS = 10000
 
-        if transaction_type == Transaction.CREDIT:
-            wallet.balance += amount
-        else:
-            wallet.balance -= amount
-        wallet.save()
-
-        Transaction.objects.create(
-            user=user,
-            amount=amount,
-            transaction_type=transaction_type,
-            description=description,
+
+@swagger_auto_schema(
+    method='post',
+    operation_description="Apply many credits/debits in one request. Each operation succeeds or fails on its own.",
+    manual_parameters=[IDEMPOTENCY_KEY_PARAMETER],
+    request_body=openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        required=['operations'],
+        properties={
+            'operations': openapi.Schema(
+                type=openapi.TYPE_ARRAY,
+                description=f'Up to {BULK_UPDATE_MAX_OPERATIONS} operations, applied in order',
+                items=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    required=['user_id', 'amount', 'transaction_type'],
+                    properties={
+                        'user_id': openapi.Schema(type=openapi.TYPE_INTEGER, description='User ID'),
+                        'amount': openapi.Schema(type=openapi.TYPE_STRING, description='Amount to credit/debit'),
+                        'transaction_type': openapi.Schema(type=openapi.TYPE_STRING, enum=['credit', 'debit'], description='Type of transaction'),
+                        'description': openapi.Schema(type=openapi.TYPE_STRING, description='Transaction description'),
+                    }
+                ),
+            ),
+        }
+    ),
+    responses={
+        200: 'Per-operation results',
+        400: 'Bad Request - operations missing, empty or too many'
+    }
+)
+@api_view(['POST'])
+def wallet_bulk_update(request):
+    return idempotent(request, lambda: _wallet_bulk_update(request))
+
+
+def _wallet_bulk_update(request):
+    raw_operations = request.data.get('operations')
+    if not isinstance(raw_operations, list) or not raw_operations:
+        return Response({'detail': 'operations must be a non-empty list.'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(raw_operations) > BULK_UPDATE_MAX_OPERATIONS:
+        return Response(
+            {'detail': f'At most {BULK_UPDATE_MAX_OPERATIONS} operations are allowed per request.'},
+            status=status.HTTP_400_BAD_REQUEST,
         )
 
-    return Response(WalletSerializer(wallet).data, status=status.HTTP_200_OK)
+    results = [None] * len(raw_operations)
+    operations = []
+    positions = []
+    for index, raw in enumerate(raw_operations):
+        try:
+            if not isinstance(raw, dict):
+                raise WalletOperationError('Each operation must be an object.')
+            operations.append(parse_operation(raw))
+            positions.append(index)
+        except WalletOperationError as exc:
+            results[index] = exc
+
+    if operations:
+        for index, outcome in zip(positions, apply_operations(operations)):
+            results[index] = outcome
+
+    payload = []
+    for index, outcome in enumerate(results):
+        if isinstance(outcome, WalletOperationError):
+            payload.append({'index': index, 'status': 'error', 'code': outcome.status_code, 'detail': outcome.detail})
+        else:
+            payload.append({'index': index, 'status': 'ok', 'balance': str(outcome)})
+
+    succeeded = sum(1 for item in payload if item['status'] == 'ok')
+    return Response({
+        'succeeded': succeeded,
+        'failed': len(payload) - succeeded,
+        'results': payload,
+    }, status=status.HTTP_200_OK)
+
+
+@swagger_auto_schema(
+    method='post',
+    operation_description="Move money from one user's wallet to another's in one atomic step",
+    manual_parameters=[IDEMPOTENCY_KEY_PARAMETER],
+    request_body=openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        required=['from_user_id', 'to_user_id', 'amount'],
+        properties={
+            'from_user_id': openapi.Schema(type=openapi.TYPE_INTEGER, description='User ID to debit'),
+            'to_user_id': openapi.Schema(type=openapi.TYPE_INTEGER, description='User ID to credit'),
+            'amount': openapi.Schema(type=openapi.TYPE_STRING, description='Amount to move'),
+            'description': openapi.Schema(type=openapi.TYPE_STRING, description='Description stored on both ledger rows'),
+        }
+    ),
+    responses={
+        200: 'Transfer id, both new balances and both ledger row ids',
+        400: 'Bad Request - Invalid data or insufficient balance',
+        404: 'User not found'
+    }
+)
+@api_view(['POST'])
+def wallet_transfer(request):
+    return idempotent(request, lambda: _wallet_transfer(request))
+
+
+def _wallet_transfer(request):
+    try:
+        transfer_id, from_balance, to_balance, entries = apply_transfer(parse_transfer(request.data))
+    except WalletOperationError as exc:
+        return Response({'detail': exc.detail}, status=exc.status_code)
+
+    debit, credit = entries
+    body = {
+        'transfer_id': str(transfer_id),
+        'from_user_id': debit.user_id,
+        'to_user_id': credit.user_id,
+        'amount': str(debit.amount),
+        'from_balance': str(from_balance),
+        'to_balance': str(to_balance),
+    }
+    if isinstance(debit, LedgerOutbox):
+        # Outbox mode: the Transaction rows are created later by the drainer.
+        body.update(debit_transaction_id=None, credit_transaction_id=None, outbox_ids=[debit.pk, credit.pk])
+    else:
+        body.update(debit_transaction_id=debit.pk, credit_transaction_id=credit.pk)
+    return Response(body, status=status.HTTP_200_OK)
 
 
 @swagger_auto_schema(
-    operation_description="Get all transactions for a specific user",
+    method='post',
+    operation_description="Schedule a credit or debit for later, once or on a recurrence; run_scheduled_operations applies it when due",
+    manual_parameters=[IDEMPOTENCY_KEY_PARAMETER],
+    request_body=openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        required=['user_id', 'amount', 'transaction_type'],
+        properties={
+            'user_id': openapi.Schema(type=openapi.TYPE_INTEGER, description='User ID'),
+            'amount': openapi.Schema(type=openapi.TYPE_STRING, description='Amount to credit/debit'),
+            'transaction_type': openapi.Schema(type=openapi.TYPE_STRING, enum=['credit', 'debit'], description='Type of transaction'),
+            'description': openapi.Schema(type=openapi.TYPE_STRING, description='Description stored on every ledger row'),
+            'run_at': openapi.Schema(type=openapi.TYPE_STRING, format=openapi.FORMAT_DATETIME, description='First run (default: now)'),
+            'recurrence': openapi.Schema(type=openapi.TYPE_STRING, enum=RECURRENCES, description='Default: once'),
+            'ends_at': openapi.Schema(type=openapi.TYPE_STRING, format=openapi.FORMAT_DATETIME, description='No occurrence after this time'),
+        }
+    ),
+    responses={
+        201: ScheduledOperationSerializer,
+        400: 'Bad Request - Invalid data',
+        404: 'User not found'
+    }
+)
+@api_view(['POST'])
+def wallet_schedule(request):
+    return idempotent(request, lambda: _wallet_schedule(request))
+
+
+def _wallet_schedule(request):
+    try:
+        schedule = parse_schedule(request.data)
+    except WalletOperationError as exc:
+        return Response({'detail': exc.detail}, status=exc.status_code)
+    if not get_user_model().objects.filter(pk=schedule.user_id).exists():
+        return Response({'detail': 'User not found.'}, status=status.HTTP_404_NOT_FOUND)
+    schedule.save()
+    return Response(ScheduledOperationSerializer(schedule).data, status=status.HTTP_201_CREATED)
+
+
+@swagger_auto_schema(
+    operation_description="Get transactions for a specific user, newest first, one cursor page at a time",
     manual_parameters=[
         openapi.Parameter(
             'user_id',
@@ -98,7 +348,62 @@ def wallet_update(request):
             description="User ID to get transactions for",
             type=openapi.TYPE_INTEGER,
             required=True
-        )
+        ),
+        openapi.Parameter(
+            'cursor',
+            openapi.IN_QUERY,
+            description="Opaque cursor taken from the `next` link of the previous page",
+            type=openapi.TYPE_STRING,
+        ),
+        openapi.Parameter(
+            'page_size',
+            openapi.IN_QUERY,
+            description="Number of transactions per page (capped by WALLET_MAX_PAGE_SIZE)",
+            type=openapi.TYPE_INTEGER,
+        ),
+        openapi.Parameter(
+            'transaction_type',
+            openapi.IN_QUERY,
+            description="Only credits or only debits",
+            type=openapi.TYPE_STRING,
+            enum=[Transaction.CREDIT, Transaction.DEBIT],
+        ),
+        openapi.Parameter(
+            'min_amount',
+            openapi.IN_QUERY,
+            description="Smallest amount to include",
+            type=openapi.TYPE_STRING,
+        ),
+        openapi.Parameter(
+            'max_amount',
+            openapi.IN_QUERY,
+            description="Largest amount to include",
+            type=openapi.TYPE_STRING,
+        ),
+        openapi.Parameter(
+            'start',
+            openapi.IN_QUERY,
+            description="Inclusive lower bound on created_at (ISO date or datetime)",
+            type=openapi.TYPE_STRING,
+        ),
+        openapi.Parameter(
+            'end',
+            openapi.IN_QUERY,
+            description="Exclusive upper bound on created_at (ISO date or datetime)",
+            type=openapi.TYPE_STRING,
+        ),
+        openapi.Parameter(
+            'description',
+            openapi.IN_QUERY,
+            description="Case-insensitive text the description must contain",
+            type=openapi.TYPE_STRING,
+        ),
+        openapi.Parameter(
+            'include_archived',
+            openapi.IN_QUERY,
+            description="Continue into archived months once the database rows run out (not combinable with filters)",
+            type=openapi.TYPE_BOOLEAN,
+        ),
     ],
     responses={
         200: TransactionSerializer(many=True),
@@ -108,7 +413,194 @@ def wallet_update(request):
 )
 class UserTransactionsAPIView(generics.ListAPIView):
     serializer_class = TransactionSerializer
+    pagination_class = TransactionCursorPagination
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
 
     def get_queryset(self):
         user_id = self.kwargs['user_id']
-        return Transaction.objects.filter(user_id=user_id).order_by('-created_at')
+        queryset = Transaction.objects.filter(user_id=user_id).order_by('-created_at')
+        if getattr(self, 'swagger_fake_view', False):
+            return queryset
+        return filter_transactions(queryset, self.request.query_params)
+
+    def include_archived(self):
+        params = self.request.query_params
+        if params.get('include_archived', '').lower() not in ('1', 'true', 'yes'):
+            return False
+        if has_transaction_filters(params):
+            raise ValidationError({'include_archived': 'Cannot be combined with filters.'})
+        return True
+
+    def paginate_queryset(self, queryset):
+        if fastjson.enabled():
+            queryset = queryset.values_list(*fastjson.TRANSACTION_COLUMNS, named=True)
+        if not self.include_archived():
+            return super().paginate_queryset(queryset)
+        # Archived months are older than every row left in the table, so a
+        # page that runs out of rows continues from the archive files.
+        paginator = self.paginator
+        rows = list(paginator.page_queryset(queryset, self.request))
+        missing = paginator.current_page_size + 1 - len(rows)
+        if missing > 0:
+            before = paginator.position_of(rows[-1]) if rows else paginator.decode_cursor(self.request)
+            rows.extend(islice(iter_user_rows(self.kwargs['user_id'], before), missing))
+        return paginator.finish_page(rows)
+
+    def serialize_page(self, rows):
+        if fastjson.enabled():
+            return fastjson.transaction_rows(rows)
+        return list(self.get_serializer(rows, many=True).data)
+
+    def list(self, request, *args, **kwargs):
+        paginator = self.paginator
+
+        def fetch_page():
+            with read_from_replica(self.kwargs['user_id']):
+                rows = self.paginate_queryset(self.get_queryset())
+            return {'results': self.serialize_page(rows), 'next_position': paginator.next_position}
+
+        if (
+            request.query_params.get(paginator.cursor_query_param)
+            or has_transaction_filters(request.query_params)
+            or self.include_archived()
+        ):
+            page = fetch_page()
+        else:
+            # The newest unfiltered page is served from the per-user read
+            # cache; deeper or filtered pages always go to the database.
+            page = wallet_cache.get_or_compute(
+                self.kwargs['user_id'], f'transactions:{paginator.get_page_size(request)}', fetch_page,
+            )
+            paginator.restore_page(request, page['next_position'])
+        return paginator.get_paginated_response(page['results'])
+
+
+@swagger_auto_schema(
+    method='get',
+    operation_description="Get the wallet (balance included) of a specific user",
+    responses={
+        200: WalletSerializer,
+        404: 'Wallet not found'
+    }
+)
+@api_view(['GET'])
+def wallet_detail(request, user_id):
+    def load():
+        wallet = wallet_with_total_balance(Wallet.objects.select_related('user').filter(user_id=user_id))
+        return dict(WalletSerializer(wallet).data) if wallet is not None else None
+
+    data = wallet_cache.get_or_compute(user_id, 'wallet', load)
+    if data is None:
+        return Response({'detail': 'Wallet not found.'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(data, status=status.HTTP_200_OK)
+
+
+def _parse_day(value, name):
+    if not value:
+        return None
+    day = parse_date(value)
+    if day is None:
+        raise ValidationError({name: 'Must be an ISO date (YYYY-MM-DD).'})
+    return day
+
+
+@swagger_auto_schema(
+    method='get',
+    operation_description="Credit and debit totals of a user per day or month, read from the daily rollups",
+    manual_parameters=[
+        openapi.Parameter(
+            'period',
+            openapi.IN_QUERY,
+            description="Bucket size",
+            type=openapi.TYPE_STRING,
+            enum=list(PERIODS),
+        ),
+        openapi.Parameter(
+            'start',
+            openapi.IN_QUERY,
+            description="First day to include (YYYY-MM-DD)",
+            type=openapi.TYPE_STRING,
+        ),
+        openapi.Parameter(
+            'end',
+            openapi.IN_QUERY,
+            description="Day to stop before (YYYY-MM-DD, exclusive)",
+            type=openapi.TYPE_STRING,
+        ),
+    ],
+    responses={
+        200: 'Totals per period, oldest first',
+        400: 'Bad Request - invalid period or dates'
+    }
+)
+@api_view(['GET'])
+def transactions_summary(request, user_id):
+    period = request.query_params.get('period', 'day')
+    if period not in PERIODS:
+        raise ValidationError({'period': f'Must be one of {", ".join(PERIODS)}.'})
+    start = _parse_day(request.query_params.get('start'), 'start')
+    end = _parse_day(request.query_params.get('end'), 'end')
+    return Response({
+        'user_id': user_id,
+        'period': period,
+        'results': summarize(user_id, period, start, end),
+    }, status=status.HTTP_200_OK)
+
+
+@swagger_auto_schema(
+    method='get',
+    operation_description="Balance of a user's wallet as of a moment, read from the balance_after of the last transaction before it",
+    manual_parameters=[
+        openapi.Parameter(
+            'at',
+            openapi.IN_QUERY,
+            description="ISO date or datetime (default: now); a bare date means midnight",
+            type=openapi.TYPE_STRING,
+        ),
+    ],
+    responses={
+        200: 'The balance as of `at`',
+        400: 'Bad Request - invalid or archived moment'
+    }
+)
+@api_view(['GET'])
+def transactions_balance(request, user_id):
+    try:
+        moment = parse_bound(request.query_params.get('at'), 'at') or timezone.now()
+    except ExportError as exc:
+        raise ValidationError({'at': str(exc)})
+    with read_from_replica(user_id):
+        balance = balance_at(user_id, moment)
+    if balance is None:
+        until = archived_until()
+        if until is not None and moment < partitions.month_bounds(until)[0]:
+            raise ValidationError({'at': 'Falls in an archived month; the database no longer holds that history.'})
+        balance = ZERO
+    return Response({
+        'user_id': user_id,
+        'at': moment,
+        'balance': str(balance),
+    }, status=status.HTTP_200_OK)
+
+
+@require_GET
+def transactions_export(request):
+    """
+    Stream transactions as CSV or JSONL.
+
+    Query parameters: format (csv|jsonl, default csv), user_id (repeatable or
+    comma-separated), start (inclusive) and end (exclusive) as ISO dates or
+    datetimes.
+    """
+    export_format = request.GET.get('format', 'csv')
+    try:
+        user_ids = parse_user_ids(request.GET.getlist('user_id'))
+        start = parse_bound(request.GET.get('start'), 'start')
+        end = parse_bound(request.GET.get('end'), 'end')
+        stream = iter_export(export_rows(user_ids, start, end), export_format)
+    except ExportError as exc:
+        return JsonResponse({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+    response = StreamingHttpResponse(stream, content_type=CONTENT_TYPES[export_format])
+    response['Content-Disposition'] = f'attachment; filename="transactions.{export_format}"'
+    return response